@@ -0,0 +1,330 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# This script benchmarks the bulk insertion into a COLMAP database against
+# inserting one row at a time on synthetic features, the vectorized pair id
+# conversions against the scalar ones, merging databases against copying
+# them row by row, and the size and throughput of the descriptor codecs.
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+from database import (
+    COLMAPDatabase,
+    blob_to_array,
+    image_ids_to_pair_id,
+    image_ids_to_pair_ids,
+    pair_id_to_image_ids,
+    pair_ids_to_image_ids,
+)
+from merge_databases import merge_databases
+from test_database import create_database, synthetic_features
+
+
+def benchmark(name, func, num_rows):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<40} {:>10.3f} s {:>12.0f} rows/s".format(
+            name, elapsed, num_rows / elapsed
+        )
+    )
+    return elapsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_images", type=int, default=1000)
+    parser.add_argument("--num_keypoints", type=int, default=2000)
+    parser.add_argument("--num_pairs", type=int, default=1000000)
+    parser.add_argument("--num_shards", type=int, default=4)
+    parser.add_argument(
+        "--descriptors_database_path",
+        help="database with real descriptors for the codec benchmark, "
+        "instead of synthetic SIFT-like descriptors",
+    )
+    parser.add_argument(
+        "--commit_every_row",
+        action="store_true",
+        help="commit after every row in the per-row reference",
+    )
+    args = parser.parse_args()
+    return args
+
+
+def benchmark_pair_ids(args):
+    rng = np.random.default_rng(0)
+    image_ids1 = rng.integers(1, 2 ** 31 - 1, size=args.num_pairs)
+    image_ids2 = rng.integers(1, 2 ** 31 - 1, size=args.num_pairs)
+    pair_ids = image_ids_to_pair_ids(image_ids1, image_ids2)
+    image_ids1_list = image_ids1.tolist()
+    image_ids2_list = image_ids2.tolist()
+    pair_ids_list = pair_ids.tolist()
+
+    benchmark(
+        "image_ids_to_pair_id (scalar)",
+        lambda: [
+            image_ids_to_pair_id(image_id1, image_id2)
+            for image_id1, image_id2 in zip(image_ids1_list, image_ids2_list)
+        ],
+        args.num_pairs,
+    )
+    benchmark(
+        "image_ids_to_pair_ids",
+        lambda: image_ids_to_pair_ids(image_ids1, image_ids2),
+        args.num_pairs,
+    )
+    benchmark(
+        "pair_id_to_image_ids (scalar)",
+        lambda: [pair_id_to_image_ids(pair_id) for pair_id in pair_ids_list],
+        args.num_pairs,
+    )
+    benchmark(
+        "pair_ids_to_image_ids",
+        lambda: pair_ids_to_image_ids(pair_ids),
+        args.num_pairs,
+    )
+
+
+def benchmark_inserts(args):
+    print("Generating synthetic features ...")
+    keypoints, descriptors, matches = synthetic_features(
+        num_images=args.num_images, num_keypoints=args.num_keypoints
+    )
+    # Only match each image with a few neighbors to bound the pairs.
+    matches = [match for match in matches if match[1] - match[0] <= 10]
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db = create_database(
+            os.path.join(tmpdir, "per_row.db"), num_images=args.num_images
+        )
+
+        def add_per_row(add, items):
+            for item in items:
+                add(*item)
+                if args.commit_every_row:
+                    db.commit()
+            db.commit()
+
+        benchmark(
+            "add_keypoints (per row)",
+            lambda: add_per_row(db.add_keypoints, keypoints.items()),
+            len(keypoints),
+        )
+        benchmark(
+            "add_descriptors (per row)",
+            lambda: add_per_row(db.add_descriptors, descriptors.items()),
+            len(descriptors),
+        )
+        benchmark(
+            "add_matches (per row)",
+            lambda: add_per_row(db.add_matches, matches),
+            len(matches),
+        )
+        benchmark(
+            "add_two_view_geometry (per row)",
+            lambda: add_per_row(db.add_two_view_geometry, matches),
+            len(matches),
+        )
+        db.close()
+
+        db = create_database(
+            os.path.join(tmpdir, "many.db"), num_images=args.num_images
+        )
+        benchmark(
+            "add_keypoints_many",
+            lambda: db.add_keypoints_many(keypoints.items()),
+            len(keypoints),
+        )
+        benchmark(
+            "add_descriptors_many",
+            lambda: db.add_descriptors_many(descriptors.items()),
+            len(descriptors),
+        )
+        benchmark(
+            "add_matches_many",
+            lambda: db.add_matches_many(matches),
+            len(matches),
+        )
+        benchmark(
+            "add_two_view_geometries_many",
+            lambda: db.add_two_view_geometries_many(matches),
+            len(matches),
+        )
+        db.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def merge_databases_per_row(database_paths, output_path):
+    db = COLMAPDatabase.connect(output_path)
+    db.create_tables()
+    for database_path in database_paths:
+        source_db = COLMAPDatabase.connect(database_path)
+        camera_ids = {}
+        for camera_id, model, width, height, params, prior in source_db.execute(
+            "SELECT * FROM cameras"
+        ):
+            camera_ids[camera_id] = db.add_camera(
+                model, width, height, blob_to_array(params, np.float64), prior
+            )
+        image_ids = {}
+        for image_id, name, camera_id in source_db.execute(
+            "SELECT * FROM images"
+        ):
+            if db.execute(
+                "SELECT 1 FROM images WHERE name=?", (name,)
+            ).fetchone():
+                continue
+            image_ids[image_id] = db.add_image(name, camera_ids[camera_id])
+            db.add_keypoints(
+                image_ids[image_id], source_db.read_keypoints(image_id)
+            )
+            db.add_descriptors(
+                image_ids[image_id], source_db.read_descriptors(image_id)
+            )
+        for image_id1, image_id2, matches in source_db.iter_matches():
+            if image_id1 in image_ids and image_id2 in image_ids:
+                db.add_matches(
+                    image_ids[image_id1], image_ids[image_id2], matches
+                )
+        source_db.close()
+        db.commit()
+    db.close()
+
+
+def benchmark_merge(args):
+    keypoints, descriptors, matches = synthetic_features(
+        num_images=args.num_images, num_keypoints=args.num_keypoints
+    )
+    matches = [match for match in matches if match[1] - match[0] <= 10]
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        database_paths = []
+        for shard in range(args.num_shards):
+            database_path = os.path.join(tmpdir, "shard{}.db".format(shard))
+            db = create_database(database_path, num_images=args.num_images)
+            db.execute(
+                "UPDATE images SET name = ? || name",
+                ("shard{}_".format(shard),),
+            )
+            db.add_keypoints_many(keypoints.items())
+            db.add_descriptors_many(descriptors.items())
+            db.add_matches_many(matches)
+            db.close()
+            database_paths.append(database_path)
+
+        num_rows = args.num_shards * (2 * len(keypoints) + len(matches))
+        benchmark(
+            "merge_databases (per row)",
+            lambda: merge_databases_per_row(
+                database_paths, os.path.join(tmpdir, "merged_per_row.db")
+            ),
+            num_rows,
+        )
+        benchmark(
+            "merge_databases",
+            lambda: merge_databases(
+                database_paths, os.path.join(tmpdir, "merged.db")
+            ),
+            num_rows,
+        )
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def benchmark_descriptor_codecs(args):
+    if args.descriptors_database_path is None:
+        # Synthetic descriptors with the skewed value distribution of SIFT.
+        rng = np.random.default_rng(0)
+        descriptors = {
+            image_id: np.minimum(
+                rng.exponential(20, size=(args.num_keypoints, 128)), 255
+            ).astype(np.uint8)
+            for image_id in range(1, args.num_images + 1)
+        }
+    else:
+        db = COLMAPDatabase.connect(args.descriptors_database_path)
+        descriptors = dict(
+            (image_id, np.array(image_descriptors))
+            for image_id, image_descriptors in db.iter_descriptors()
+        )
+        db.close()
+    num_bytes = sum(array.nbytes for array in descriptors.values())
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for codec in [None, "zlib", "lzma"]:
+            db = create_database(
+                os.path.join(tmpdir, "{}.db".format(codec)),
+                num_images=max(descriptors),
+            )
+            db.set_descriptor_codec(codec)
+            benchmark(
+                "add_descriptors_many ({})".format(codec),
+                lambda: db.add_descriptors_many(descriptors.items()),
+                len(descriptors),
+            )
+            elapsed = benchmark(
+                "iter_descriptors ({})".format(codec),
+                lambda: list(db.iter_descriptors()),
+                len(descriptors),
+            )
+            blob_bytes = db.stats().tables["descriptors"].blob_bytes
+            print(
+                "{:<40} {:>10.1f} MB {:>10.2f}x {:>10.1f} MB/s decoded".format(
+                    "descriptors ({})".format(codec),
+                    blob_bytes / 2 ** 20,
+                    num_bytes / blob_bytes,
+                    num_bytes / 2 ** 20 / elapsed,
+                )
+            )
+            db.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    args = parse_args()
+    benchmark_pair_ids(args)
+    benchmark_inserts(args)
+    benchmark_merge(args)
+    benchmark_descriptor_codecs(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# This script benchmarks reading the features of images from a feature store
+# against querying them from the database one image at a time.
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+from database import COLMAPDatabase
+from feature_store import FeatureStore, export_feature_store
+from test_database import create_database, synthetic_features
+
+
+def benchmark(name, func, num_images, num_repeats):
+    elapsed = float("inf")
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(
+        "{:<40} {:>10.3f} s {:>12.0f} images/s".format(
+            name, elapsed, num_images / elapsed
+        )
+    )
+    return elapsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_images", type=int, default=1000)
+    parser.add_argument("--num_keypoints", type=int, default=2000)
+    parser.add_argument("--num_repeats", type=int, default=3)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+
+    print("Generating synthetic features ...")
+    keypoints, descriptors, _ = synthetic_features(
+        num_images=args.num_images, num_keypoints=args.num_keypoints
+    )
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        database_path = os.path.join(tmpdir, "database.db")
+        store_path = os.path.join(tmpdir, "features")
+        db = create_database(database_path, num_images=args.num_images)
+        db.add_keypoints_many(keypoints.items())
+        db.add_descriptors_many(descriptors.items())
+        db.close()
+
+        benchmark(
+            "export_feature_store",
+            lambda: export_feature_store(database_path, store_path),
+            args.num_images,
+            1,
+        )
+
+        # Access the images in random order, as a matcher would.
+        image_ids = np.random.default_rng(0).permutation(list(keypoints))
+        image_ids = image_ids.tolist()
+
+        db = COLMAPDatabase.connect(database_path)
+
+        def read_select_per_image():
+            for image_id in image_ids:
+                np.array(db.read_keypoints(image_id))
+                np.array(db.read_descriptors(image_id))
+
+        benchmark(
+            "SELECT per image",
+            read_select_per_image,
+            args.num_images,
+            args.num_repeats,
+        )
+        db.close()
+
+        store = FeatureStore(store_path)
+
+        def read_feature_store():
+            for image_id in image_ids:
+                np.array(store.read_keypoints(image_id))
+                np.array(store.read_descriptors(image_id))
+
+        benchmark(
+            "FeatureStore",
+            read_feature_store,
+            args.num_images,
+            args.num_repeats,
+        )
+        del store
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
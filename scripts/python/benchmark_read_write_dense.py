@@ -0,0 +1,163 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# This script benchmarks the size and the read throughput of a dense map
+# archive against the original depth and normal maps of a workspace.
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+from dense_map_archive import DenseArchive, pack_dense_workspace
+from read_write_dense import DenseWorkspace, read_array, write_array
+
+
+def benchmark(name, func, num_bytes, num_repeats, total_bytes):
+    elapsed = float("inf")
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(
+        "{:<40} {:>8.2f}x {:>10.3f} s {:>10.1f} MB/s".format(
+            name, total_bytes / num_bytes, elapsed, total_bytes / elapsed / 1e6
+        )
+    )
+    return elapsed
+
+
+def synthetic_maps(width, height, rng):
+    # Smooth depths of a slanted plane with bumps and holes of invalid pixels.
+    y, x = np.mgrid[:height, :width].astype(np.float32)
+    depth_map = 5 + 2 * x / width + y / height
+    depth_map += 0.1 * np.sin(x / 17) * np.cos(y / 23)
+    depth_map += rng.normal(0, 0.002, depth_map.shape).astype(np.float32)
+    depth_map[
+        rng.random((height // 8, width // 8)).repeat(8, 0).repeat(8, 1) < 0.2
+    ] = 0
+    normal_map = np.stack(
+        list(np.gradient(depth_map)) + [-np.ones_like(depth_map)], axis=-1
+    )
+    normal_map /= np.linalg.norm(normal_map, axis=-1, keepdims=True)
+    normal_map[depth_map == 0] = 0
+    return depth_map, normal_map.astype(np.float32)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workspace_path",
+        help="dense workspace to benchmark, by default synthetic maps",
+    )
+    parser.add_argument("--num_images", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=1200)
+    parser.add_argument("--tile_size", type=int, default=256)
+    parser.add_argument("--max_depth_error", type=float, default=0.001)
+    parser.add_argument("--num_repeats", type=int, default=3)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        workspace_path = args.workspace_path
+        if workspace_path is None:
+            print("Generating synthetic maps ...")
+            workspace_path = tmpdir
+            workspace = DenseWorkspace(workspace_path)
+            rng = np.random.default_rng(0)
+            for i in range(args.num_images):
+                for map_type, array in zip(
+                    ["depth", "normal"],
+                    synthetic_maps(args.width, args.height, rng),
+                ):
+                    path = workspace.map_path("{}.jpg".format(i), map_type)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    write_array(array, path)
+
+        workspace = DenseWorkspace(workspace_path)
+        paths = [
+            workspace.map_path(image_name, map_type)
+            for map_type in ["depth", "normal"]
+            for image_name in workspace.image_names(map_type)
+        ]
+        total_bytes = sum(os.path.getsize(path) for path in paths)
+
+        def read_files():
+            for path in paths:
+                read_array(path)
+
+        benchmark(
+            "read_array", read_files, total_bytes, args.num_repeats, total_bytes
+        )
+
+        archive_path = os.path.join(tmpdir, "maps.bin")
+        for codec in ["none", "zlib", "lzma"]:
+            for depth_encoding, normal_encoding in [
+                ("float32", "float32"),
+                ("float16", "float16"),
+                ("quantized", "float16"),
+            ]:
+                pack_dense_workspace(
+                    workspace_path,
+                    archive_path,
+                    tile_size=args.tile_size,
+                    codec=codec,
+                    depth_encoding=depth_encoding,
+                    normal_encoding=normal_encoding,
+                    max_depth_error=args.max_depth_error,
+                )
+                archive = DenseArchive(archive_path)
+
+                def read_archive():
+                    for name in archive.names():
+                        archive.read_array(name)
+
+                benchmark(
+                    "{} {}/{}".format(codec, depth_encoding, normal_encoding),
+                    read_archive,
+                    os.path.getsize(archive_path),
+                    args.num_repeats,
+                    total_bytes,
+                )
+                del archive
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
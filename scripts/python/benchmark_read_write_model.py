@@ -0,0 +1,455 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# This script benchmarks reading and writing of COLMAP models against the
+# original per-record implementations on a synthetic model.
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+from read_write_model import (
+    Image,
+    Point3D,
+    read_next_bytes,
+    read_images_binary,
+    write_images_binary,
+    read_points3D_binary,
+    write_points3D_binary,
+    read_points3D_binary_arrays,
+    read_images_text,
+    write_images_text,
+    read_points3D_text,
+    write_points3D_text,
+    write_cameras_binary,
+    read_model_arrays,
+)
+from test_read_write_model import (
+    synthetic_model,
+    write_cameras_binary_per_record,
+    write_images_binary_per_record,
+    write_points3D_binary_per_record,
+)
+
+
+def read_images_binary_per_record(path_to_model_file):
+    images = {}
+    with open(path_to_model_file, "rb") as fid:
+        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
+        for _ in range(num_reg_images):
+            binary_image_properties = read_next_bytes(
+                fid, num_bytes=64, format_char_sequence="idddddddi"
+            )
+            image_id = binary_image_properties[0]
+            binary_image_name = b""
+            current_char = read_next_bytes(fid, 1, "c")[0]
+            while current_char != b"\x00":
+                binary_image_name += current_char
+                current_char = read_next_bytes(fid, 1, "c")[0]
+            num_points2D = read_next_bytes(
+                fid, num_bytes=8, format_char_sequence="Q"
+            )[0]
+            x_y_id_s = read_next_bytes(
+                fid,
+                num_bytes=24 * num_points2D,
+                format_char_sequence="ddq" * num_points2D,
+            )
+            images[image_id] = Image(
+                id=image_id,
+                qvec=np.array(binary_image_properties[1:5]),
+                tvec=np.array(binary_image_properties[5:8]),
+                camera_id=binary_image_properties[8],
+                name=binary_image_name.decode("utf-8"),
+                xys=np.column_stack(
+                    [
+                        tuple(map(float, x_y_id_s[0::3])),
+                        tuple(map(float, x_y_id_s[1::3])),
+                    ]
+                ),
+                point3D_ids=np.array(tuple(map(int, x_y_id_s[2::3]))),
+            )
+    return images
+
+
+def read_points3D_binary_per_record(path_to_model_file):
+    points3D = {}
+    with open(path_to_model_file, "rb") as fid:
+        num_points = read_next_bytes(fid, 8, "Q")[0]
+        for _ in range(num_points):
+            binary_point_line_properties = read_next_bytes(
+                fid, num_bytes=43, format_char_sequence="QdddBBBd"
+            )
+            point3D_id = binary_point_line_properties[0]
+            track_length = read_next_bytes(
+                fid, num_bytes=8, format_char_sequence="Q"
+            )[0]
+            track_elems = read_next_bytes(
+                fid,
+                num_bytes=8 * track_length,
+                format_char_sequence="ii" * track_length,
+            )
+            points3D[point3D_id] = Point3D(
+                id=point3D_id,
+                xyz=np.array(binary_point_line_properties[1:4]),
+                rgb=np.array(binary_point_line_properties[4:7]),
+                error=np.array(binary_point_line_properties[7]),
+                image_ids=np.array(tuple(map(int, track_elems[0::2]))),
+                point2D_idxs=np.array(tuple(map(int, track_elems[1::2]))),
+            )
+    return points3D
+
+
+def read_images_text_per_line(path):
+    images = {}
+    with open(path, "r") as fid:
+        while True:
+            line = fid.readline()
+            if not line:
+                break
+            line = line.strip()
+            if len(line) > 0 and line[0] != "#":
+                elems = line.split()
+                image_id = int(elems[0])
+                qvec = np.array(tuple(map(float, elems[1:5])))
+                tvec = np.array(tuple(map(float, elems[5:8])))
+                camera_id = int(elems[8])
+                image_name = elems[9]
+                elems = fid.readline().split()
+                xys = np.column_stack(
+                    [
+                        tuple(map(float, elems[0::3])),
+                        tuple(map(float, elems[1::3])),
+                    ]
+                )
+                point3D_ids = np.array(tuple(map(int, elems[2::3])))
+                images[image_id] = Image(
+                    id=image_id,
+                    qvec=qvec,
+                    tvec=tvec,
+                    camera_id=camera_id,
+                    name=image_name,
+                    xys=xys,
+                    point3D_ids=point3D_ids,
+                )
+    return images
+
+
+def read_points3D_text_per_line(path):
+    points3D = {}
+    with open(path, "r") as fid:
+        while True:
+            line = fid.readline()
+            if not line:
+                break
+            line = line.strip()
+            if len(line) > 0 and line[0] != "#":
+                elems = line.split()
+                point3D_id = int(elems[0])
+                points3D[point3D_id] = Point3D(
+                    id=point3D_id,
+                    xyz=np.array(tuple(map(float, elems[1:4]))),
+                    rgb=np.array(tuple(map(int, elems[4:7]))),
+                    error=float(elems[7]),
+                    image_ids=np.array(tuple(map(int, elems[8::2]))),
+                    point2D_idxs=np.array(tuple(map(int, elems[9::2]))),
+                )
+    return points3D
+
+
+def write_images_text_per_line(images, path):
+    with open(path, "w") as fid:
+        for _, img in images.items():
+            image_header = [
+                img.id,
+                *img.qvec,
+                *img.tvec,
+                img.camera_id,
+                img.name,
+            ]
+            fid.write(" ".join(map(str, image_header)) + "\n")
+            points_strings = []
+            for xy, point3D_id in zip(img.xys, img.point3D_ids):
+                points_strings.append(" ".join(map(str, [*xy, point3D_id])))
+            fid.write(" ".join(points_strings) + "\n")
+
+
+def write_points3D_text_per_line(points3D, path):
+    with open(path, "w") as fid:
+        for _, pt in points3D.items():
+            point_header = [pt.id, *pt.xyz, *pt.rgb, pt.error]
+            fid.write(" ".join(map(str, point_header)) + " ")
+            track_strings = []
+            for image_id, point2D in zip(pt.image_ids, pt.point2D_idxs):
+                track_strings.append(" ".join(map(str, [image_id, point2D])))
+            fid.write(" ".join(track_strings) + "\n")
+
+
+def benchmark(name, func, num_bytes, num_repeats):
+    elapsed = float("inf")
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(
+        "{:<40} {:>10.3f} s {:>10.1f} MB/s".format(
+            name, elapsed, num_bytes / elapsed / 1e6
+        )
+    )
+    return elapsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_cameras", type=int, default=1000)
+    parser.add_argument("--num_images", type=int, default=2000)
+    parser.add_argument("--num_points2D", type=int, default=2000)
+    parser.add_argument("--num_points3D", type=int, default=200000)
+    parser.add_argument("--num_repeats", type=int, default=3)
+    parser.add_argument(
+        "--skip_reference",
+        action="store_true",
+        help="skip the slow per-record reference implementations",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 3],
+        help="numbers of threads for the read_model_arrays benchmark",
+    )
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+
+    print("Generating synthetic model ...")
+    cameras, images, points3D = synthetic_model(
+        num_cameras=args.num_cameras,
+        num_images=args.num_images,
+        num_points2D=args.num_points2D,
+        num_points3D=args.num_points3D,
+    )
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        cameras_path = os.path.join(tmpdir, "cameras.bin")
+        write_cameras_binary(cameras, cameras_path)
+        cameras_bytes = os.path.getsize(cameras_path)
+
+        print(
+            "cameras.bin: {} cameras, {:.1f} MB".format(
+                len(cameras), cameras_bytes / 1e6
+            )
+        )
+        if not args.skip_reference:
+            benchmark(
+                "write_cameras_binary (per record)",
+                lambda: write_cameras_binary_per_record(cameras, cameras_path),
+                cameras_bytes,
+                args.num_repeats,
+            )
+        benchmark(
+            "write_cameras_binary",
+            lambda: write_cameras_binary(cameras, cameras_path),
+            cameras_bytes,
+            args.num_repeats,
+        )
+
+        images_path = os.path.join(tmpdir, "images.bin")
+        write_images_binary(images, images_path)
+        images_bytes = os.path.getsize(images_path)
+
+        print(
+            "images.bin: {} images, {} observations, {:.1f} MB".format(
+                args.num_images,
+                args.num_images * args.num_points2D,
+                images_bytes / 1e6,
+            )
+        )
+        if not args.skip_reference:
+            benchmark(
+                "read_images_binary (per record)",
+                lambda: read_images_binary_per_record(images_path),
+                images_bytes,
+                args.num_repeats,
+            )
+        benchmark(
+            "read_images_binary",
+            lambda: read_images_binary(images_path),
+            images_bytes,
+            args.num_repeats,
+        )
+        if not args.skip_reference:
+            benchmark(
+                "write_images_binary (per record)",
+                lambda: write_images_binary_per_record(images, images_path),
+                images_bytes,
+                args.num_repeats,
+            )
+        benchmark(
+            "write_images_binary",
+            lambda: write_images_binary(images, images_path),
+            images_bytes,
+            args.num_repeats,
+        )
+        benchmark(
+            "write_images_binary (atomic)",
+            lambda: write_images_binary(images, images_path, atomic=True),
+            images_bytes,
+            args.num_repeats,
+        )
+
+        points3D_path = os.path.join(tmpdir, "points3D.bin")
+        write_points3D_binary(points3D, points3D_path)
+        points3D_bytes = os.path.getsize(points3D_path)
+
+        print(
+            "points3D.bin: {} points, {} track elements, {:.1f} MB".format(
+                len(points3D),
+                sum(len(point3D.image_ids) for point3D in points3D.values()),
+                points3D_bytes / 1e6,
+            )
+        )
+        if not args.skip_reference:
+            benchmark(
+                "read_points3D_binary (per record)",
+                lambda: read_points3D_binary_per_record(points3D_path),
+                points3D_bytes,
+                args.num_repeats,
+            )
+        benchmark(
+            "read_points3D_binary",
+            lambda: read_points3D_binary(points3D_path),
+            points3D_bytes,
+            args.num_repeats,
+        )
+        benchmark(
+            "read_points3D_binary_arrays",
+            lambda: read_points3D_binary_arrays(points3D_path),
+            points3D_bytes,
+            args.num_repeats,
+        )
+        if not args.skip_reference:
+            benchmark(
+                "write_points3D_binary (per record)",
+                lambda: write_points3D_binary_per_record(
+                    points3D, points3D_path
+                ),
+                points3D_bytes,
+                args.num_repeats,
+            )
+        benchmark(
+            "write_points3D_binary",
+            lambda: write_points3D_binary(points3D, points3D_path),
+            points3D_bytes,
+            args.num_repeats,
+        )
+
+        model_bytes = images_bytes + points3D_bytes
+        for workers in args.workers:
+            benchmark(
+                "read_model_arrays (workers={})".format(workers),
+                lambda: read_model_arrays(tmpdir, ext=".bin", workers=workers),
+                model_bytes,
+                args.num_repeats,
+            )
+
+        images_path = os.path.join(tmpdir, "images.txt")
+        write_images_text(images, images_path)
+        images_bytes = os.path.getsize(images_path)
+        print("images.txt: {:.1f} MB".format(images_bytes / 1e6))
+        if not args.skip_reference:
+            benchmark(
+                "read_images_text (per line)",
+                lambda: read_images_text_per_line(images_path),
+                images_bytes,
+                args.num_repeats,
+            )
+        benchmark(
+            "read_images_text",
+            lambda: read_images_text(images_path),
+            images_bytes,
+            args.num_repeats,
+        )
+        if not args.skip_reference:
+            benchmark(
+                "write_images_text (per line)",
+                lambda: write_images_text_per_line(images, images_path),
+                images_bytes,
+                args.num_repeats,
+            )
+        benchmark(
+            "write_images_text",
+            lambda: write_images_text(images, images_path),
+            images_bytes,
+            args.num_repeats,
+        )
+
+        points3D_path = os.path.join(tmpdir, "points3D.txt")
+        write_points3D_text(points3D, points3D_path)
+        points3D_bytes = os.path.getsize(points3D_path)
+        print("points3D.txt: {:.1f} MB".format(points3D_bytes / 1e6))
+        if not args.skip_reference:
+            benchmark(
+                "read_points3D_text (per line)",
+                lambda: read_points3D_text_per_line(points3D_path),
+                points3D_bytes,
+                args.num_repeats,
+            )
+        benchmark(
+            "read_points3D_text",
+            lambda: read_points3D_text(points3D_path),
+            points3D_bytes,
+            args.num_repeats,
+        )
+        if not args.skip_reference:
+            benchmark(
+                "write_points3D_text (per line)",
+                lambda: write_points3D_text_per_line(points3D, points3D_path),
+                points3D_bytes,
+                args.num_repeats,
+            )
+        benchmark(
+            "write_points3D_text",
+            lambda: write_points3D_text(points3D, points3D_path),
+            points3D_bytes,
+            args.num_repeats,
+        )
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -31,7 +31,12 @@
 # This script is based on an original implementation by True Price.
 
 import sys
+import lzma
+import time
+import zlib
 import sqlite3
+import contextlib
+import collections
 import numpy as np
 
 
@@ -39,6 +44,21 @@ IS_PYTHON3 = sys.version_info[0] >= 3
 
 MAX_IMAGE_ID = 2 ** 31 - 1
 
+# Number of rows fetched at once when iterating over a table. This bounds the
+# memory usage for tables with large blobs, such as the descriptors.
+FETCH_SIZE = 100
+
+TwoViewGeometry = collections.namedtuple(
+    "TwoViewGeometry", ["config", "matches", "F", "E", "H", "qvec", "tvec"]
+)
+TableStats = collections.namedtuple(
+    "TableStats", ["num_rows", "num_bytes", "blob_bytes"]
+)
+DatabaseStats = collections.namedtuple(
+    "DatabaseStats",
+    ["page_size", "num_pages", "num_free_pages", "tables", "indexes"],
+)
+
 CREATE_CAMERAS_TABLE = """CREATE TABLE IF NOT EXISTS cameras (
     camera_id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
     model INTEGER NOT NULL,
@@ -102,6 +122,33 @@ CREATE_NAME_INDEX = (
     "CREATE UNIQUE INDEX IF NOT EXISTS index_name ON images(name)"
 )
 
+# Optional indexes created by COLMAPDatabase.optimize. The rows indexes cover
+# the pair ids of the pairs with a minimum number of matches, as selected by
+# the exporters.
+OPTIONAL_INDEXES = {
+    "index_two_view_geometries_rows": "CREATE INDEX IF NOT EXISTS "
+    "index_two_view_geometries_rows ON two_view_geometries(rows, pair_id)",
+    "index_matches_rows": "CREATE INDEX IF NOT EXISTS "
+    "index_matches_rows ON matches(rows, pair_id)",
+    "index_images_camera_id": "CREATE INDEX IF NOT EXISTS "
+    "index_images_camera_id ON images(camera_id)",
+}
+
+# Key-value table of the settings of this module stored in a database, which
+# is only created if any setting is changed.
+CREATE_METADATA_TABLE = """CREATE TABLE IF NOT EXISTS database_metadata (
+    key TEXT PRIMARY KEY NOT NULL,
+    value TEXT)"""
+
+# Codecs to optionally compress the descriptor blobs, see
+# COLMAPDatabase.set_descriptor_codec.
+DESCRIPTOR_CODECS = {
+    "zlib": zlib.compress,
+    "lzma": lzma.compress,
+}
+
+LZMA_MAGIC = b"\xfd7zXZ\x00"
+
 CREATE_ALL = "; ".join(
     [
         CREATE_CAMERAS_TABLE,
@@ -124,22 +171,167 @@ def image_ids_to_pair_id(image_id1, image_id2):
 
 def pair_id_to_image_ids(pair_id):
     image_id2 = pair_id % MAX_IMAGE_ID
-    image_id1 = (pair_id - image_id2) / MAX_IMAGE_ID
+    image_id1 = (pair_id - image_id2) // MAX_IMAGE_ID
     return image_id1, image_id2
 
 
+def image_ids_to_pair_ids(image_ids1, image_ids2):
+    """Vectorized version of image_ids_to_pair_id.
+    :param image_ids1: Array of the first image ids.
+    :param image_ids2: Array of the second image ids.
+    :return: int64 array of pair ids, independent of the order of the images.
+    """
+    image_ids1 = np.asarray(image_ids1, dtype=np.int64)
+    image_ids2 = np.asarray(image_ids2, dtype=np.int64)
+    return np.minimum(image_ids1, image_ids2) * MAX_IMAGE_ID + np.maximum(
+        image_ids1, image_ids2
+    )
+
+
+def pair_ids_to_image_ids(pair_ids):
+    """Vectorized version of pair_id_to_image_ids.
+    :param pair_ids: Array of pair ids.
+    :return: Two int64 arrays of the image ids with image_ids1 < image_ids2.
+    """
+    pair_ids = np.asarray(pair_ids, dtype=np.int64)
+    return np.divmod(pair_ids, MAX_IMAGE_ID)
+
+
+def iter_pair_rows(cursor, fetch_size=FETCH_SIZE):
+    """Iterate over the rows of an executed query, whose first column is the
+    pair_id, and decode the pair ids of each fetched batch at once.
+    :return: Generator of (image_id1, image_id2, *columns) tuples.
+    """
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        image_ids1, image_ids2 = pair_ids_to_image_ids([row[0] for row in rows])
+        for image_id1, image_id2, row in zip(
+            image_ids1.tolist(), image_ids2.tolist(), rows
+        ):
+            yield (image_id1, image_id2) + row[1:]
+
+
 def array_to_blob(array):
     if IS_PYTHON3:
-        return array.tostring()
+        return array.tobytes()
     else:
         return np.getbuffer(array)
 
 
 def blob_to_array(blob, dtype, shape=(-1,)):
-    if IS_PYTHON3:
-        return np.fromstring(blob, dtype=dtype).reshape(*shape)
-    else:
-        return np.frombuffer(blob, dtype=dtype).reshape(*shape)
+    # The returned array is a read-only view into the blob without a copy.
+    if blob is None:
+        return None
+    return np.frombuffer(blob, dtype=dtype).reshape(*shape)
+
+
+def row_to_array(rows, cols, data, dtype):
+    if data is None:
+        return np.zeros((rows, cols), dtype=dtype)
+    return blob_to_array(data, dtype, (rows, cols))
+
+
+def keypoints_to_row(image_id, keypoints):
+    assert len(keypoints.shape) == 2
+    assert keypoints.shape[1] in [2, 4, 6]
+
+    keypoints = np.asarray(keypoints, np.float32)
+    return (image_id,) + keypoints.shape + (array_to_blob(keypoints),)
+
+
+def descriptors_to_row(image_id, descriptors, codec=None):
+    descriptors = np.ascontiguousarray(descriptors, np.uint8)
+    data = array_to_blob(descriptors)
+    if codec is not None:
+        compressed_data = DESCRIPTOR_CODECS[codec](data)
+        # Incompressible descriptors are stored raw, so that compressed blobs
+        # are always shorter than rows * cols and can be told apart.
+        if len(compressed_data) < len(data):
+            data = compressed_data
+    return (image_id,) + descriptors.shape + (data,)
+
+
+def row_to_descriptors(rows, cols, data):
+    if data is not None and len(data) < rows * cols:
+        if data.startswith(LZMA_MAGIC):
+            data = lzma.decompress(data)
+        else:
+            data = zlib.decompress(data)
+    return row_to_array(rows, cols, data, np.uint8)
+
+
+def matches_to_row(image_id1, image_id2, matches):
+    assert len(matches.shape) == 2
+    assert matches.shape[1] == 2
+
+    if image_id1 > image_id2:
+        matches = matches[:, ::-1]
+
+    pair_id = image_ids_to_pair_id(image_id1, image_id2)
+    matches = np.ascontiguousarray(matches, np.uint32)
+    return (pair_id,) + matches.shape + (array_to_blob(matches),)
+
+
+def two_view_geometry_to_row(
+    image_id1,
+    image_id2,
+    matches,
+    F=np.eye(3),
+    E=np.eye(3),
+    H=np.eye(3),
+    qvec=np.array([1.0, 0.0, 0.0, 0.0]),
+    tvec=np.zeros(3),
+    config=2,
+):
+    F = np.asarray(F, dtype=np.float64)
+    E = np.asarray(E, dtype=np.float64)
+    H = np.asarray(H, dtype=np.float64)
+    qvec = np.asarray(qvec, dtype=np.float64)
+    tvec = np.asarray(tvec, dtype=np.float64)
+    return matches_to_row(image_id1, image_id2, matches) + (
+        config,
+        array_to_blob(F),
+        array_to_blob(E),
+        array_to_blob(H),
+        array_to_blob(qvec),
+        array_to_blob(tvec),
+    )
+
+
+def row_to_two_view_geometry(rows, cols, data, config, F, E, H, qvec, tvec):
+    return TwoViewGeometry(
+        config,
+        row_to_array(rows, cols, data, np.uint32),
+        blob_to_array(F, np.float64, (3, 3)),
+        blob_to_array(E, np.float64, (3, 3)),
+        blob_to_array(H, np.float64, (3, 3)),
+        blob_to_array(qvec, np.float64),
+        blob_to_array(tvec, np.float64),
+    )
+
+
+def invert_two_view_geometry(geometry):
+    """Invert a two-view geometry to swap the order of its images.
+    :param geometry: TwoViewGeometry from the first to the second image.
+    :return: TwoViewGeometry from the second to the first image.
+    """
+    F, E, H, qvec, tvec = geometry[2:]
+    if qvec is not None and tvec is not None:
+        # Rotate -tvec by the conjugate of the unit quaternion.
+        w, u = qvec[0], -qvec[1:]
+        uxt = np.cross(u, tvec)
+        tvec = -(tvec + 2 * w * uxt + 2 * np.cross(u, uxt))
+        qvec = qvec * np.array([1.0, -1.0, -1.0, -1.0])
+    return geometry._replace(
+        matches=geometry.matches[:, ::-1],
+        F=None if F is None else F.T,
+        E=None if E is None else E.T,
+        H=None if H is None else np.linalg.pinv(H),
+        qvec=qvec,
+        tvec=tvec,
+    )
 
 
 class COLMAPDatabase(sqlite3.Connection):
@@ -174,6 +366,59 @@ class COLMAPDatabase(sqlite3.Connection):
         )
         self.create_name_index = lambda: self.executescript(CREATE_NAME_INDEX)
 
+        # Codec of the added descriptors, which is read from the metadata on
+        # first use, see get_descriptor_codec.
+        self.descriptor_codec = None
+        self.descriptor_codec_loaded = False
+
+    def get_metadata(self, key, default=None):
+        try:
+            row = self.execute(
+                "SELECT value FROM database_metadata WHERE key=?", (key,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # The metadata table does not exist.
+            return default
+        return default if row is None else row[0]
+
+    def set_metadata(self, key, value):
+        self.execute(CREATE_METADATA_TABLE)
+        if value is None:
+            self.execute("DELETE FROM database_metadata WHERE key=?", (key,))
+        else:
+            self.execute(
+                "INSERT OR REPLACE INTO database_metadata VALUES (?, ?)",
+                (key, value),
+            )
+
+    def get_descriptor_codec(self):
+        """Get the codec of the added descriptors, which is cached on the
+        connection, so changes by other connections are not seen."""
+        if not self.descriptor_codec_loaded:
+            self.descriptor_codec = self.get_metadata("descriptor_codec")
+            self.descriptor_codec_loaded = True
+        return self.descriptor_codec
+
+    def set_descriptor_codec(self, codec):
+        """Set the codec to compress the descriptors added from now on.
+
+        The codec is recorded in the database, and the read methods decode
+        compressed descriptors transparently. Note that COLMAP itself and
+        other readers of the raw blobs cannot read compressed descriptors.
+        :param codec: Name of one of the DESCRIPTOR_CODECS, or None to store
+            the descriptors uncompressed.
+        """
+        if codec is not None and codec not in DESCRIPTOR_CODECS:
+            raise ValueError(
+                "Unknown descriptor codec {}, expected one of {}".format(
+                    codec, sorted(DESCRIPTOR_CODECS)
+                )
+            )
+        self.set_metadata("descriptor_codec", codec)
+        self.commit()
+        self.descriptor_codec = codec
+        self.descriptor_codec_loaded = True
+
     def add_camera(
         self,
         model,
@@ -197,28 +442,10 @@ class COLMAPDatabase(sqlite3.Connection):
         )
         return cursor.lastrowid
 
-    def add_image(
-        self,
-        name,
-        camera_id,
-        prior_q=np.full(4, np.nan),
-        prior_t=np.full(3, np.nan),
-        image_id=None,
-    ):
+    def add_image(self, name, camera_id, image_id=None):
+        # Pose priors are stored separately, see add_pose_prior.
         cursor = self.execute(
-            "INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (
-                image_id,
-                name,
-                camera_id,
-                prior_q[0],
-                prior_q[1],
-                prior_q[2],
-                prior_q[3],
-                prior_t[0],
-                prior_t[1],
-                prior_t[2],
-            ),
+            "INSERT INTO images VALUES (?, ?, ?)", (image_id, name, camera_id)
         )
         return cursor.lastrowid
 
@@ -230,34 +457,23 @@ class COLMAPDatabase(sqlite3.Connection):
         )
 
     def add_keypoints(self, image_id, keypoints):
-        assert len(keypoints.shape) == 2
-        assert keypoints.shape[1] in [2, 4, 6]
-
-        keypoints = np.asarray(keypoints, np.float32)
         self.execute(
             "INSERT INTO keypoints VALUES (?, ?, ?, ?)",
-            (image_id,) + keypoints.shape + (array_to_blob(keypoints),),
+            keypoints_to_row(image_id, keypoints),
         )
 
     def add_descriptors(self, image_id, descriptors):
-        descriptors = np.ascontiguousarray(descriptors, np.uint8)
         self.execute(
             "INSERT INTO descriptors VALUES (?, ?, ?, ?)",
-            (image_id,) + descriptors.shape + (array_to_blob(descriptors),),
+            descriptors_to_row(
+                image_id, descriptors, self.get_descriptor_codec()
+            ),
         )
 
     def add_matches(self, image_id1, image_id2, matches):
-        assert len(matches.shape) == 2
-        assert matches.shape[1] == 2
-
-        if image_id1 > image_id2:
-            matches = matches[:, ::-1]
-
-        pair_id = image_ids_to_pair_id(image_id1, image_id2)
-        matches = np.asarray(matches, np.uint32)
         self.execute(
             "INSERT INTO matches VALUES (?, ?, ?, ?)",
-            (pair_id,) + matches.shape + (array_to_blob(matches),),
+            matches_to_row(image_id1, image_id2, matches),
         )
 
     def add_two_view_geometry(
@@ -272,34 +488,325 @@ class COLMAPDatabase(sqlite3.Connection):
         tvec=np.zeros(3),
         config=2,
     ):
-        assert len(matches.shape) == 2
-        assert matches.shape[1] == 2
-
-        if image_id1 > image_id2:
-            matches = matches[:, ::-1]
-
-        pair_id = image_ids_to_pair_id(image_id1, image_id2)
-        matches = np.asarray(matches, np.uint32)
-        F = np.asarray(F, dtype=np.float64)
-        E = np.asarray(E, dtype=np.float64)
-        H = np.asarray(H, dtype=np.float64)
-        qvec = np.asarray(qvec, dtype=np.float64)
-        tvec = np.asarray(tvec, dtype=np.float64)
         self.execute(
             "INSERT INTO two_view_geometries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (pair_id,)
-            + matches.shape
-            + (
-                array_to_blob(matches),
-                config,
-                array_to_blob(F),
-                array_to_blob(E),
-                array_to_blob(H),
-                array_to_blob(qvec),
-                array_to_blob(tvec),
+            two_view_geometry_to_row(
+                image_id1, image_id2, matches, F, E, H, qvec, tvec, config
             ),
         )
 
+    @contextlib.contextmanager
+    def bulk_transaction(
+        self, journal_mode="MEMORY", synchronous="OFF", cache_size_mb=256
+    ):
+        """Run a block of inserts in a single transaction with PRAGMAs tuned
+        for bulk loading, and restore the previous PRAGMAs afterwards.
+
+        Pending changes are committed first, as the journal mode cannot be
+        changed within a transaction. The transaction is rolled back if the
+        block raises. The tuned settings trade crash safety of the database
+        for speed while the block runs.
+        """
+        self.commit()
+        pragmas = ["journal_mode", "synchronous", "cache_size"]
+        previous = {
+            pragma: self.execute("PRAGMA " + pragma).fetchone()[0]
+            for pragma in pragmas
+        }
+        self.execute("PRAGMA journal_mode = " + journal_mode)
+        self.execute("PRAGMA synchronous = " + synchronous)
+        # A negative cache size is in KiB instead of pages.
+        self.execute("PRAGMA cache_size = {}".format(-1024 * cache_size_mb))
+        try:
+            self.execute("BEGIN")
+            yield self
+            self.commit()
+        except BaseException:
+            self.rollback()
+            raise
+        finally:
+            for pragma in pragmas:
+                self.execute("PRAGMA {} = {}".format(pragma, previous[pragma]))
+
+    def insert_many(self, table, rows, verbose=False):
+        """Insert rows into a table with executemany in a bulk transaction.
+        :param rows: Iterable of row tuples, which may be a generator to
+            bound the memory usage.
+        :param verbose: Whether to print the insertion rate.
+        :return: Number of inserted rows.
+        """
+        start = time.time()
+        with self.bulk_transaction():
+            num_columns = len(
+                self.execute("PRAGMA table_info({})".format(table)).fetchall()
+            )
+            cursor = self.executemany(
+                "INSERT INTO {} VALUES ({})".format(
+                    table, ", ".join(["?"] * num_columns)
+                ),
+                rows,
+            )
+        num_rows = cursor.rowcount
+        if verbose:
+            elapsed = time.time() - start
+            print(
+                "Inserted {} rows into {} in {:.3f}s ({:.0f} rows/s)".format(
+                    num_rows, table, elapsed, num_rows / max(elapsed, 1e-9)
+                )
+            )
+        return num_rows
+
+    def add_keypoints_many(self, keypoints, verbose=False):
+        """Add the keypoints of many images in one transaction.
+        :param keypoints: Iterable of (image_id, keypoints) pairs, e.g., the
+            items of a dict.
+        :return: Number of inserted rows.
+        """
+        return self.insert_many(
+            "keypoints",
+            (keypoints_to_row(*item) for item in keypoints),
+            verbose,
+        )
+
+    def add_descriptors_many(self, descriptors, verbose=False):
+        """Add the descriptors of many images in one transaction.
+        :param descriptors: Iterable of (image_id, descriptors) pairs.
+        :return: Number of inserted rows.
+        """
+        codec = self.get_descriptor_codec()
+        return self.insert_many(
+            "descriptors",
+            (
+                descriptors_to_row(image_id, image_descriptors, codec)
+                for image_id, image_descriptors in descriptors
+            ),
+            verbose,
+        )
+
+    def add_matches_many(self, matches, verbose=False):
+        """Add the matches of many image pairs in one transaction.
+        :param matches: Iterable of (image_id1, image_id2, matches) tuples.
+        :return: Number of inserted rows.
+        """
+        return self.insert_many(
+            "matches", (matches_to_row(*item) for item in matches), verbose
+        )
+
+    def add_two_view_geometries_many(self, two_view_geometries, verbose=False):
+        """Add the two-view geometries of many image pairs in one transaction.
+        :param two_view_geometries: Iterable of tuples with the arguments of
+            add_two_view_geometry, i.e., (image_id1, image_id2, matches)
+            optionally followed by F, E, H, qvec, tvec, config.
+        :return: Number of inserted rows.
+        """
+        return self.insert_many(
+            "two_view_geometries",
+            (two_view_geometry_to_row(*item) for item in two_view_geometries),
+            verbose,
+        )
+
+    def iter_rows(self, query, parameters=(), fetch_size=FETCH_SIZE):
+        """Iterate over the rows of a query and only hold fetch_size rows in
+        memory at once.
+        """
+        cursor = self.execute(query, parameters)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+    def read_keypoints(self, image_id):
+        """Read the keypoints of an image.
+        :return: Read-only float32 array of shape (num_keypoints, 2|4|6).
+        """
+        row = self.execute(
+            "SELECT rows, cols, data FROM keypoints WHERE image_id=?",
+            (image_id,),
+        ).fetchone()
+        if row is None:
+            raise KeyError(image_id)
+        return row_to_array(*row, np.float32)
+
+    def read_descriptors(self, image_id):
+        """Read the descriptors of an image.
+        :return: Read-only uint8 array of shape (num_keypoints, 128).
+        """
+        row = self.execute(
+            "SELECT rows, cols, data FROM descriptors WHERE image_id=?",
+            (image_id,),
+        ).fetchone()
+        if row is None:
+            raise KeyError(image_id)
+        return row_to_descriptors(*row)
+
+    def read_matches(self, image_id1, image_id2):
+        """Read the matches of an image pair in the given order of images.
+        :return: Read-only uint32 array of shape (num_matches, 2).
+        """
+        row = self.execute(
+            "SELECT rows, cols, data FROM matches WHERE pair_id=?",
+            (image_ids_to_pair_id(image_id1, image_id2),),
+        ).fetchone()
+        if row is None:
+            raise KeyError((image_id1, image_id2))
+        matches = row_to_array(*row, np.uint32)
+        if image_id1 > image_id2:
+            matches = matches[:, ::-1]
+        return matches
+
+    def read_two_view_geometry(self, image_id1, image_id2):
+        """Read the two-view geometry of an image pair in the given order of
+        images, i.e., the inverted geometry if image_id1 > image_id2.
+        :return: TwoViewGeometry with the inlier matches and the F, E, H
+            matrices and relative pose as read-only arrays.
+        """
+        row = self.execute(
+            "SELECT rows, cols, data, config, F, E, H, qvec, tvec "
+            "FROM two_view_geometries WHERE pair_id=?",
+            (image_ids_to_pair_id(image_id1, image_id2),),
+        ).fetchone()
+        if row is None:
+            raise KeyError((image_id1, image_id2))
+        geometry = row_to_two_view_geometry(*row)
+        if image_id1 > image_id2:
+            geometry = invert_two_view_geometry(geometry)
+        return geometry
+
+    def iter_keypoints(self, fetch_size=FETCH_SIZE):
+        """Iterate over the keypoints of all images.
+        :return: Generator of (image_id, keypoints) pairs.
+        """
+        for image_id, rows, cols, data in self.iter_rows(
+            "SELECT image_id, rows, cols, data FROM keypoints",
+            fetch_size=fetch_size,
+        ):
+            yield image_id, row_to_array(rows, cols, data, np.float32)
+
+    def iter_descriptors(self, fetch_size=FETCH_SIZE):
+        """Iterate over the descriptors of all images.
+        :return: Generator of (image_id, descriptors) pairs.
+        """
+        for image_id, rows, cols, data in self.iter_rows(
+            "SELECT image_id, rows, cols, data FROM descriptors",
+            fetch_size=fetch_size,
+        ):
+            yield image_id, row_to_descriptors(rows, cols, data)
+
+    def iter_matches(self, fetch_size=FETCH_SIZE):
+        """Iterate over the matches of all image pairs.
+        :return: Generator of (image_id1, image_id2, matches) tuples with
+            image_id1 < image_id2.
+        """
+        for image_id1, image_id2, rows, cols, data in self.iter_rows(
+            "SELECT pair_id / {0}, pair_id % {0}, rows, cols, data "
+            "FROM matches".format(MAX_IMAGE_ID),
+            fetch_size=fetch_size,
+        ):
+            yield image_id1, image_id2, row_to_array(
+                rows, cols, data, np.uint32
+            )
+
+    def iter_two_view_geometries(self, fetch_size=FETCH_SIZE):
+        """Iterate over the two-view geometries of all image pairs.
+        :return: Generator of (image_id1, image_id2, TwoViewGeometry) tuples
+            with image_id1 < image_id2.
+        """
+        for row in self.iter_rows(
+            "SELECT pair_id / {0}, pair_id % {0}, rows, cols, data, config, "
+            "F, E, H, qvec, tvec FROM two_view_geometries".format(MAX_IMAGE_ID),
+            fetch_size=fetch_size,
+        ):
+            yield row[0], row[1], row_to_two_view_geometry(*row[2:])
+
+    def optimize(
+        self,
+        indexes=tuple(OPTIONAL_INDEXES),
+        analyze=True,
+        vacuum=False,
+        journal_mode="WAL",
+        page_size=None,
+    ):
+        """Tune a database for the queries on large reconstructions.
+        :param indexes: Names of the OPTIONAL_INDEXES to create.
+        :param analyze: Whether to gather statistics for the query planner.
+        :param vacuum: Whether to rebuild the database file to defragment it
+            and release free pages.
+        :param journal_mode: Journal mode to set, e.g., "WAL" to allow reads
+            concurrent to a writer, or None to keep the current mode.
+        :param page_size: Page size in bytes to set, which requires a vacuum
+            and is only applied if vacuum is True.
+        """
+        self.commit()
+        if vacuum:
+            if page_size is not None:
+                # The page size cannot be changed in WAL mode.
+                self.execute("PRAGMA journal_mode = DELETE")
+                self.execute("PRAGMA page_size = {:d}".format(page_size))
+            self.execute("VACUUM")
+        for index in indexes:
+            self.execute(OPTIONAL_INDEXES[index])
+        self.commit()
+        if analyze:
+            self.execute("ANALYZE")
+            self.commit()
+        if journal_mode is not None:
+            self.execute("PRAGMA journal_mode = " + journal_mode)
+
+    def stats(self):
+        """Gather the sizes of the tables and indexes of the database.
+        :return: DatabaseStats with a TableStats of the number of rows, the
+            bytes on disk and the bytes of all blobs per table, and the bytes
+            on disk per index. The bytes on disk are None if SQLite was built
+            without the dbstat virtual table.
+        """
+        num_bytes = {}
+        try:
+            num_bytes = dict(
+                self.execute(
+                    "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"
+                ).fetchall()
+            )
+        except sqlite3.OperationalError:
+            pass
+
+        tables = {}
+        indexes = {}
+        for name, type_ in self.execute(
+            "SELECT name, type FROM sqlite_master "
+            "WHERE type IN ('table', 'index') ORDER BY name"
+        ).fetchall():
+            if type_ == "index":
+                indexes[name] = num_bytes.get(name)
+                continue
+            blob_columns = [
+                column[1]
+                for column in self.execute(
+                    "PRAGMA table_info({})".format(name)
+                ).fetchall()
+                if column[2].upper() == "BLOB"
+            ]
+            num_rows, blob_bytes = self.execute(
+                "SELECT COUNT(*), {} FROM {}".format(
+                    " + ".join(
+                        "COALESCE(SUM(LENGTH({})), 0)".format(column)
+                        for column in blob_columns
+                    )
+                    or "0",
+                    name,
+                )
+            ).fetchone()
+            tables[name] = TableStats(num_rows, num_bytes.get(name), blob_bytes)
+
+        return DatabaseStats(
+            self.execute("PRAGMA page_size").fetchone()[0],
+            self.execute("PRAGMA page_count").fetchone()[0],
+            self.execute("PRAGMA freelist_count").fetchone()[0],
+            tables,
+            indexes,
+        )
+
 
 def example_usage():
     import os
@@ -397,10 +904,7 @@ def example_usage():
 
     # Read and check keypoints.
 
-    keypoints = dict(
-        (image_id, blob_to_array(data, np.float32, (-1, 2)))
-        for image_id, data in db.execute("SELECT image_id, data FROM keypoints")
-    )
+    keypoints = dict(db.iter_keypoints())
 
     assert np.allclose(keypoints[image_id1], keypoints1)
     assert np.allclose(keypoints[image_id2], keypoints2)
@@ -419,8 +923,8 @@ def example_usage():
     ]
 
     matches = dict(
-        (pair_id_to_image_ids(pair_id), blob_to_array(data, np.uint32, (-1, 2)))
-        for pair_id, data in db.execute("SELECT pair_id, data FROM matches")
+        ((image_id1, image_id2), pair_matches)
+        for image_id1, image_id2, pair_matches in db.iter_matches()
     )
 
     assert np.all(matches[(image_id1, image_id2)] == matches12)
@@ -0,0 +1,375 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# This script packs the depth and normal maps of a dense workspace into a
+# single compressed archive with random access to any map or tile.
+#
+# The archive starts with a header of the magic bytes and the offset of the
+# index, followed by the compressed tiles of all maps and the index in JSON.
+# Each map is split into tiles of tile_size x tile_size pixels, which are
+# encoded as float32, float16, or quantized integers with a maximum error,
+# byte-shuffled and compressed independently.
+
+import os
+import json
+import lzma
+import zlib
+import struct
+import argparse
+import numpy as np
+
+from read_write_dense import DenseWorkspace, MAP_DIRECTORIES, read_array
+from read_write_model import open_output_file, read_file_buffer
+
+
+ARCHIVE_MAGIC = b"COLMAPDA"
+ARCHIVE_HEADER_STRUCT = struct.Struct("<8sQ")
+
+CODECS = {
+    "none": (lambda data: data, lambda data: data),
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+ENCODINGS = ["float32", "float16", "quantized"]
+
+
+def shuffle_bytes(array):
+    # Group the bytes by their significance, which compresses better.
+    data = np.ascontiguousarray(array).view(np.uint8)
+    return data.reshape(-1, array.dtype.itemsize).T.tobytes()
+
+
+def unshuffle_bytes(data, dtype, shape):
+    dtype = np.dtype(dtype)
+    planes = np.frombuffer(data, np.uint8).reshape(dtype.itemsize, -1)
+    return np.ascontiguousarray(planes.T).view(dtype).reshape(shape)
+
+
+def quantization_params(array, max_error):
+    """Get the offset, scale and integer type to quantize the valid pixels of
+    an array with an error of at most max_error, where zero is reserved for
+    invalid pixels.
+    """
+    valid = array[(array != 0) & np.isfinite(array)]
+    if valid.size == 0:
+        return 0.0, 1.0, "uint8"
+    offset = float(valid.min())
+    # Leave room for the rounding of the decoded values to float32.
+    margin = float(np.spacing(np.abs(valid).max()))
+    if max_error <= margin:
+        raise ValueError("max_error is too small to quantize the array")
+    scale = 2 * (max_error - margin)
+    num_levels = (float(valid.max()) - offset) / scale + 2
+    for dtype in ["uint8", "uint16", "uint32"]:
+        if num_levels <= np.iinfo(dtype).max:
+            return offset, scale, dtype
+    raise ValueError("max_error is too small to quantize the array")
+
+
+def encode_tile(tile, map_entry):
+    encoding = map_entry["encoding"]
+    if encoding == "float32":
+        encoded = tile.astype("<f4")
+    elif encoding == "float16":
+        encoded = tile.astype("<f2")
+    else:
+        offset = map_entry["offset"]
+        scale = map_entry["scale"]
+        encoded = np.round((tile.astype(np.float64) - offset) / scale) + 1
+        encoded[(tile == 0) | ~np.isfinite(tile)] = 0
+        encoded = encoded.astype(map_entry["dtype"])
+    return CODECS[map_entry["codec"]][0](shuffle_bytes(encoded))
+
+
+def decode_tile(data, map_entry, shape):
+    encoding = map_entry["encoding"]
+    data = CODECS[map_entry["codec"]][1](data)
+    if encoding == "float32":
+        return unshuffle_bytes(data, "<f4", shape)
+    if encoding == "float16":
+        return unshuffle_bytes(data, "<f2", shape).astype(np.float32)
+    encoded = unshuffle_bytes(data, map_entry["dtype"], shape)
+    tile = (
+        map_entry["offset"]
+        + (encoded.astype(np.float64) - 1) * map_entry["scale"]
+    ).astype(np.float32)
+    tile[encoded == 0] = 0
+    return tile
+
+
+def tile_slices(map_entry, tile_index):
+    tile_size = map_entry["tile_size"]
+    num_tiles_x = -(-map_entry["width"] // tile_size)
+    tile_y, tile_x = divmod(tile_index, num_tiles_x)
+    return (
+        slice(tile_y * tile_size, (tile_y + 1) * tile_size),
+        slice(tile_x * tile_size, (tile_x + 1) * tile_size),
+    )
+
+
+def write_map(fid, array, tile_size, codec, encoding, max_error):
+    """Write the tiles of a map to the archive.
+    :return: Index entry of the map.
+    """
+    if codec not in CODECS:
+        raise ValueError("Unknown codec {}".format(codec))
+    if encoding not in ENCODINGS:
+        raise ValueError("Unknown encoding {}".format(encoding))
+    array = array.reshape(array.shape[:2] + (-1,))
+    height, width, channels = array.shape
+    map_entry = {
+        "width": width,
+        "height": height,
+        "channels": channels,
+        "tile_size": tile_size,
+        "codec": codec,
+        "encoding": encoding,
+        "tiles": [],
+    }
+    if encoding == "quantized":
+        offset, scale, dtype = quantization_params(array, max_error)
+        map_entry.update(offset=offset, scale=scale, dtype=dtype)
+
+    num_tiles = -(-height // tile_size) * -(-width // tile_size)
+    for tile_index in range(num_tiles):
+        tile = np.asarray(array[tile_slices(map_entry, tile_index)])
+        data = encode_tile(tile, map_entry)
+        map_entry["tiles"].append((fid.tell(), len(data)))
+        fid.write(data)
+    return map_entry
+
+
+def write_archive(
+    arrays,
+    archive_path,
+    tile_size=256,
+    codec="zlib",
+    encodings=None,
+    max_error=0.01,
+):
+    """Write maps into an archive.
+    :param arrays: Iterable of (name, array) pairs, where the arrays may be
+        memory-mapped, see read_array.
+    :param encodings: Function from the name of a map to its encoding, by
+        default float32 for all maps.
+    :param max_error: Maximum absolute error of quantized maps.
+    :return: Number of written maps.
+    """
+    index = {}
+    with open_output_file(archive_path, "wb", atomic=True) as fid:
+        fid.write(ARCHIVE_HEADER_STRUCT.pack(ARCHIVE_MAGIC, 0))
+        for name, array in arrays:
+            encoding = "float32" if encodings is None else encodings(name)
+            index[name] = write_map(
+                fid, array, tile_size, codec, encoding, max_error
+            )
+        index_offset = fid.tell()
+        fid.write(json.dumps(index).encode())
+        fid.seek(0)
+        fid.write(ARCHIVE_HEADER_STRUCT.pack(ARCHIVE_MAGIC, index_offset))
+    return len(index)
+
+
+def pack_dense_workspace(
+    workspace_path,
+    archive_path,
+    input_type="geometric",
+    map_types=("depth", "normal"),
+    tile_size=256,
+    codec="zlib",
+    depth_encoding="float32",
+    normal_encoding="float32",
+    max_depth_error=0.01,
+):
+    """Pack the maps of a dense workspace into an archive. The maps are named
+    by their path relative to the stereo folder of the workspace, e.g.,
+    "depth_maps/image.jpg.geometric.bin".
+    :return: Number of packed maps.
+    """
+    workspace = DenseWorkspace(workspace_path, input_type)
+    stereo_path = os.path.join(workspace_path, "stereo")
+    paths = [
+        workspace.map_path(image_name, map_type)
+        for map_type in map_types
+        for image_name in workspace.image_names(map_type)
+    ]
+    depth_directory = MAP_DIRECTORIES["depth"] + "/"
+    return write_archive(
+        (
+            (
+                os.path.relpath(path, stereo_path).replace(os.sep, "/"),
+                read_array(path, mmap_mode="r"),
+            )
+            for path in paths
+        ),
+        archive_path,
+        tile_size,
+        codec,
+        lambda name: depth_encoding
+        if name.startswith(depth_directory)
+        else normal_encoding,
+        max_depth_error,
+    )
+
+
+class DenseArchive:
+    """Random access to the maps and tiles of an archive.
+
+    The maps are named by their path relative to the stereo folder of the
+    workspace, e.g., "depth_maps/image.jpg.geometric.bin", but the methods
+    also accept the path of the original map file, so that read_array is a
+    drop-in replacement for read_array of read_write_dense.py.
+    """
+
+    def __init__(self, path):
+        self.data = read_file_buffer(path, access="random")
+        magic, index_offset = ARCHIVE_HEADER_STRUCT.unpack_from(self.data)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError("{} is not a dense map archive".format(path))
+        self.index = json.loads(bytes(self.data[index_offset:]))
+
+    def names(self):
+        return sorted(self.index)
+
+    def member_name(self, path):
+        """Get the name of a map from its name or original path.
+        :raises KeyError: If the map is not in the archive.
+        """
+        if path in self.index:
+            return path
+        parts = os.path.normpath(path).replace(os.sep, "/").split("/")
+        for i, part in enumerate(parts):
+            if part in MAP_DIRECTORIES.values():
+                name = "/".join(parts[i:])
+                if name in self.index:
+                    return name
+        raise KeyError(path)
+
+    def __contains__(self, path):
+        try:
+            self.member_name(path)
+        except KeyError:
+            return False
+        return True
+
+    def num_tiles(self, path):
+        return len(self.index[self.member_name(path)]["tiles"])
+
+    def read_tile(self, path, tile_index):
+        """Read a tile of a map.
+        :param path: Name or original path of the map.
+        :return: Array of shape (tile_height, tile_width, channels) and the
+            slices of the tile in the map.
+        """
+        map_entry = self.index[self.member_name(path)]
+        offset, size = map_entry["tiles"][tile_index]
+        slices = tile_slices(map_entry, tile_index)
+        shape = (
+            len(range(map_entry["height"])[slices[0]]),
+            len(range(map_entry["width"])[slices[1]]),
+            map_entry["channels"],
+        )
+        tile = decode_tile(self.data[offset : offset + size], map_entry, shape)
+        return tile, slices
+
+    def read_array(self, path):
+        """Read a map, as read_array reads it from its original file.
+        :param path: Name or original path of the map.
+        """
+        name = self.member_name(path)
+        map_entry = self.index[name]
+        array = np.empty(
+            (map_entry["height"], map_entry["width"], map_entry["channels"]),
+            dtype=np.float32,
+        )
+        for tile_index in range(len(map_entry["tiles"])):
+            tile, slices = self.read_tile(name, tile_index)
+            array[slices] = tile
+        return array.squeeze()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workspace_path", required=True)
+    parser.add_argument(
+        "--archive_path",
+        required=True,
+        help="output archive, in which the maps are named by their path "
+        "relative to the stereo folder, e.g., depth_maps/image.jpg."
+        "geometric.bin",
+    )
+    parser.add_argument(
+        "--input_type",
+        default="geometric",
+        choices=["geometric", "photometric"],
+    )
+    parser.add_argument(
+        "--map_types",
+        nargs="+",
+        default=["depth", "normal"],
+        choices=sorted(MAP_DIRECTORIES),
+    )
+    parser.add_argument("--tile_size", type=int, default=256)
+    parser.add_argument("--codec", default="zlib", choices=sorted(CODECS))
+    parser.add_argument(
+        "--depth_encoding", default="float32", choices=ENCODINGS
+    )
+    parser.add_argument(
+        "--normal_encoding", default="float32", choices=ENCODINGS
+    )
+    parser.add_argument(
+        "--max_depth_error",
+        type=float,
+        default=0.01,
+        help="maximum absolute error of quantized depths",
+    )
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    num_maps = pack_dense_workspace(
+        args.workspace_path,
+        args.archive_path,
+        args.input_type,
+        args.map_types,
+        args.tile_size,
+        args.codec,
+        args.depth_encoding,
+        args.normal_encoding,
+        args.max_depth_error,
+    )
+    print("Packed {} maps into {}".format(num_maps, args.archive_path))
+
+
+if __name__ == "__main__":
+    main()
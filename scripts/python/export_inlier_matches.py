@@ -35,6 +35,8 @@ import argparse
 import sqlite3
 import numpy as np
 
+from database import blob_to_array, iter_pair_rows
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -45,12 +47,6 @@ def parse_args():
     return args
 
 
-def pair_id_to_image_ids(pair_id):
-    image_id2 = pair_id % 2147483647
-    image_id1 = (pair_id - image_id2) / 2147483647
-    return image_id1, image_id2
-
-
 def main():
     args = parse_args()
 
@@ -69,12 +65,8 @@ def main():
             "SELECT pair_id, data FROM two_view_geometries WHERE rows>=?;",
             (args.min_num_matches,),
         )
-        for row in cursor:
-            pair_id = row[0]
-            inlier_matches = np.fromstring(row[1], dtype=np.uint32).reshape(
-                -1, 2
-            )
-            image_id1, image_id2 = pair_id_to_image_ids(pair_id)
+        for image_id1, image_id2, data in iter_pair_rows(cursor):
+            inlier_matches = blob_to_array(data, np.uint32, (-1, 2))
             image_name1 = images[image_id1]
             image_name2 = images[image_id2]
             fid.write(
@@ -33,6 +33,8 @@
 import sqlite3
 import argparse
 
+from database import iter_pair_rows
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -43,12 +45,6 @@ def parse_args():
     return args
 
 
-def pair_id_to_image_ids(pair_id):
-    image_id2 = pair_id % 2147483647
-    image_id1 = (pair_id - image_id2) / 2147483647
-    return image_id1, image_id2
-
-
 def main():
     args = parse_args()
 
@@ -65,15 +61,11 @@ def main():
 
     # Iterate over entries in the two_view_geometries table
     output = open(args.match_list_path, "w")
-    cursor.execute("SELECT pair_id, rows FROM two_view_geometries;")
-    for row in cursor:
-        pair_id = row[0]
-        rows = row[1]
-
-        if rows < args.min_num_matches:
-            continue
-
-        image_id1, image_id2 = pair_id_to_image_ids(pair_id)
+    cursor.execute(
+        "SELECT pair_id FROM two_view_geometries WHERE rows>=?;",
+        (args.min_num_matches,),
+    )
+    for image_id1, image_id2 in iter_pair_rows(cursor):
         image_name1 = image_id_to_name[image_id1]
         image_name2 = image_id_to_name[image_id2]
 
@@ -32,12 +32,15 @@
 
 import os
 import sys
+import struct
 import argparse
 import sqlite3
 import shutil
 import gzip
 import numpy as np
 
+from database import blob_to_array, iter_pair_rows
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -50,12 +53,6 @@ def parse_args():
     return args
 
 
-def pair_id_to_image_ids(pair_id):
-    image_id2 = pair_id % 2147483647
-    image_id1 = (pair_id - image_id2) / 2147483647
-    return image_id1, image_id2
-
-
 def main():
     args = parse_args()
 
@@ -71,7 +68,7 @@ def main():
     cursor.execute("SELECT camera_id, params FROM cameras;")
     for row in cursor:
         camera_id = row[0]
-        params = np.fromstring(row[1], dtype=np.double)
+        params = blob_to_array(row[1], np.double)
         cameras[camera_id] = params
 
     images = {}
@@ -94,7 +91,7 @@ def main():
     sift_version_v4 = 808334422
     sift_eof_marker = 1179600383
 
-    for image_id, (image_idx, image_name) in images.iteritems():
+    for image_id, (image_idx, image_name) in images.items():
         print("Exporting key file for", image_name)
         base_name, ext = os.path.splitext(image_name)
         key_file_name = os.path.join(args.output_path, base_name + ".sift")
@@ -109,12 +106,12 @@ def main():
             keypoints = np.zeros((0, 6), dtype=np.float32)
             descriptors = np.zeros((0, 128), dtype=np.uint8)
         else:
-            keypoints = np.fromstring(row[0], dtype=np.float32).reshape(-1, 6)
+            keypoints = blob_to_array(row[0], np.float32, (-1, 6))
             cursor.execute(
                 "SELECT data FROM descriptors WHERE image_id=?;", (image_id,)
             )
             row = next(cursor)
-            descriptors = np.fromstring(row[0], dtype=np.uint8).reshape(-1, 128)
+            descriptors = blob_to_array(row[0], np.uint8, (-1, 128))
 
         if args.binary_feature_files:
             with open(key_file_name, "wb") as fid:
@@ -143,12 +140,8 @@ def main():
             "SELECT pair_id, data FROM two_view_geometries " "WHERE rows>=?;",
             (args.min_num_matches,),
         )
-        for row in cursor:
-            pair_id = row[0]
-            inlier_matches = np.fromstring(row[1], dtype=np.uint32).reshape(
-                -1, 2
-            )
-            image_id1, image_id2 = pair_id_to_image_ids(pair_id)
+        for image_id1, image_id2, data in iter_pair_rows(cursor):
+            inlier_matches = blob_to_array(data, np.uint32, (-1, 2))
             image_name1 = images[image_id1][1]
             image_name2 = images[image_id2][1]
             fid.write(
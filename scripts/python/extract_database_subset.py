@@ -0,0 +1,214 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# This script extracts a subset of the images of a COLMAP database, e.g., to
+# run the mapper on a subregion, into a new database with the same ids.
+#
+# The images are selected by name, by the bounding box of their pose priors,
+# or by ranges of image ids, and by all of them if several are given. Only
+# the cameras of the selected images and the matches and two-view geometries
+# between two selected images are kept. The rows are copied with set-based
+# INSERT ... SELECT statements, which only read the pages of the selected
+# rows, instead of copying the whole database.
+
+import os
+import argparse
+import numpy as np
+
+from database import COLMAPDatabase, MAX_IMAGE_ID, blob_to_array
+from merge_databases import copy_table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database_path", required=True)
+    parser.add_argument("--output_path", required=True)
+    parser.add_argument(
+        "--image_list_path", help="path to a file with one image name per line"
+    )
+    parser.add_argument(
+        "--bounding_box",
+        type=float,
+        nargs=6,
+        metavar=("MIN_X", "MIN_Y", "MIN_Z", "MAX_X", "MAX_Y", "MAX_Z"),
+        help="bounds of the pose prior positions",
+    )
+    parser.add_argument(
+        "--image_id_ranges",
+        nargs="+",
+        help="inclusive ranges of image ids, e.g., 1-100 250-300",
+    )
+    args = parser.parse_args()
+    return args
+
+
+def parse_image_id_ranges(ranges):
+    image_id_ranges = []
+    for image_id_range in ranges:
+        first, _, last = image_id_range.partition("-")
+        image_id_ranges.append((int(first), int(last or first)))
+    return image_id_ranges
+
+
+def select_image_ids(
+    db, image_names=None, bounding_box=None, image_id_ranges=None
+):
+    """Select the ids of the images that satisfy all given criteria.
+    :param image_names: Names of the images.
+    :param bounding_box: (min_x, min_y, min_z, max_x, max_y, max_z) bounds of
+        the pose prior positions. Images without a pose prior are excluded.
+    :param image_id_ranges: List of inclusive (first, last) ranges of ids.
+    :return: Sorted int64 array of the selected image ids.
+    """
+    rows = db.execute("SELECT image_id, name FROM images").fetchall()
+    image_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    mask = np.ones(len(image_ids), dtype=bool)
+    if image_names is not None:
+        image_names = set(image_names)
+        mask &= np.array([row[1] in image_names for row in rows], dtype=bool)
+    if bounding_box is not None:
+        prior_ids = []
+        positions = []
+        for image_id, position in db.execute(
+            "SELECT image_id, position FROM pose_priors"
+        ):
+            prior_ids.append(image_id)
+            positions.append(blob_to_array(position, np.float64))
+        positions = np.array(positions, dtype=np.float64).reshape(-1, 3)
+        bounding_box = np.asarray(bounding_box, dtype=np.float64)
+        # Invalid positions with NaN coordinates are outside of any bounds.
+        inside = np.all(
+            (positions >= bounding_box[:3]) & (positions <= bounding_box[3:]),
+            axis=1,
+        )
+        mask &= np.isin(image_ids, np.array(prior_ids)[inside])
+    if image_id_ranges is not None:
+        in_ranges = np.zeros(len(image_ids), dtype=bool)
+        for first, last in image_id_ranges:
+            in_ranges |= (image_ids >= first) & (image_ids <= last)
+        mask &= in_ranges
+    return np.sort(image_ids[mask])
+
+
+def extract_database_subset(
+    database_path,
+    output_path,
+    image_names=None,
+    bounding_box=None,
+    image_id_ranges=None,
+):
+    """Extract the selected images into a new database, see select_image_ids.
+    :return: Number of extracted images.
+    """
+    if os.path.exists(output_path):
+        raise FileExistsError(output_path)
+
+    source_db = COLMAPDatabase.connect(database_path)
+    image_ids = select_image_ids(
+        source_db, image_names, bounding_box, image_id_ranges
+    )
+    source_db.close()
+
+    db = COLMAPDatabase.connect(output_path)
+    db.create_tables()
+    db.execute("ATTACH DATABASE ? AS source", (database_path,))
+    try:
+        with db:
+            db.execute(
+                "CREATE TEMP TABLE subset_image_ids "
+                "(image_id INTEGER PRIMARY KEY)"
+            )
+            db.executemany(
+                "INSERT INTO subset_image_ids VALUES (?)",
+                ((image_id,) for image_id in image_ids.tolist()),
+            )
+            subset = "JOIN subset_image_ids AS m ON m.image_id = s.image_id"
+            for table in [
+                "images",
+                "pose_priors",
+                "keypoints",
+                "descriptors",
+            ]:
+                copy_table(db, table, {}, subset)
+            copy_table(
+                db,
+                "cameras",
+                {},
+                "",
+                "WHERE s.camera_id IN (SELECT camera_id FROM main.images)",
+            )
+            # Scan the pairs of each selected first image by a range of the
+            # primary key, so that only the pages of the candidate pairs are
+            # read from the source database.
+            for table in ["matches", "two_view_geometries"]:
+                copy_table(
+                    db,
+                    table,
+                    {},
+                    "JOIN subset_image_ids AS m ON s.pair_id BETWEEN "
+                    "m.image_id * {0} AND m.image_id * {0} + {0} - 1".format(
+                        MAX_IMAGE_ID
+                    ),
+                    "WHERE s.pair_id % {} IN "
+                    "(SELECT image_id FROM subset_image_ids)".format(
+                        MAX_IMAGE_ID
+                    ),
+                )
+    finally:
+        db.execute("DROP TABLE IF EXISTS temp.subset_image_ids")
+        db.execute("DETACH DATABASE source")
+        db.close()
+
+    return len(image_ids)
+
+
+def main():
+    args = parse_args()
+
+    image_names = None
+    if args.image_list_path is not None:
+        with open(args.image_list_path, "r") as fid:
+            image_names = [line.strip() for line in fid if line.strip()]
+    image_id_ranges = None
+    if args.image_id_ranges is not None:
+        image_id_ranges = parse_image_id_ranges(args.image_id_ranges)
+
+    num_images = extract_database_subset(
+        args.database_path,
+        args.output_path,
+        image_names,
+        args.bounding_box,
+        image_id_ranges,
+    )
+    print("Extracted {} images to {}".format(num_images, args.output_path))
+
+
+if __name__ == "__main__":
+    main()
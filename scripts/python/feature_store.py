@@ -0,0 +1,300 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# This script exports the keypoints and descriptors of a COLMAP database into
+# a read-only feature store of two contiguous .npy files and an index, which
+# can be memory-mapped and sliced per image without any database queries.
+
+import io
+import os
+import argparse
+import contextlib
+import numpy as np
+
+from database import COLMAPDatabase
+from read_write_model import open_output_file
+
+
+KEYPOINTS_FILE_NAME = "keypoints.npy"
+DESCRIPTORS_FILE_NAME = "descriptors.npy"
+INDEX_FILE_NAME = "index.npy"
+
+# Number of keypoint and descriptor columns of an empty feature store.
+DEFAULT_KEYPOINT_COLS = 6
+DEFAULT_DESCRIPTOR_COLS = 128
+
+FEATURE_STORE_INDEX_DTYPE = np.dtype(
+    [
+        ("image_id", np.int64),
+        ("keypoints_begin", np.int64),
+        ("keypoints_end", np.int64),
+        ("descriptors_begin", np.int64),
+        ("descriptors_end", np.int64),
+    ]
+)
+
+
+def npy_header(dtype, shape):
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        buffer,
+        {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            "fortran_order": False,
+            "shape": shape,
+        },
+    )
+    return buffer.getvalue()
+
+
+def read_npy_header(fid):
+    """Read the header of an .npy file.
+    :return: Size of the header in bytes, shape and dtype of the array.
+    """
+    fid.seek(0)
+    version = np.lib.format.read_magic(fid)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fid)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fid)
+    assert not fortran_order
+    return fid.tell(), shape, dtype
+
+
+@contextlib.contextmanager
+def append_npy_rows(path, dtype, num_cols, num_rows):
+    """Open a 2D .npy file to append rows to it and update its header on exit.
+    :param num_cols: Number of columns of the array.
+    :param num_rows: Number of valid rows in the file. Rows beyond, e.g., from
+        an interrupted export, are discarded.
+    :return: File object positioned after the last valid row.
+    """
+    dtype = np.dtype(dtype)
+    if not os.path.exists(path):
+        with open(path, "wb") as fid:
+            fid.write(npy_header(dtype, (0, num_cols)))
+
+    with open(path, "r+b") as fid:
+        header_size, shape, file_dtype = read_npy_header(fid)
+        if file_dtype != dtype or shape[1:] != (num_cols,):
+            raise ValueError(
+                "Cannot append {} rows of {} columns to {} array in {}".format(
+                    dtype, num_cols, shape, path
+                )
+            )
+        row_size = dtype.itemsize * num_cols
+        fid.truncate(header_size + num_rows * row_size)
+        fid.seek(0, os.SEEK_END)
+        yield fid
+
+        total_num_rows = (fid.tell() - header_size) // row_size
+        header = npy_header(dtype, (total_num_rows, num_cols))
+        if len(header) == header_size:
+            fid.seek(0)
+            fid.write(header)
+            return
+
+    # The header does not fit into the space of the previous header anymore,
+    # so the data has to be moved behind the larger header.
+    with open(path, "rb") as fid_in:
+        fid_in.seek(header_size)
+        with open_output_file(path, "wb", atomic=True) as fid_out:
+            fid_out.write(header)
+            while True:
+                chunk = fid_in.read(1 << 24)
+                if not chunk:
+                    break
+                fid_out.write(chunk)
+
+
+def read_feature_store_index(path):
+    index_path = os.path.join(path, INDEX_FILE_NAME)
+    if not os.path.exists(index_path):
+        return np.zeros(0, dtype=FEATURE_STORE_INDEX_DTYPE)
+    return np.load(index_path)
+
+
+def feature_cols(db, table, path, default):
+    """Get the number of columns of the existing array in a feature store or
+    otherwise of the first non-empty image in the database table.
+    """
+    if os.path.exists(path):
+        with open(path, "rb") as fid:
+            return read_npy_header(fid)[1][1]
+    row = db.execute(
+        "SELECT cols FROM {} WHERE rows > 0 LIMIT 1".format(table)
+    ).fetchone()
+    return default if row is None else row[0]
+
+
+def export_feature_store(database_path, output_path, incremental=False):
+    """Export the keypoints and descriptors of a database to a feature store.
+    :param incremental: Whether to only append the images that are not in an
+        existing feature store at output_path, instead of exporting all images.
+    :return: Number of exported images.
+    """
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    keypoints_path = os.path.join(output_path, KEYPOINTS_FILE_NAME)
+    descriptors_path = os.path.join(output_path, DESCRIPTORS_FILE_NAME)
+    index_path = os.path.join(output_path, INDEX_FILE_NAME)
+    if not incremental:
+        for path in [keypoints_path, descriptors_path, index_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    # The index is written last, so that it only ever refers to completely
+    # written features, even if a previous export was interrupted.
+    index = read_feature_store_index(output_path)
+    num_keypoints = int(index["keypoints_end"].max(initial=0))
+    num_descriptors = int(index["descriptors_end"].max(initial=0))
+
+    db = COLMAPDatabase.connect(database_path)
+    image_ids = np.array(
+        [
+            row[0]
+            for row in db.execute(
+                "SELECT image_id FROM keypoints ORDER BY image_id"
+            )
+        ],
+        dtype=np.int64,
+    )
+    image_ids = image_ids[~np.isin(image_ids, index["image_id"])]
+
+    keypoint_cols = feature_cols(
+        db, "keypoints", keypoints_path, DEFAULT_KEYPOINT_COLS
+    )
+    descriptor_cols = feature_cols(
+        db, "descriptors", descriptors_path, DEFAULT_DESCRIPTOR_COLS
+    )
+
+    new_index = np.zeros(len(image_ids), dtype=FEATURE_STORE_INDEX_DTYPE)
+    new_index["image_id"] = image_ids
+    with append_npy_rows(
+        keypoints_path, np.float32, keypoint_cols, num_keypoints
+    ) as keypoints_fid, append_npy_rows(
+        descriptors_path, np.uint8, descriptor_cols, num_descriptors
+    ) as descriptors_fid:
+        for i, image_id in enumerate(image_ids.tolist()):
+            keypoints = db.read_keypoints(image_id)
+            try:
+                descriptors = db.read_descriptors(image_id)
+            except KeyError:
+                descriptors = np.zeros((0, descriptor_cols), dtype=np.uint8)
+            for array, cols in [
+                (keypoints, keypoint_cols),
+                (descriptors, descriptor_cols),
+            ]:
+                if array.shape[0] > 0 and array.shape[1] != cols:
+                    raise ValueError(
+                        "Image {} has {} feature columns instead of {}".format(
+                            image_id, array.shape[1], cols
+                        )
+                    )
+
+            keypoints_fid.write(keypoints)
+            descriptors_fid.write(descriptors)
+            new_index["keypoints_begin"][i] = num_keypoints
+            new_index["descriptors_begin"][i] = num_descriptors
+            num_keypoints += keypoints.shape[0]
+            num_descriptors += descriptors.shape[0]
+            new_index["keypoints_end"][i] = num_keypoints
+            new_index["descriptors_end"][i] = num_descriptors
+    db.close()
+
+    with open_output_file(index_path, "wb", atomic=True) as fid:
+        np.save(fid, np.concatenate([index, new_index]))
+
+    return len(image_ids)
+
+
+class FeatureStore:
+    """Read-only access to a feature store exported by export_feature_store.
+
+    The keypoints and descriptors are memory-mapped, and the features of an
+    image are returned as read-only views without a copy.
+    """
+
+    def __init__(self, path):
+        self.keypoints = np.load(
+            os.path.join(path, KEYPOINTS_FILE_NAME), mmap_mode="r"
+        )
+        self.descriptors = np.load(
+            os.path.join(path, DESCRIPTORS_FILE_NAME), mmap_mode="r"
+        )
+        self.index = read_feature_store_index(path)
+        self.image_rows = dict(
+            (image_id, row)
+            for row, image_id in enumerate(self.index["image_id"].tolist())
+        )
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, image_id):
+        return image_id in self.image_rows
+
+    @property
+    def image_ids(self):
+        return self.index["image_id"]
+
+    def read_keypoints(self, image_id):
+        entry = self.index[self.image_rows[image_id]]
+        return self.keypoints[entry["keypoints_begin"] : entry["keypoints_end"]]
+
+    def read_descriptors(self, image_id):
+        entry = self.index[self.image_rows[image_id]]
+        return self.descriptors[
+            entry["descriptors_begin"] : entry["descriptors_end"]
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the features of a COLMAP database to a "
+        "memory-mapped feature store."
+    )
+    parser.add_argument("--database_path", required=True)
+    parser.add_argument("--output_path", required=True)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only append the images that are not in the feature store yet",
+    )
+    args = parser.parse_args()
+
+    num_images = export_feature_store(
+        args.database_path, args.output_path, args.incremental
+    )
+    print("Exported {} images to {}".format(num_images, args.output_path))
+
+
+if __name__ == "__main__":
+    main()
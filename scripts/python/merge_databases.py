@@ -0,0 +1,221 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+# This script merges several COLMAP databases, e.g., from feature extraction
+# on multiple nodes, into a single database for matching.
+#
+# The images and cameras of each database are appended with new ids. Images
+# whose name already exists in the merged database are skipped together with
+# their features, and so are the matches and two-view geometries involving
+# them, as their keypoint indices refer to the skipped keypoints. All tables
+# are copied with set-based INSERT ... SELECT statements on the attached
+# databases, so that the blobs never pass through Python.
+
+import os
+import argparse
+
+from database import COLMAPDatabase, MAX_IMAGE_ID
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database_paths", nargs="+", required=True)
+    parser.add_argument(
+        "--output_path",
+        required=True,
+        help="path to the merged database, which may already exist",
+    )
+    args = parser.parse_args()
+    return args
+
+
+def table_columns(db, schema, table):
+    return [
+        row[1]
+        for row in db.execute(
+            "PRAGMA {}.table_info({})".format(schema, table)
+        ).fetchall()
+    ]
+
+
+def copy_table(db, table, key_expressions, joins, where=""):
+    """Copy the rows of a table from the attached source database into the
+    main database.
+    :param key_expressions: Dict of the expressions for the id columns, which
+        replace the source columns. Columns missing in the source are NULL.
+    :param joins: Join clause with the id maps.
+    :return: Number of copied rows.
+    """
+    source_columns = set(table_columns(db, "source", table))
+    if not source_columns:
+        return 0
+    expressions = []
+    for column in table_columns(db, "main", table):
+        if column in key_expressions:
+            expressions.append(key_expressions[column])
+        elif column in source_columns:
+            expressions.append("s." + column)
+        else:
+            expressions.append("NULL")
+    cursor = db.execute(
+        "INSERT INTO main.{0} SELECT {1} FROM source.{0} AS s {2} {3}".format(
+            table, ", ".join(expressions), joins, where
+        )
+    )
+    return cursor.rowcount
+
+
+def merge_database(db, database_path):
+    """Merge a database into the main database.
+    :return: Number of merged and of skipped images.
+    """
+    db.execute("ATTACH DATABASE ? AS source", (database_path,))
+    try:
+        with db:
+            # Map the ids of the new images and of their cameras to ids after
+            # the existing ones, in the same order, so that the image order
+            # and thus the order of the images in the pair ids is preserved.
+            db.execute(
+                "CREATE TEMP TABLE image_map ("
+                "old_id INTEGER PRIMARY KEY, new_id INTEGER, is_new INTEGER)"
+            )
+            db.execute(
+                "CREATE TEMP TABLE camera_map ("
+                "old_id INTEGER PRIMARY KEY, new_id INTEGER)"
+            )
+            db.execute(
+                "INSERT INTO image_map "
+                "SELECT s.image_id, "
+                "(SELECT COALESCE(MAX(image_id), 0) FROM main.images) "
+                "+ ROW_NUMBER() OVER (ORDER BY s.image_id), 1 "
+                "FROM source.images AS s "
+                "WHERE s.name NOT IN (SELECT name FROM main.images)"
+            )
+            db.execute(
+                "INSERT INTO image_map "
+                "SELECT s.image_id, m.image_id, 0 "
+                "FROM source.images AS s "
+                "JOIN main.images AS m ON m.name = s.name "
+                "WHERE s.image_id NOT IN (SELECT old_id FROM image_map)"
+            )
+            max_image_id = db.execute(
+                "SELECT MAX(new_id) FROM image_map"
+            ).fetchone()[0]
+            if max_image_id is not None and max_image_id >= MAX_IMAGE_ID:
+                raise ValueError("Too many images to merge")
+            db.execute(
+                "INSERT INTO camera_map "
+                "SELECT camera_id, "
+                "(SELECT COALESCE(MAX(camera_id), 0) FROM main.cameras) "
+                "+ ROW_NUMBER() OVER (ORDER BY camera_id) "
+                "FROM (SELECT DISTINCT s.camera_id FROM source.images AS s "
+                "JOIN image_map AS m ON m.old_id = s.image_id AND m.is_new)"
+            )
+
+            copy_table(
+                db,
+                "cameras",
+                {"camera_id": "c.new_id"},
+                "JOIN camera_map AS c ON c.old_id = s.camera_id",
+            )
+            num_images = copy_table(
+                db,
+                "images",
+                {"image_id": "m.new_id", "camera_id": "c.new_id"},
+                "JOIN image_map AS m ON m.old_id = s.image_id "
+                "JOIN camera_map AS c ON c.old_id = s.camera_id",
+                "WHERE m.is_new",
+            )
+            for table in ["pose_priors", "keypoints", "descriptors"]:
+                copy_table(
+                    db,
+                    table,
+                    {"image_id": "m.new_id"},
+                    "JOIN image_map AS m ON m.old_id = s.image_id",
+                    "WHERE m.is_new",
+                )
+            for table in ["matches", "two_view_geometries"]:
+                copy_table(
+                    db,
+                    table,
+                    {
+                        "pair_id": "m1.new_id * {} + m2.new_id".format(
+                            MAX_IMAGE_ID
+                        )
+                    },
+                    "JOIN image_map AS m1 ON m1.old_id = s.pair_id / {0} "
+                    "JOIN image_map AS m2 ON m2.old_id = s.pair_id % {0}".format(
+                        MAX_IMAGE_ID
+                    ),
+                    "WHERE m1.is_new AND m2.is_new",
+                )
+
+            num_skipped_images = db.execute(
+                "SELECT COUNT(*) FROM image_map WHERE NOT is_new"
+            ).fetchone()[0]
+    finally:
+        db.execute("DROP TABLE IF EXISTS temp.image_map")
+        db.execute("DROP TABLE IF EXISTS temp.camera_map")
+        db.execute("DETACH DATABASE source")
+
+    return num_images, num_skipped_images
+
+
+def merge_databases(database_paths, output_path, verbose=False):
+    """Merge databases into the database at output_path.
+    :return: Total number of merged and of skipped images.
+    """
+    db = COLMAPDatabase.connect(output_path)
+    db.create_tables()
+    total_num_images = 0
+    total_num_skipped_images = 0
+    for database_path in database_paths:
+        if not os.path.exists(database_path):
+            raise FileNotFoundError(database_path)
+        num_images, num_skipped_images = merge_database(db, database_path)
+        if verbose:
+            print(
+                "Merged {} images from {}, skipped {} existing images".format(
+                    num_images, database_path, num_skipped_images
+                )
+            )
+        total_num_images += num_images
+        total_num_skipped_images += num_skipped_images
+    db.close()
+    return total_num_images, total_num_skipped_images
+
+
+def main():
+    args = parse_args()
+    merge_databases(args.database_paths, args.output_path, verbose=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -31,62 +31,329 @@
 
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
 import numpy as np
 import os
-import struct
 
 
-def read_array(path):
+ArrayHeader = collections.namedtuple(
+    "ArrayHeader", ["width", "height", "channels", "offset"]
+)
+
+MapStats = collections.namedtuple(
+    "MapStats", ["valid_ratio", "min", "max", "percentiles"]
+)
+
+# Upper bound on the size of the text header "width&height&channels&".
+MAX_HEADER_SIZE = 64
+
+# Number of bytes of a band of rows processed at once when downsampling or
+# computing statistics of memory-mapped arrays.
+BAND_SIZE = 1 << 24
+
+# Directories of the map types in the stereo folder of a dense workspace.
+MAP_DIRECTORIES = {
+    "depth": "depth_maps",
+    "normal": "normal_maps",
+    "confidence": "confidence_maps",
+}
+
+
+def parse_array_header(data):
+    """Parse the header of a dense array from the first bytes of its file.
+    :return: ArrayHeader with the offset of the payload in bytes.
+    """
+    fields = data.split(b"&", 3)
+    if len(fields) < 4:
+        raise ValueError("Invalid dense array header {!r}".format(data))
+    width, height, channels = map(int, fields[:3])
+    offset = sum(len(field) for field in fields[:3]) + 3
+    return ArrayHeader(width, height, channels, offset)
+
+
+def read_array_header(path):
+    """Read the header of a dense array without reading its payload.
+    :return: ArrayHeader(width, height, channels, offset).
+    """
     with open(path, "rb") as fid:
-        width, height, channels = np.genfromtxt(
-            fid, delimiter="&", max_rows=1, usecols=(0, 1, 2), dtype=int
-        )
-        fid.seek(0)
-        num_delimiter = 0
-        byte = fid.read(1)
-        while True:
-            if byte == b"&":
-                num_delimiter += 1
-                if num_delimiter >= 3:
-                    break
-            byte = fid.read(1)
-        array = np.fromfile(fid, np.float32)
-    array = array.reshape((width, height, channels), order="F")
-    return np.transpose(array, (1, 0, 2)).squeeze()
-
-
-def write_array(array, path):
+        return parse_array_header(fid.read(MAX_HEADER_SIZE))
+
+
+def read_array(path, mmap_mode=None):
+    """
+    see: src/mvs/mat.h
+        void Mat<T>::Read(const std::string& path)
+
+    :param mmap_mode: None to read the array into memory, or a mode of
+        np.memmap, e.g., "r" for a read-only or "c" for a copy-on-write
+        memory-mapped view of the file without reading it upfront.
+    :return: Array of shape (height, width) or (height, width, channels).
+    """
+    with open(path, "rb") as fid:
+        header = parse_array_header(fid.read(MAX_HEADER_SIZE))
+        # The payload is stored channel by channel in row-major order.
+        shape = (header.channels, header.height, header.width)
+        count = header.channels * header.height * header.width
+        if mmap_mode is None or count == 0:
+            fid.seek(header.offset)
+            array = np.fromfile(fid, np.dtype("<f4"), count).reshape(shape)
+        else:
+            array = np.memmap(
+                fid, np.dtype("<f4"), mmap_mode, header.offset, shape
+            )
+    return np.transpose(array, (1, 2, 0)).squeeze()
+
+
+@contextlib.contextmanager
+def open_output_file(path, mode="wb", atomic=False):
+    """Open a file for writing, see open_output_file of read_write_model.py,
+    which is repeated here to keep this script standalone.
+    """
+    if not atomic:
+        with open(path, mode) as fid:
+            yield fid
+        return
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, mode) as fid:
+            yield fid
+            fid.flush()
+            os.fsync(fid.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_array(array, path, atomic=False):
     """
     see: src/mvs/mat.h
         void Mat<T>::Write(const std::string& path)
+
+    :param atomic: Whether to write to a temporary file that replaces the
+        output file only once it is complete.
     """
     assert array.dtype == np.float32
     if len(array.shape) == 2:
         height, width = array.shape
         channels = 1
+        array = array[:, :, np.newaxis]
     elif len(array.shape) == 3:
         height, width, channels = array.shape
     else:
         assert False
 
-    with open(path, "w") as fid:
-        fid.write(str(width) + "&" + str(height) + "&" + str(channels) + "&")
+    with open_output_file(path, "wb", atomic) as fid:
+        fid.write(
+            (
+                str(width) + "&" + str(height) + "&" + str(channels) + "&"
+            ).encode()
+        )
+        # The column-major order of shape (width, height, channels) is the
+        # row-major order of each channel, which is written without copying
+        # the whole array at once.
+        for channel in range(channels):
+            fid.write(
+                np.ascontiguousarray(array[:, :, channel], dtype="<f4").data
+            )
+
+
+def iter_bands(array):
+    """Iterate over bands of rows of a (memory-mapped) array, so that only one
+    band is read into memory at once.
+    """
+    row_size = max(1, array[:1].nbytes)
+    num_rows = max(1, BAND_SIZE // row_size)
+    for start in range(0, array.shape[0], num_rows):
+        yield np.asarray(array[start : start + num_rows])
 
-    with open(path, "ab") as fid:
-        if len(array.shape) == 2:
-            array_trans = np.transpose(array, (1, 0))
-        elif len(array.shape) == 3:
-            array_trans = np.transpose(array, (1, 0, 2))
+
+def valid_pixels(array):
+    # Invalid pixels of COLMAP maps are zero in all channels.
+    if array.ndim == 3:
+        return np.any(array != 0, axis=2)
+    return array != 0
+
+
+def block_average(array, block_size):
+    """Downsample an array by averaging blocks of block_size x block_size
+    pixels, ignoring invalid pixels and reading one band of rows at a time.
+    Incomplete blocks at the right and bottom border are dropped.
+    """
+    height = array.shape[0] // block_size
+    width = array.shape[1] // block_size
+    band_rows = max(
+        block_size,
+        BAND_SIZE // max(1, array[:1].nbytes) // block_size * block_size,
+    )
+    blocks = []
+    for start in range(0, height * block_size, band_rows):
+        band = np.asarray(
+            array[start : min(start + band_rows, height * block_size)],
+            dtype=np.float64,
+        )[:, : width * block_size]
+        valid = valid_pixels(band).astype(np.float64)
+        block_shape = (-1, block_size, width, block_size)
+        counts = valid.reshape(block_shape).sum(axis=(1, 3))
+        if band.ndim == 3:
+            sums = (
+                (band * valid[:, :, np.newaxis])
+                .reshape(block_shape + band.shape[2:])
+                .sum(axis=(1, 3))
+            )
+            counts = counts[:, :, np.newaxis]
         else:
-            assert False
-        data_1d = array_trans.reshape(-1, order="F")
-        data_list = data_1d.tolist()
-        endian_character = "<"
-        format_char_sequence = "".join(["f"] * len(data_list))
-        byte_data = struct.pack(
-            endian_character + format_char_sequence, *data_list
+            sums = (band * valid).reshape(block_shape).sum(axis=(1, 3))
+        blocks.append(sums / np.maximum(counts, 1))
+    if not blocks:
+        return np.zeros((height, width) + array.shape[2:], dtype=np.float32)
+    return np.concatenate(blocks).astype(np.float32)
+
+
+def array_stats(array, percentiles=(5, 50, 95), num_bins=4096):
+    """Compute statistics of the valid pixels of a single-channel array in two
+    streaming passes over bands of rows.
+    :param num_bins: Number of histogram bins between the minimum and maximum
+        value, which bounds the error of the percentiles to one bin width.
+    :return: MapStats, where min, max and percentiles are NaN if no pixel is
+        valid.
+    :raises ValueError: If the array has multiple channels, e.g., a normal map.
+    """
+    if array.ndim != 2:
+        raise ValueError(
+            "Statistics are only computed for single-channel maps such as "
+            "depth maps, got an array of shape {}".format(array.shape)
+        )
+    num_valid = 0
+    min_value = np.inf
+    max_value = -np.inf
+    for band in iter_bands(array):
+        values = band[valid_pixels(band) & np.isfinite(band)]
+        if values.size > 0:
+            num_valid += values.size
+            min_value = min(min_value, values.min())
+            max_value = max(max_value, values.max())
+
+    valid_ratio = num_valid / max(1, array.size)
+    if num_valid == 0:
+        nan_percentiles = np.full(len(percentiles), np.nan)
+        return MapStats(valid_ratio, np.nan, np.nan, nan_percentiles)
+
+    bin_edges = np.linspace(min_value, max_value, num_bins + 1)
+    histogram = np.zeros(num_bins, dtype=np.int64)
+    for band in iter_bands(array):
+        values = band[valid_pixels(band) & np.isfinite(band)]
+        histogram += np.histogram(values, bin_edges)[0]
+    cumulative = np.cumsum(histogram)
+    ranks = np.asarray(percentiles, dtype=np.float64) / 100 * (num_valid - 1)
+    bins = np.searchsorted(cumulative, ranks, side="right")
+    bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    percentile_values = np.clip(bin_centers[bins], min_value, max_value)
+    return MapStats(
+        valid_ratio, float(min_value), float(max_value), percentile_values
+    )
+
+
+class DenseWorkspace:
+    """Access to the depth, normal and confidence maps of a dense workspace.
+
+    Maps are read in a thread pool and can be downsampled from a memory-mapped
+    view of the file, without reading the full-resolution map into memory.
+    """
+
+    def __init__(self, path, input_type="geometric", num_threads=None):
+        """
+        :param path: Path to the dense workspace, which contains the stereo
+            folder.
+        :param input_type: Type of the maps, "geometric" or "photometric".
+        :param num_threads: Number of threads to read maps, by default
+            depending on the number of CPUs.
+        """
+        self.path = path
+        self.input_type = input_type
+        self.num_threads = num_threads
+
+    def map_path(self, image_name, map_type="depth"):
+        return os.path.join(
+            self.path,
+            "stereo",
+            MAP_DIRECTORIES[map_type],
+            "{}.{}.bin".format(image_name, self.input_type),
+        )
+
+    def image_names(self, map_type="depth"):
+        """Enumerate the names of the images with a map of the given type."""
+        map_path = os.path.join(self.path, "stereo", MAP_DIRECTORIES[map_type])
+        suffix = ".{}.bin".format(self.input_type)
+        image_names = []
+        for root, _, file_names in os.walk(map_path):
+            for file_name in file_names:
+                if file_name.endswith(suffix):
+                    image_names.append(
+                        os.path.relpath(
+                            os.path.join(root, file_name[: -len(suffix)]),
+                            map_path,
+                        ).replace(os.sep, "/")
+                    )
+        return sorted(image_names)
+
+    def read_map(self, image_name, map_type="depth", step=1, block_size=1):
+        """Read a map, optionally downsampled.
+        :param step: Stride of the pixels to keep, which only reads the rows
+            of the kept pixels.
+        :param block_size: Size of the blocks of pixels to average, ignoring
+            invalid pixels.
+        """
+        path = self.map_path(image_name, map_type)
+        if step == 1 and block_size == 1:
+            return read_array(path)
+        array = read_array(path, mmap_mode="r")
+        if block_size > 1:
+            array = block_average(array, block_size)
+        return np.array(array[::step, ::step])
+
+    def map_stats(self, image_name, map_type="depth", **kwargs):
+        """Compute the statistics of a map, see array_stats."""
+        return array_stats(
+            read_array(self.map_path(image_name, map_type), mmap_mode="r"),
+            **kwargs
+        )
+
+    def map_executor(self, func, image_names):
+        with concurrent.futures.ThreadPoolExecutor(
+            self.num_threads
+        ) as executor:
+            return dict(zip(image_names, executor.map(func, image_names)))
+
+    def read_maps(
+        self, image_names=None, map_type="depth", step=1, block_size=1
+    ):
+        """Read the maps of many images in parallel, see read_map.
+        :param image_names: Names of the images, by default all images.
+        :return: Dict from image name to map.
+        """
+        if image_names is None:
+            image_names = self.image_names(map_type)
+        return self.map_executor(
+            lambda image_name: self.read_map(
+                image_name, map_type, step, block_size
+            ),
+            image_names,
+        )
+
+    def stats(self, image_names=None, map_type="depth", **kwargs):
+        """Compute the statistics of the maps of many images in parallel.
+        :param map_type: Type of single-channel map, i.e., depth or confidence.
+        :return: Dict from image name to MapStats, see array_stats.
+        """
+        if image_names is None:
+            image_names = self.image_names(map_type)
+        return self.map_executor(
+            lambda image_name: self.map_stats(image_name, map_type, **kwargs),
+            image_names,
         )
-        fid.write(byte_data)
 
 
 def parse_args():
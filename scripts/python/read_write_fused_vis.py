@@ -31,102 +31,241 @@
 
 
 import os
+import array
+import struct
 import collections
 import numpy as np
 import pandas as pd
 from pyntcloud import PyntCloud
 
-from read_write_model import read_next_bytes, write_next_bytes
+from read_write_model import open_output_file, read_file_buffer
 
 
 MeshPoint = collections.namedtuple(
     "MeshingPoint",
     ["position", "color", "normal", "num_visible_images", "visible_image_idxs"],
 )
+FusedPointArrays = collections.namedtuple(
+    "FusedPointArrays",
+    [
+        "positions",
+        "colors",
+        "normals",
+        "visible_image_offsets",
+        "visible_image_idxs",
+    ],
+)
 
 
-def read_fused(path_to_fused_ply, path_to_fused_ply_vis):
-    """
-    see: src/mvs/meshing.cc
-        void ReadDenseReconstruction(const std::string& path
-    """
-    assert os.path.isfile(path_to_fused_ply)
-    assert os.path.isfile(path_to_fused_ply_vis)
+def mesh_points_to_arrays(mesh_points):
+    """Convert a list of MeshPoint tuples to columnar FusedPointArrays."""
+    visible_image_offsets = np.zeros(len(mesh_points) + 1, dtype=np.int64)
+    np.cumsum(
+        [point.num_visible_images for point in mesh_points],
+        out=visible_image_offsets[1:],
+    )
+    return FusedPointArrays(
+        positions=np.asarray([point.position for point in mesh_points]),
+        colors=np.asarray([point.color for point in mesh_points]),
+        normals=np.asarray([point.normal for point in mesh_points]),
+        visible_image_offsets=visible_image_offsets,
+        visible_image_idxs=np.concatenate(
+            [np.zeros(0, dtype=np.uint32)]
+            + [point.visible_image_idxs for point in mesh_points]
+        ).astype(np.uint32),
+    )
 
+
+def arrays_to_mesh_points(fused_point_arrays):
+    """Convert FusedPointArrays to a list of MeshPoint tuples."""
+    offsets = fused_point_arrays.visible_image_offsets
+    visible_image_idxs = fused_point_arrays.visible_image_idxs.astype(np.int64)
+    return list(
+        map(
+            MeshPoint._make,
+            zip(
+                fused_point_arrays.positions,
+                fused_point_arrays.colors,
+                fused_point_arrays.normals,
+                np.diff(offsets).tolist(),
+                np.split(visible_image_idxs, offsets[1:-1]),
+            ),
+        )
+    )
+
+
+def read_fused_ply(path_to_fused_ply):
+    """Read the positions, colors, and normals of a fused.ply file."""
     point_cloud = PyntCloud.from_file(path_to_fused_ply)
     xyz_arr = point_cloud.points.loc[:, ["x", "y", "z"]].to_numpy()
     normal_arr = point_cloud.points.loc[:, ["nx", "ny", "nz"]].to_numpy()
     color_arr = point_cloud.points.loc[:, ["red", "green", "blue"]].to_numpy()
+    return xyz_arr, color_arr, normal_arr
 
-    with open(path_to_fused_ply_vis, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        mesh_points = [0] * num_points
-        for i in range(num_points):
-            num_visible_images = read_next_bytes(fid, 4, "I")[0]
-            visible_image_idxs = read_next_bytes(
-                fid,
-                num_bytes=4 * num_visible_images,
-                format_char_sequence="I" * num_visible_images,
-            )
-            visible_image_idxs = np.array(tuple(map(int, visible_image_idxs)))
-            mesh_point = MeshPoint(
-                position=xyz_arr[i],
-                color=color_arr[i],
-                normal=normal_arr[i],
-                num_visible_images=num_visible_images,
-                visible_image_idxs=visible_image_idxs,
-            )
-            mesh_points[i] = mesh_point
-        return mesh_points
 
+def scan_fused_ply_vis(words, num_points):
+    """Find the positions of the visibility counts in the words of a
+    fused.ply.vis file after its header.
 
-def write_fused_ply(mesh_points, path_to_fused_ply):
-    columns = ["x", "y", "z", "nx", "ny", "nz", "red", "green", "blue"]
-    points_data_frame = pd.DataFrame(
-        np.zeros((len(mesh_points), len(columns))), columns=columns
+    The lists have a variable length, so this is inherently sequential, but it
+    only reads the count of each list.
+
+    :param words: Memoryview of the file as unsigned 32-bit integers.
+    :return: Array of the word positions of the counts and the position after
+        the last list.
+    """
+    count_positions = array.array("q", bytes(8 * num_points))
+    position = 0
+    for i in range(num_points):
+        count_positions[i] = position
+        position += 1 + words[position]
+    return np.frombuffer(count_positions, dtype=np.int64), position
+
+
+def read_fused_ply_vis_arrays(path_to_fused_ply_vis):
+    """Read a fused.ply.vis file in CSR layout.
+
+    see: src/mvs/fusion.cc
+        void WritePointsVisibility(const std::string& path, const std::vector<std::vector<int>>& points_visibility)
+
+    :return: Offsets of the visible images of each point into the array of
+        visible image indices, i.e., point i is visible in the images
+        image_idxs[offsets[i]:offsets[i + 1]].
+    """
+    data = read_file_buffer(path_to_fused_ply_vis)
+    num_points = struct.unpack_from("<Q", data, 0)[0]
+    words = np.frombuffer(data, dtype="<u4", offset=8)
+    with memoryview(data)[8 : 8 + 4 * len(words)] as view:
+        with view.cast("I") as word_view:
+            try:
+                count_positions, end = scan_fused_ply_vis(word_view, num_points)
+            except IndexError:
+                end = None
+    if end != len(words):
+        raise ValueError(
+            "Invalid fused.ply.vis file {}".format(path_to_fused_ply_vis)
+        )
+    offsets = np.zeros(num_points + 1, dtype=np.int64)
+    np.cumsum(words[count_positions], out=offsets[1:])
+    is_image_idx = np.ones(len(words), dtype=bool)
+    is_image_idx[count_positions] = False
+    return offsets, words[is_image_idx].astype(np.uint32)
+
+
+def read_fused_arrays(path_to_fused_ply, path_to_fused_ply_vis):
+    """
+    see: src/mvs/meshing.cc
+        void ReadDenseReconstruction(const std::string& path
+    """
+    assert os.path.isfile(path_to_fused_ply)
+    assert os.path.isfile(path_to_fused_ply_vis)
+
+    positions, colors, normals = read_fused_ply(path_to_fused_ply)
+    offsets, image_idxs = read_fused_ply_vis_arrays(path_to_fused_ply_vis)
+    return FusedPointArrays(
+        positions=positions,
+        colors=colors,
+        normals=normals,
+        visible_image_offsets=offsets,
+        visible_image_idxs=image_idxs,
     )
 
-    positions = np.asarray([point.position for point in mesh_points])
-    normals = np.asarray([point.normal for point in mesh_points])
-    colors = np.asarray([point.color for point in mesh_points])
 
-    points_data_frame.loc[:, ["x", "y", "z"]] = positions
-    points_data_frame.loc[:, ["nx", "ny", "nz"]] = normals
-    points_data_frame.loc[:, ["red", "green", "blue"]] = colors
+def read_fused(path_to_fused_ply, path_to_fused_ply_vis):
+    """
+    see: src/mvs/meshing.cc
+        void ReadDenseReconstruction(const std::string& path
+    """
+    return arrays_to_mesh_points(
+        read_fused_arrays(path_to_fused_ply, path_to_fused_ply_vis)
+    )
 
-    points_data_frame = points_data_frame.astype(
+
+def write_fused_ply_arrays(positions, colors, normals, path_to_fused_ply):
+    points_data_frame = pd.DataFrame(
         {
-            "x": positions.dtype,
-            "y": positions.dtype,
-            "z": positions.dtype,
-            "red": colors.dtype,
-            "green": colors.dtype,
-            "blue": colors.dtype,
-            "nx": normals.dtype,
-            "ny": normals.dtype,
-            "nz": normals.dtype,
+            "x": positions[:, 0],
+            "y": positions[:, 1],
+            "z": positions[:, 2],
+            "nx": normals[:, 0],
+            "ny": normals[:, 1],
+            "nz": normals[:, 2],
+            "red": colors[:, 0],
+            "green": colors[:, 1],
+            "blue": colors[:, 2],
         }
     )
-
     point_cloud = PyntCloud(points_data_frame)
     point_cloud.to_file(path_to_fused_ply)
 
 
+def write_fused_ply(mesh_points, path_to_fused_ply):
+    fused_point_arrays = mesh_points_to_arrays(mesh_points)
+    write_fused_ply_arrays(
+        fused_point_arrays.positions.reshape(-1, 3),
+        fused_point_arrays.colors.reshape(-1, 3),
+        fused_point_arrays.normals.reshape(-1, 3),
+        path_to_fused_ply,
+    )
+
+
+def write_fused_ply_vis_arrays(
+    offsets, image_idxs, path_to_fused_ply_vis, atomic=False
+):
+    """Write a fused.ply.vis file from its CSR layout in a single buffer.
+
+    see: src/mvs/fusion.cc
+        void WritePointsVisibility(const std::string& path, const std::vector<std::vector<int>>& points_visibility)
+
+    :param offsets: Offsets of the visible images of each point, see
+        read_fused_ply_vis_arrays.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    num_points = len(offsets) - 1
+    counts = np.diff(offsets)
+    # The count of point i is followed by its image indices, so it is
+    # preceded by i counts and offsets[i] image indices.
+    count_positions = offsets[:-1] - offsets[0] + np.arange(num_points)
+    words = np.empty(num_points + offsets[-1] - offsets[0], dtype="<u4")
+    is_image_idx = np.ones(len(words), dtype=bool)
+    is_image_idx[count_positions] = False
+    words[count_positions] = counts
+    words[is_image_idx] = image_idxs[offsets[0] : offsets[-1]]
+    with open_output_file(path_to_fused_ply_vis, "wb", atomic) as fid:
+        fid.write(struct.pack("<Q", num_points))
+        fid.write(words.data)
+
+
 def write_fused_ply_vis(mesh_points, path_to_fused_ply_vis):
     """
     see: src/mvs/fusion.cc
         void WritePointsVisibility(const std::string& path, const std::vector<std::vector<int>>& points_visibility)
     """
-    with open(path_to_fused_ply_vis, "wb") as fid:
-        write_next_bytes(fid, len(mesh_points), "Q")
-        for point in mesh_points:
-            write_next_bytes(fid, point.num_visible_images, "I")
-            format_char_sequence = "I" * point.num_visible_images
-            write_next_bytes(
-                fid, [*point.visible_image_idxs], format_char_sequence
-            )
+    fused_point_arrays = mesh_points_to_arrays(mesh_points)
+    write_fused_ply_vis_arrays(
+        fused_point_arrays.visible_image_offsets,
+        fused_point_arrays.visible_image_idxs,
+        path_to_fused_ply_vis,
+    )
+
+
+def write_fused_arrays(
+    fused_point_arrays, path_to_fused_ply, path_to_fused_ply_vis
+):
+    write_fused_ply_arrays(
+        fused_point_arrays.positions,
+        fused_point_arrays.colors,
+        fused_point_arrays.normals,
+        path_to_fused_ply,
+    )
+    write_fused_ply_vis_arrays(
+        fused_point_arrays.visible_image_offsets,
+        fused_point_arrays.visible_image_idxs,
+        path_to_fused_ply_vis,
+    )
 
 
 def write_fused(points, path_to_fused_ply, path_to_fused_ply_vis):
-    write_fused_ply(points, path_to_fused_ply)
-    write_fused_ply_vis(points, path_to_fused_ply_vis)
+    write_fused_arrays(
+        mesh_points_to_arrays(points), path_to_fused_ply, path_to_fused_ply_vis
+    )
@@ -29,7 +29,13 @@
 
 
 import os
+import mmap
+import itertools
+import array
 import collections
+import collections.abc
+import concurrent.futures
+import contextlib
 import numpy as np
 import struct
 import argparse
@@ -54,6 +60,51 @@ class Image(BaseImage):
         return qvec2rotmat(self.qvec)
 
 
+# Columnar counterparts of the per-object tuples above. The poses are stored
+# as (N, 7) arrays of [QW, QX, QY, QZ, TX, TY, TZ] and the variable-length 2D
+# points and tracks in CSR form, i.e., the entries of the i-th image or point
+# are in the range [offsets[i], offsets[i + 1]) of the flat arrays. Colors and
+# tracks keep the uint8 and int32 types of the binary format, while the tuples
+# created from the arrays use int64 like the per-record readers.
+ImageArrays = collections.namedtuple(
+    "ImageArrays",
+    [
+        "ids",
+        "poses",
+        "camera_ids",
+        "names",
+        "point2D_offsets",
+        "xys",
+        "point3D_ids",
+    ],
+)
+Point3DArrays = collections.namedtuple(
+    "Point3DArrays",
+    [
+        "ids",
+        "xyz",
+        "rgb",
+        "errors",
+        "track_offsets",
+        "image_ids",
+        "point2D_idxs",
+    ],
+)
+
+# Summary of a model folder obtained by probe_model.
+ModelProbe = collections.namedtuple(
+    "ModelProbe",
+    [
+        "path",
+        "format",
+        "num_cameras",
+        "num_images",
+        "num_points3D",
+        "num_bytes",
+    ],
+)
+
+
 CAMERA_MODELS = {
     CameraModel(model_id=0, model_name="SIMPLE_PINHOLE", num_params=3),
     CameraModel(model_id=1, model_name="PINHOLE", num_params=4),
@@ -74,6 +125,40 @@ CAMERA_MODEL_NAMES = dict(
     [(camera_model.model_name, camera_model) for camera_model in CAMERA_MODELS]
 )
 
+# Fixed-size part of a record in images.bin: IMAGE_ID, QVEC, TVEC, CAMERA_ID.
+IMAGE_PROPERTIES_STRUCT = struct.Struct("<idddddddi")
+IMAGE_PROPERTIES_DTYPE = np.dtype(
+    [
+        ("id", "<i4"),
+        ("qvec", "<f8", (4,)),
+        ("tvec", "<f8", (3,)),
+        ("camera_id", "<i4"),
+    ]
+)
+# A single 2D point record in images.bin: X, Y, POINT3D_ID.
+POINT2D_DTYPE = np.dtype([("xy", "<f8", (2,)), ("point3D_id", "<i8")])
+# Fixed-size part of a record in points3D.bin, followed by the track.
+POINT3D_PROPERTIES_DTYPE = np.dtype(
+    [
+        ("id", "<u8"),
+        ("xyz", "<f8", (3,)),
+        ("rgb", "u1", (3,)),
+        ("error", "<f8"),
+        ("track_length", "<u8"),
+    ]
+)
+# A single track element record in points3D.bin: IMAGE_ID, POINT2D_IDX.
+TRACK_ELEMENT_DTYPE = np.dtype([("image_id", "<i4"), ("point2D_idx", "<i4")])
+
+# Header of the record index next to a binary model file: magic, size and
+# modification time of the indexed file, and number of records.
+RECORD_INDEX_MAGIC = b"COLMAPIX"
+RECORD_INDEX_HEADER_STRUCT = struct.Struct("<8sQqQ")
+
+# Default number of records per chunk when streaming models.
+IMAGES_CHUNK_SIZE = 100
+POINTS3D_CHUNK_SIZE = 100000
+
 
 def read_next_bytes(fid, num_bytes, format_char_sequence, endian_character="<"):
     """Read and unpack the next bytes from a binary file.
@@ -103,6 +188,208 @@ def write_next_bytes(fid, data, format_char_sequence, endian_character="<"):
     fid.write(bytes)
 
 
+@contextlib.contextmanager
+def open_output_file(path, mode="wb", atomic=False):
+    """Open a model file for writing.
+    :param atomic: Whether to write to a temporary file next to the output file
+        that replaces it only once it is complete, so that readers never see a
+        partially written file, even if writing fails.
+    """
+    if not atomic:
+        with open(path, mode) as fid:
+            yield fid
+        return
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, mode) as fid:
+            yield fid
+            fid.flush()
+            os.fsync(fid.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_file_buffer(path, access="willneed"):
+    """Map a binary file into memory for zero-copy decoding.
+    :param path: Path to the file.
+    :param access: Expected access pattern: "willneed" to read the whole file
+        ahead, "sequential" to stream it once from start to end, or "random"
+        to only read the pages of a few records.
+    :return: Read-only buffer supporting slicing, find and the buffer protocol.
+    """
+    with open(path, "rb") as fid:
+        if os.fstat(fid.fileno()).st_size == 0:
+            return b""
+        data = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+    advice = getattr(mmap, "MADV_" + access.upper(), None)
+    if advice is not None and hasattr(data, "madvise"):
+        data.madvise(advice)
+    return data
+
+
+def release_file_buffer(data, end):
+    """Drop the pages before the byte offset end of a mapped file from the
+    resident memory of the process, e.g., after they have been decoded."""
+    if isinstance(data, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED"):
+        end -= end % mmap.PAGESIZE
+        if end > 0:
+            data.madvise(mmap.MADV_DONTNEED, 0, end)
+
+
+def iter_binary_chunks(path_to_model_file, chunk_size, decode):
+    """Decode a binary model file in chunks of records with bounded memory.
+    :param chunk_size: Maximum number of records per chunk.
+    :param decode: Function (data, offset, num_records) returning the decoded
+        records and the byte offset after them.
+    """
+    data = read_file_buffer(path_to_model_file, access="sequential")
+    num_records = struct.unpack_from("<Q", data, 0)[0]
+    offset = 8
+    for start in range(0, num_records, chunk_size):
+        chunk, offset = decode(
+            data, offset, min(chunk_size, num_records - start)
+        )
+        release_file_buffer(data, offset)
+        yield chunk
+
+
+def iter_chunks_or_records(chunks, chunk_size, arrays_to_records):
+    """Yield the chunks themselves or, if chunk_size is None, their records."""
+    if chunk_size is not None:
+        return chunks
+    return (
+        record
+        for chunk in chunks
+        for record in arrays_to_records(chunk).values()
+    )
+
+
+def parse_text_lines(lines):
+    """Parse the whitespace-separated numbers of many lines at once.
+    :param lines: List of lines, each terminated by a newline except maybe the
+        last one.
+    :return: Array of all numbers as float64 and the count of numbers per line.
+    """
+    text = "".join(lines)
+    data = np.frombuffer(text.encode(), dtype=np.uint8)
+    # Count the numbers per line by the starts of tokens after whitespace.
+    is_space = data <= ord(" ")
+    is_token_start = ~is_space
+    is_token_start[1:] &= is_space[:-1]
+    line_idxs = np.searchsorted(
+        np.flatnonzero(data == ord("\n")), np.flatnonzero(is_token_start)
+    )
+    counts = np.bincount(line_idxs, minlength=len(lines))
+    if len(line_idxs) == 0:
+        return np.zeros(0, dtype=np.float64), counts
+    values = np.fromstring(text, sep=" ")
+    if len(values) != len(line_idxs):
+        raise ValueError("Invalid number in text model")
+    return values, counts
+
+
+def format_text_lines(tokens, line_lengths):
+    """Join string tokens by spaces into lines of the given numbers of tokens.
+    :param tokens: List of strings.
+    :param line_lengths: Number of tokens per line, where zero means an empty
+        line.
+    :return: String of the lines, each terminated by a newline.
+    """
+    # Count the line breaks after each token; multiple lines end after the
+    # same token for empty lines, and index 0 stands for before all tokens.
+    line_ends = np.cumsum(line_lengths, dtype=np.int64)
+    num_breaks = np.bincount(line_ends, minlength=len(tokens) + 1)
+    breaks = np.array(
+        ["\n" * n for n in range(num_breaks.max(initial=0) + 1)], dtype=object
+    )
+    separators = np.full(len(tokens), " ", dtype=object)
+    has_break = num_breaks[1:] > 0
+    separators[has_break] = breaks[num_breaks[1:][has_break]]
+    joined = [None] * (2 * len(tokens))
+    joined[0::2] = tokens
+    joined[1::2] = separators.tolist()
+    return breaks[num_breaks[0]] + "".join(joined)
+
+
+def interleave_tokens(header_tokens, body_tokens, body_offsets):
+    """Interleave fixed-size header tokens with variable-size body tokens.
+    :param header_tokens: Object array of shape (num_lines, num_header_tokens).
+    :param body_tokens: Object array of shape (num_elements, num_elem_tokens).
+    :param body_offsets: CSR offsets of the body elements, starting at 0.
+    :return: Flat list of tokens.
+    """
+    num_lines, header_size = header_tokens.shape
+    element_size = body_tokens.shape[1]
+    tokens = np.empty(header_tokens.size + body_tokens.size, dtype=object)
+    header_starts = (
+        header_size * np.arange(num_lines) + element_size * body_offsets[:-1]
+    )
+    is_header = np.zeros(len(tokens), dtype=bool)
+    is_header[(header_starts[:, None] + np.arange(header_size)).ravel()] = True
+    tokens[is_header] = header_tokens.ravel()
+    tokens[~is_header] = body_tokens.ravel()
+    return tokens.tolist()
+
+
+def format_columns(*columns):
+    """Convert columns of values to an object array of their strings."""
+    num_rows = len(columns[0])
+    tokens = np.empty((num_rows, len(columns)), dtype=object)
+    for i, column in enumerate(columns):
+        tokens[:, i] = list(map(str, np.asarray(column).tolist()))
+    return tokens
+
+
+def gather_records(data, offsets, dtype):
+    """Copy fixed-size records starting at arbitrary byte offsets of a buffer.
+    :param data: Buffer of the file, e.g., as returned by read_file_buffer.
+    :param offsets: Array of byte offsets, which need not be aligned.
+    :param dtype: NumPy (structured) dtype of the records.
+    :return: Array of records.
+    """
+    dtype = np.dtype(dtype)
+    if len(offsets) == 0:
+        return np.empty(0, dtype=dtype)
+    windows = np.lib.stride_tricks.sliding_window_view(
+        np.frombuffer(data, dtype=np.uint8), dtype.itemsize
+    )
+    return windows[offsets].view(dtype).reshape(-1)
+
+
+def scatter_records(buffer, offsets, records):
+    """Inverse of gather_records writing into a uint8 array.
+    :param buffer: Writable 1D uint8 array.
+    :param offsets: Array of byte offsets, which need not be aligned.
+    :param records: Array of records.
+    """
+    if len(offsets) == 0:
+        return
+    itemsize = records.dtype.itemsize
+    windows = np.lib.stride_tricks.sliding_window_view(
+        buffer, itemsize, writeable=True
+    )
+    windows[offsets] = (
+        np.ascontiguousarray(records).view(np.uint8).reshape(-1, itemsize)
+    )
+
+
+def block_element_offsets(block_starts, element_offsets, itemsize):
+    """Compute the byte offsets of elements stored in contiguous blocks.
+    :param block_starts: Byte offset of each block.
+    :param element_offsets: CSR offsets of the elements of the blocks.
+    :param itemsize: Size of an element in bytes.
+    :return: Byte offset of each element.
+    """
+    offsets = np.repeat(
+        block_starts - itemsize * element_offsets[:-1],
+        np.diff(element_offsets),
+    )
+    offsets += itemsize * np.arange(element_offsets[0], element_offsets[-1])
+    return offsets
+
+
 def read_cameras_text(path):
     """
     see: src/colmap/scene/reconstruction.cc
@@ -168,7 +455,7 @@ def read_cameras_binary(path_to_model_file):
     return cameras
 
 
-def write_cameras_text(cameras, path):
+def write_cameras_text(cameras, path, atomic=False):
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::WriteCamerasText(const std::string& path)
@@ -179,7 +466,7 @@ def write_cameras_text(cameras, path):
         + "#   CAMERA_ID, MODEL, WIDTH, HEIGHT, PARAMS[]\n"
         + "# Number of cameras: {}\n".format(len(cameras))
     )
-    with open(path, "w") as fid:
+    with open_output_file(path, "w", atomic) as fid:
         fid.write(HEADER)
         for _, cam in cameras.items():
             to_write = [cam.id, cam.model, cam.width, cam.height, *cam.params]
@@ -187,20 +474,21 @@ def write_cameras_text(cameras, path):
             fid.write(line + "\n")
 
 
-def write_cameras_binary(cameras, path_to_model_file):
+def write_cameras_binary(cameras, path_to_model_file, atomic=False):
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::WriteCamerasBinary(const std::string& path)
         void Reconstruction::ReadCamerasBinary(const std::string& path)
     """
-    with open(path_to_model_file, "wb") as fid:
-        write_next_bytes(fid, len(cameras), "Q")
-        for _, cam in cameras.items():
-            model_id = CAMERA_MODEL_NAMES[cam.model].model_id
-            camera_properties = [cam.id, model_id, cam.width, cam.height]
-            write_next_bytes(fid, camera_properties, "iiQQ")
-            for p in cam.params:
-                write_next_bytes(fid, float(p), "d")
+    data = [struct.pack("<Q", len(cameras))]
+    for _, cam in cameras.items():
+        model_id = CAMERA_MODEL_NAMES[cam.model].model_id
+        data.append(
+            struct.pack("<iiQQ", cam.id, model_id, cam.width, cam.height)
+        )
+        data.append(np.asarray(cam.params, dtype="<f8").tobytes())
+    with open_output_file(path_to_model_file, "wb", atomic) as fid:
+        fid.write(b"".join(data))
     return cameras
 
 
@@ -210,38 +498,93 @@ def read_images_text(path):
         void Reconstruction::ReadImagesText(const std::string& path)
         void Reconstruction::WriteImagesText(const std::string& path)
     """
-    images = {}
-    with open(path, "r") as fid:
-        while True:
-            line = fid.readline()
-            if not line:
-                break
-            line = line.strip()
-            if len(line) > 0 and line[0] != "#":
-                elems = line.split()
-                image_id = int(elems[0])
-                qvec = np.array(tuple(map(float, elems[1:5])))
-                tvec = np.array(tuple(map(float, elems[5:8])))
-                camera_id = int(elems[8])
-                image_name = elems[9]
-                elems = fid.readline().split()
-                xys = np.column_stack(
-                    [
-                        tuple(map(float, elems[0::3])),
-                        tuple(map(float, elems[1::3])),
-                    ]
-                )
-                point3D_ids = np.array(tuple(map(int, elems[2::3])))
-                images[image_id] = Image(
-                    id=image_id,
-                    qvec=qvec,
-                    tvec=tvec,
-                    camera_id=camera_id,
-                    name=image_name,
-                    xys=xys,
-                    point3D_ids=point3D_ids,
-                )
-    return images
+    return arrays_to_images(read_images_text_arrays(path))
+
+
+def scan_images_binary(data, offset, num_images):
+    """Find the ids and byte offsets of consecutive records in an images.bin
+    buffer without decoding them.
+    :return: Arrays of image ids and record offsets, and the byte offset after
+        the records.
+    """
+    image_ids = array.array("q", bytes(8 * num_images))
+    record_offsets = array.array("q", bytes(8 * num_images))
+    unpack_image_id = struct.Struct("<i").unpack_from
+    unpack_num_points2D = struct.Struct("<Q").unpack_from
+    for i in range(num_images):
+        record_offsets[i] = offset
+        image_ids[i] = unpack_image_id(data, offset)[0]
+        name_end = data.find(b"\x00", offset + IMAGE_PROPERTIES_STRUCT.size)
+        num_points = unpack_num_points2D(data, name_end + 1)[0]
+        offset = name_end + 9 + POINT2D_DTYPE.itemsize * num_points
+    return (
+        np.frombuffer(image_ids, dtype=np.int64),
+        np.frombuffer(record_offsets, dtype=np.int64),
+        offset,
+    )
+
+
+def decode_images_binary(data, offset, num_images):
+    """Decode consecutive records of an images.bin buffer.
+    :param data: Buffer of the file, e.g., as returned by read_file_buffer.
+    :param offset: Byte offset of the first record.
+    :param num_images: Number of records to decode.
+    :return: ImageArrays of the records and the byte offset after them.
+    """
+    # First pass: scan the variable-length records once to collect the
+    # fixed-size image properties and the byte ranges of their 2D points.
+    headers = []
+    names = []
+    points2D_offsets = []
+    num_points2D = []
+    unpack_image_properties = IMAGE_PROPERTIES_STRUCT.unpack_from
+    unpack_num_points2D = struct.Struct("<Q").unpack_from
+    for _ in range(num_images):
+        headers.append(unpack_image_properties(data, offset))
+        name_start = offset + IMAGE_PROPERTIES_STRUCT.size
+        name_end = data.find(b"\x00", name_start)  # look for the ASCII 0 entry
+        names.append(data[name_start:name_end].decode("utf-8"))
+        num_points = unpack_num_points2D(data, name_end + 1)[0]
+        points2D_offsets.append(name_end + 9)
+        num_points2D.append(num_points)
+        offset = name_end + 9 + POINT2D_DTYPE.itemsize * num_points
+
+    # Second pass: decode all 2D points into one shared array, of which the
+    # individual images hold views.
+    points2D_starts = [0]
+    for num_points in num_points2D:
+        points2D_starts.append(points2D_starts[-1] + num_points)
+    points2D = np.empty(points2D_starts[-1], dtype=POINT2D_DTYPE)
+    for i in range(num_images):
+        points2D[points2D_starts[i] : points2D_starts[i + 1]] = np.frombuffer(
+            data,
+            dtype=POINT2D_DTYPE,
+            count=num_points2D[i],
+            offset=points2D_offsets[i],
+        )
+    image_arrays = ImageArrays(
+        ids=np.array([header[0] for header in headers], dtype=np.int32),
+        poses=np.array(
+            [header[1:8] for header in headers], dtype=np.float64
+        ).reshape(-1, 7),
+        camera_ids=np.array([header[8] for header in headers], dtype=np.int32),
+        names=names,
+        point2D_offsets=np.array(points2D_starts, dtype=np.int64),
+        xys=points2D["xy"],
+        point3D_ids=points2D["point3D_id"],
+    )
+    return image_arrays, offset
+
+
+def read_images_binary_arrays(path_to_model_file):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadImagesBinary(const std::string& path)
+        void Reconstruction::WriteImagesBinary(const std::string& path)
+    """
+    data = read_file_buffer(path_to_model_file)
+    num_reg_images = struct.unpack_from("<Q", data, 0)[0]
+    return decode_images_binary(data, 8, num_reg_images)[0]
 
 
 def read_images_binary(path_to_model_file):
@@ -250,109 +593,263 @@ def read_images_binary(path_to_model_file):
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
     """
-    images = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_reg_images):
-            binary_image_properties = read_next_bytes(
-                fid, num_bytes=64, format_char_sequence="idddddddi"
-            )
-            image_id = binary_image_properties[0]
-            qvec = np.array(binary_image_properties[1:5])
-            tvec = np.array(binary_image_properties[5:8])
-            camera_id = binary_image_properties[8]
-            binary_image_name = b""
-            current_char = read_next_bytes(fid, 1, "c")[0]
-            while current_char != b"\x00":  # look for the ASCII 0 entry
-                binary_image_name += current_char
-                current_char = read_next_bytes(fid, 1, "c")[0]
-            image_name = binary_image_name.decode("utf-8")
-            num_points2D = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q"
-            )[0]
-            x_y_id_s = read_next_bytes(
-                fid,
-                num_bytes=24 * num_points2D,
-                format_char_sequence="ddq" * num_points2D,
-            )
-            xys = np.column_stack(
-                [
-                    tuple(map(float, x_y_id_s[0::3])),
-                    tuple(map(float, x_y_id_s[1::3])),
-                ]
-            )
-            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
-            images[image_id] = Image(
-                id=image_id,
-                qvec=qvec,
-                tvec=tvec,
-                camera_id=camera_id,
-                name=image_name,
-                xys=xys,
-                point3D_ids=point3D_ids,
-            )
-    return images
+    return arrays_to_images(read_images_binary_arrays(path_to_model_file))
+
+
+def iter_images_binary(path_to_model_file, chunk_size=None):
+    """Iterate over the images of an images.bin file in bounded memory.
+    :param chunk_size: If None, yield Image tuples one by one. Otherwise,
+        yield ImageArrays chunks of up to chunk_size images.
+    """
+    chunks = iter_binary_chunks(
+        path_to_model_file,
+        chunk_size or IMAGES_CHUNK_SIZE,
+        decode_images_binary,
+    )
+    return iter_chunks_or_records(chunks, chunk_size, arrays_to_images)
+
+
+def encode_images_binary(image_arrays):
+    """Serialize images.bin records in one contiguous buffer.
+    :param image_arrays: ImageArrays of the images.
+    :return: 1D uint8 array with the records, without the leading count.
+    """
+    num_images = len(image_arrays.ids)
+    names = [name.encode("utf-8") + b"\x00" for name in image_arrays.names]
+    name_offsets = np.zeros(num_images + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in names], out=name_offsets[1:])
+    point2D_offsets = np.asarray(image_arrays.point2D_offsets, dtype=np.int64)
+    num_points2D = np.diff(point2D_offsets)
+    record_sizes = (
+        IMAGE_PROPERTIES_DTYPE.itemsize
+        + np.diff(name_offsets)
+        + 8
+        + POINT2D_DTYPE.itemsize * num_points2D
+    )
+    record_offsets = np.cumsum(record_sizes) - record_sizes
+    buffer = np.empty(record_sizes.sum(), dtype=np.uint8)
+
+    # Each record consists of the fixed-size properties, the zero-terminated
+    # name, the number of 2D points, and the 2D points.
+    properties = np.empty(num_images, dtype=IMAGE_PROPERTIES_DTYPE)
+    properties["id"] = image_arrays.ids
+    properties["qvec"] = image_arrays.poses[:, :4]
+    properties["tvec"] = image_arrays.poses[:, 4:]
+    properties["camera_id"] = image_arrays.camera_ids
+    scatter_records(buffer, record_offsets, properties)
+    name_starts = record_offsets + IMAGE_PROPERTIES_DTYPE.itemsize
+    buffer[block_element_offsets(name_starts, name_offsets, 1)] = np.frombuffer(
+        b"".join(names), dtype=np.uint8
+    )
+    num_points2D_starts = name_starts + np.diff(name_offsets)
+    scatter_records(buffer, num_points2D_starts, num_points2D.astype("<u8"))
+    points2D = np.empty(point2D_offsets[-1], dtype=POINT2D_DTYPE)
+    points2D["xy"] = image_arrays.xys
+    points2D["point3D_id"] = image_arrays.point3D_ids
+    # The 2D points of an image are long contiguous blocks, which are faster
+    # to copy one by one than to scatter point by point.
+    points2D_bytes = points2D.view(np.uint8)
+    points2D_starts = (num_points2D_starts + 8).tolist()
+    byte_offsets = (POINT2D_DTYPE.itemsize * point2D_offsets).tolist()
+    for i in range(num_images):
+        num_bytes = byte_offsets[i + 1] - byte_offsets[i]
+        buffer[
+            points2D_starts[i] : points2D_starts[i] + num_bytes
+        ] = points2D_bytes[byte_offsets[i] : byte_offsets[i + 1]]
+    return buffer
+
+
+def write_images_binary_stream(
+    chunks, num_images, path_to_model_file, atomic=False
+):
+    """Write an images.bin file from ImageArrays chunks in bounded memory.
+    :param chunks: Iterable of ImageArrays.
+    :param num_images: Total number of images in all chunks.
+    """
+    with open_output_file(path_to_model_file, "wb", atomic) as fid:
+        write_next_bytes(fid, num_images, "Q")
+        for image_arrays in chunks:
+            fid.write(encode_images_binary(image_arrays).data)
+
+
+def write_images_binary_arrays(image_arrays, path_to_model_file, atomic=False):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadImagesBinary(const std::string& path)
+        void Reconstruction::WriteImagesBinary(const std::string& path)
+    """
+    write_images_binary_stream(
+        [image_arrays], len(image_arrays.ids), path_to_model_file, atomic
+    )
+
+
+def iter_images_text_chunks(path, chunk_size):
+    """Parse an images.txt file into ImageArrays chunks.
 
+    The lines are parsed one by one, which is as fast as parsing a chunk at
+    once, since the conversion of the numbers dominates.
 
-def write_images_text(images, path):
+    :param chunk_size: Maximum number of images per chunk or None to parse the
+        whole file into one chunk.
+    """
+
+    def parse_chunk(image_elems, xys, point3D_ids):
+        point2D_offsets = np.zeros(len(xys) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in point3D_ids], out=point2D_offsets[1:])
+        return ImageArrays(
+            ids=np.array([elems[0] for elems in image_elems], dtype=np.int32),
+            poses=np.array(
+                [elems[1:8] for elems in image_elems], dtype=np.float64
+            ).reshape(-1, 7),
+            camera_ids=np.array(
+                [elems[8] for elems in image_elems], dtype=np.int32
+            ),
+            names=[elems[9] for elems in image_elems],
+            point2D_offsets=point2D_offsets,
+            xys=np.concatenate([np.zeros((0, 2))] + xys),
+            point3D_ids=np.concatenate(
+                [np.zeros(0, dtype=np.int64)] + point3D_ids
+            ),
+        )
+
+    with open(path, "r") as fid:
+        image_elems = []
+        xys = []
+        point3D_ids = []
+        for line in fid:
+            line = line.strip()
+            if len(line) > 0 and line[0] != "#":
+                image_elems.append(line.split())
+                elems = next(fid, "").split()
+                if len(elems) % 3 != 0:
+                    raise ValueError("Invalid 2D point line in {}".format(path))
+                xys.append(
+                    np.column_stack(
+                        [
+                            tuple(map(float, elems[0::3])),
+                            tuple(map(float, elems[1::3])),
+                        ]
+                    ).reshape(-1, 2)
+                )
+                point3D_ids.append(
+                    np.array(tuple(map(int, elems[2::3])), dtype=np.int64)
+                )
+                if len(image_elems) == chunk_size:
+                    yield parse_chunk(image_elems, xys, point3D_ids)
+                    image_elems = []
+                    xys = []
+                    point3D_ids = []
+        if len(image_elems) > 0 or chunk_size is None:
+            yield parse_chunk(image_elems, xys, point3D_ids)
+
+
+def read_images_text_arrays(path):
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadImagesText(const std::string& path)
         void Reconstruction::WriteImagesText(const std::string& path)
     """
-    if len(images) == 0:
+    return next(iter_images_text_chunks(path, None))
+
+
+def iter_images_text(path, chunk_size=None):
+    """Iterate over the images of an images.txt file in bounded memory.
+    :param chunk_size: If None, yield Image tuples one by one. Otherwise,
+        yield ImageArrays chunks of up to chunk_size images.
+    """
+    chunks = iter_images_text_chunks(path, chunk_size or IMAGES_CHUNK_SIZE)
+    return iter_chunks_or_records(chunks, chunk_size, arrays_to_images)
+
+
+def format_images_text(image_arrays, start, end):
+    """Format the images in the rows [start, end) as lines of images.txt."""
+    offsets = image_arrays.point2D_offsets[start : end + 1]
+    poses = image_arrays.poses[start:end]
+    header_tokens = format_columns(
+        image_arrays.ids[start:end],
+        *poses.T,
+        image_arrays.camera_ids[start:end],
+        image_arrays.names[start:end],
+    )
+    xys = image_arrays.xys[offsets[0] : offsets[-1]]
+    point_tokens = format_columns(
+        xys[:, 0],
+        xys[:, 1],
+        image_arrays.point3D_ids[offsets[0] : offsets[-1]],
+    )
+    line_lengths = np.empty((end - start, 2), dtype=np.int64)
+    line_lengths[:, 0] = header_tokens.shape[1]
+    line_lengths[:, 1] = 3 * np.diff(offsets)
+    return format_text_lines(
+        interleave_tokens(header_tokens, point_tokens, offsets - offsets[0]),
+        line_lengths.ravel(),
+    )
+
+
+def write_images_text_stream(
+    chunks, num_images, num_observations, path, atomic=False
+):
+    """Write an images.txt file from ImageArrays chunks in bounded memory.
+    :param chunks: Iterable of ImageArrays.
+    :param num_images: Total number of images in all chunks.
+    :param num_observations: Total number of 2D points in all chunks.
+    """
+    if num_images == 0:
         mean_observations = 0
     else:
-        mean_observations = sum(
-            (len(img.point3D_ids) for _, img in images.items())
-        ) / len(images)
+        mean_observations = num_observations / num_images
     HEADER = (
         "# Image list with two lines of data per image:\n"
         + "#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, NAME\n"
         + "#   POINTS2D[] as (X, Y, POINT3D_ID)\n"
         + "# Number of images: {}, mean observations per image: {}\n".format(
-            len(images), mean_observations
+            num_images, mean_observations
         )
     )
 
-    with open(path, "w") as fid:
+    with open_output_file(path, "w", atomic) as fid:
         fid.write(HEADER)
-        for _, img in images.items():
-            image_header = [
-                img.id,
-                *img.qvec,
-                *img.tvec,
-                img.camera_id,
-                img.name,
-            ]
-            first_line = " ".join(map(str, image_header))
-            fid.write(first_line + "\n")
+        for image_arrays in chunks:
+            # Format large chunks in parts to bound the size of the strings.
+            num_chunk_images = len(image_arrays.ids)
+            for start in range(0, num_chunk_images, IMAGES_CHUNK_SIZE):
+                end = min(start + IMAGES_CHUNK_SIZE, num_chunk_images)
+                fid.write(format_images_text(image_arrays, start, end))
 
-            points_strings = []
-            for xy, point3D_id in zip(img.xys, img.point3D_ids):
-                points_strings.append(" ".join(map(str, [*xy, point3D_id])))
-            fid.write(" ".join(points_strings) + "\n")
 
+def write_images_text_arrays(image_arrays, path, atomic=False):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadImagesText(const std::string& path)
+        void Reconstruction::WriteImagesText(const std::string& path)
+    """
+    write_images_text_stream(
+        [image_arrays],
+        len(image_arrays.ids),
+        len(image_arrays.point3D_ids),
+        path,
+        atomic,
+    )
 
-def write_images_binary(images, path_to_model_file):
+
+def write_images_text(images, path, atomic=False):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadImagesText(const std::string& path)
+        void Reconstruction::WriteImagesText(const std::string& path)
+    """
+    write_images_text_arrays(images_to_arrays(images), path, atomic)
+
+
+def write_images_binary(images, path_to_model_file, atomic=False):
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
     """
-    with open(path_to_model_file, "wb") as fid:
-        write_next_bytes(fid, len(images), "Q")
-        for _, img in images.items():
-            write_next_bytes(fid, img.id, "i")
-            write_next_bytes(fid, img.qvec.tolist(), "dddd")
-            write_next_bytes(fid, img.tvec.tolist(), "ddd")
-            write_next_bytes(fid, img.camera_id, "i")
-            for char in img.name:
-                write_next_bytes(fid, char.encode("utf-8"), "c")
-            write_next_bytes(fid, b"\x00", "c")
-            write_next_bytes(fid, len(img.point3D_ids), "Q")
-            for xy, p3d_id in zip(img.xys, img.point3D_ids):
-                write_next_bytes(fid, [*xy, p3d_id], "ddq")
+    write_images_binary_arrays(
+        images_to_arrays(images), path_to_model_file, atomic
+    )
 
 
 def read_points3D_text(path):
@@ -361,30 +858,7 @@ def read_points3D_text(path):
         void Reconstruction::ReadPoints3DText(const std::string& path)
         void Reconstruction::WritePoints3DText(const std::string& path)
     """
-    points3D = {}
-    with open(path, "r") as fid:
-        while True:
-            line = fid.readline()
-            if not line:
-                break
-            line = line.strip()
-            if len(line) > 0 and line[0] != "#":
-                elems = line.split()
-                point3D_id = int(elems[0])
-                xyz = np.array(tuple(map(float, elems[1:4])))
-                rgb = np.array(tuple(map(int, elems[4:7])))
-                error = float(elems[7])
-                image_ids = np.array(tuple(map(int, elems[8::2])))
-                point2D_idxs = np.array(tuple(map(int, elems[9::2])))
-                points3D[point3D_id] = Point3D(
-                    id=point3D_id,
-                    xyz=xyz,
-                    rgb=rgb,
-                    error=error,
-                    image_ids=image_ids,
-                    point2D_idxs=point2D_idxs,
-                )
-    return points3D
+    return arrays_to_points3D(read_points3D_text_arrays(path))
 
 
 def read_points3D_binary(path_to_model_file):
@@ -393,86 +867,726 @@ def read_points3D_binary(path_to_model_file):
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
-    points3D = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_points):
-            binary_point_line_properties = read_next_bytes(
-                fid, num_bytes=43, format_char_sequence="QdddBBBd"
-            )
-            point3D_id = binary_point_line_properties[0]
-            xyz = np.array(binary_point_line_properties[1:4])
-            rgb = np.array(binary_point_line_properties[4:7])
-            error = np.array(binary_point_line_properties[7])
-            track_length = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q"
-            )[0]
-            track_elems = read_next_bytes(
-                fid,
-                num_bytes=8 * track_length,
-                format_char_sequence="ii" * track_length,
-            )
-            image_ids = np.array(tuple(map(int, track_elems[0::2])))
-            point2D_idxs = np.array(tuple(map(int, track_elems[1::2])))
-            points3D[point3D_id] = Point3D(
-                id=point3D_id,
-                xyz=xyz,
-                rgb=rgb,
-                error=error,
-                image_ids=image_ids,
-                point2D_idxs=point2D_idxs,
-            )
-    return points3D
+    return arrays_to_points3D(read_points3D_binary_arrays(path_to_model_file))
+
+
+def write_points3D_text(points3D, path, atomic=False):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadPoints3DText(const std::string& path)
+        void Reconstruction::WritePoints3DText(const std::string& path)
+    """
+    write_points3D_text_arrays(points3D_to_arrays(points3D), path, atomic)
+
+
+def write_points3D_binary(points3D, path_to_model_file, atomic=False):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadPoints3DBinary(const std::string& path)
+        void Reconstruction::WritePoints3DBinary(const std::string& path)
+    """
+    write_points3D_binary_arrays(
+        points3D_to_arrays(points3D), path_to_model_file, atomic
+    )
+
+
+def scan_points3D_binary(data, offset, num_points):
+    """Find the byte offsets of consecutive records in a points3D.bin buffer.
+
+    The records have a variable length, so this is inherently sequential, but
+    it only unpacks the track length of each record.
+
+    :return: Array of record offsets and the byte offset after the records.
+    """
+    track_length_offset = POINT3D_PROPERTIES_DTYPE.fields["track_length"][1]
+    unpack_track_length = struct.Struct("<Q").unpack_from
+    record_offsets = array.array("q", bytes(8 * num_points))
+    for i in range(num_points):
+        record_offsets[i] = offset
+        (track_length,) = unpack_track_length(
+            data, offset + track_length_offset
+        )
+        offset += (
+            POINT3D_PROPERTIES_DTYPE.itemsize
+            + TRACK_ELEMENT_DTYPE.itemsize * track_length
+        )
+    return np.frombuffer(record_offsets, dtype=np.int64), offset
+
+
+def scan_points3D_binary_ids(data, offset, num_points):
+    """Like scan_points3D_binary but also returning the ids of the points."""
+    record_offsets, offset = scan_points3D_binary(data, offset, num_points)
+    properties = gather_records(data, record_offsets, POINT3D_PROPERTIES_DTYPE)
+    return properties["id"].astype(np.int64), record_offsets, offset
+
+
+def decode_points3D_binary(data, record_offsets, chunk_size=1000000):
+    """Decode the points3D.bin records at the given byte offsets.
+    :param data: Buffer of the file, e.g., as returned by read_file_buffer.
+    :param record_offsets: Byte offsets of the records to decode.
+    :param chunk_size: Number of points per chunk to bound temporary memory.
+    :return: Point3DArrays of the records.
+    """
+    properties = gather_records(data, record_offsets, POINT3D_PROPERTIES_DTYPE)
+    track_offsets = np.zeros(len(properties) + 1, dtype=np.int64)
+    np.cumsum(properties["track_length"], out=track_offsets[1:])
+    tracks = np.empty(track_offsets[-1], dtype=TRACK_ELEMENT_DTYPE)
+    # The track element j of point i starts at the byte
+    # record_offsets[i] + properties_size + 8 * (j - track_offsets[i]).
+    track_starts = (
+        record_offsets
+        + POINT3D_PROPERTIES_DTYPE.itemsize
+        - TRACK_ELEMENT_DTYPE.itemsize * track_offsets[:-1]
+    )
+    for start in range(0, len(properties), chunk_size):
+        end = min(start + chunk_size, len(properties))
+        begin_elem, end_elem = track_offsets[start], track_offsets[end]
+        elem_offsets = np.repeat(
+            track_starts[start:end], np.diff(track_offsets[start : end + 1])
+        )
+        elem_offsets += TRACK_ELEMENT_DTYPE.itemsize * np.arange(
+            begin_elem, end_elem
+        )
+        tracks[begin_elem:end_elem] = gather_records(
+            data, elem_offsets, TRACK_ELEMENT_DTYPE
+        )
+    return Point3DArrays(
+        ids=properties["id"].astype(np.int64),
+        xyz=properties["xyz"],
+        rgb=properties["rgb"],
+        errors=properties["error"],
+        track_offsets=track_offsets,
+        image_ids=tracks["image_id"],
+        point2D_idxs=tracks["point2D_idx"],
+    )
+
+
+def read_points3D_binary_arrays(path_to_model_file):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadPoints3DBinary(const std::string& path)
+        void Reconstruction::WritePoints3DBinary(const std::string& path)
+    """
+    # First pass: scan the track lengths to locate the records. Second pass:
+    # decode all fixed-size properties and track elements at once.
+    data = read_file_buffer(path_to_model_file)
+    num_points = struct.unpack_from("<Q", data, 0)[0]
+    record_offsets, _ = scan_points3D_binary(data, 8, num_points)
+    return decode_points3D_binary(data, record_offsets)
+
+
+def iter_points3D_binary(path_to_model_file, chunk_size=None):
+    """Iterate over the points of a points3D.bin file in bounded memory.
+    :param chunk_size: If None, yield Point3D tuples one by one. Otherwise,
+        yield Point3DArrays chunks of up to chunk_size points.
+    """
+
+    def decode(data, offset, num_points):
+        record_offsets, offset = scan_points3D_binary(data, offset, num_points)
+        return decode_points3D_binary(data, record_offsets), offset
+
+    chunks = iter_binary_chunks(
+        path_to_model_file, chunk_size or POINTS3D_CHUNK_SIZE, decode
+    )
+    return iter_chunks_or_records(chunks, chunk_size, arrays_to_points3D)
+
+
+def encode_points3D_binary(point3D_arrays):
+    """Serialize points3D.bin records in one contiguous buffer.
+    :param point3D_arrays: Point3DArrays of the points.
+    :return: 1D uint8 array with the records, without the leading count.
+    """
+    num_points = len(point3D_arrays.ids)
+    track_offsets = np.asarray(point3D_arrays.track_offsets, dtype=np.int64)
+    track_lengths = np.diff(track_offsets)
+    properties = np.empty(num_points, dtype=POINT3D_PROPERTIES_DTYPE)
+    properties["id"] = point3D_arrays.ids
+    properties["xyz"] = point3D_arrays.xyz
+    properties["rgb"] = point3D_arrays.rgb
+    properties["error"] = point3D_arrays.errors
+    properties["track_length"] = track_lengths
+    tracks = np.empty(track_offsets[-1], dtype=TRACK_ELEMENT_DTYPE)
+    tracks["image_id"] = point3D_arrays.image_ids
+    tracks["point2D_idx"] = point3D_arrays.point2D_idxs
+
+    record_offsets = (
+        POINT3D_PROPERTIES_DTYPE.itemsize * np.arange(num_points)
+        + TRACK_ELEMENT_DTYPE.itemsize * track_offsets[:-1]
+    )
+    buffer = np.empty(
+        POINT3D_PROPERTIES_DTYPE.itemsize * num_points
+        + TRACK_ELEMENT_DTYPE.itemsize * len(tracks),
+        dtype=np.uint8,
+    )
+    scatter_records(buffer, record_offsets, properties)
+    # Each track is contiguous and directly follows the fixed-size part.
+    scatter_records(
+        buffer,
+        block_element_offsets(
+            record_offsets + POINT3D_PROPERTIES_DTYPE.itemsize,
+            track_offsets,
+            TRACK_ELEMENT_DTYPE.itemsize,
+        ),
+        tracks,
+    )
+    return buffer
+
+
+def write_points3D_binary_stream(
+    chunks, num_points, path_to_model_file, atomic=False
+):
+    """Write a points3D.bin file from Point3DArrays chunks in bounded memory.
+    :param chunks: Iterable of Point3DArrays.
+    :param num_points: Total number of points in all chunks.
+    """
+    with open_output_file(path_to_model_file, "wb", atomic) as fid:
+        write_next_bytes(fid, num_points, "Q")
+        for point3D_arrays in chunks:
+            fid.write(encode_points3D_binary(point3D_arrays).data)
+
+
+def write_points3D_binary_arrays(
+    point3D_arrays, path_to_model_file, atomic=False
+):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadPoints3DBinary(const std::string& path)
+        void Reconstruction::WritePoints3DBinary(const std::string& path)
+    """
+    write_points3D_binary_stream(
+        [point3D_arrays], len(point3D_arrays.ids), path_to_model_file, atomic
+    )
+
+
+def iter_points3D_text_chunks(path, chunk_size):
+    """Parse a points3D.txt file into Point3DArrays chunks.
 
+    The lines of a chunk are parsed at once and split into the fixed-size
+    point properties and the variable-length tracks.
 
-def write_points3D_text(points3D, path):
+    :param chunk_size: Maximum number of points per chunk or None to parse the
+        whole file into one chunk.
+    """
+    num_properties = 8  # POINT3D_ID, X, Y, Z, R, G, B, ERROR
+
+    def parse_chunk(lines):
+        lines = [line for line in lines if not line.lstrip().startswith("#")]
+        values, counts = parse_text_lines(lines)
+        counts = counts[counts > 0]
+        if np.any(counts < num_properties) or np.any(counts % 2 != 0):
+            raise ValueError("Invalid 3D point line in {}".format(path))
+        line_starts = np.cumsum(counts) - counts
+        is_property = np.zeros(len(values), dtype=bool)
+        is_property[
+            (line_starts[:, None] + np.arange(num_properties)).ravel()
+        ] = True
+        properties = values[is_property].reshape(-1, num_properties)
+        tracks = values[~is_property].astype(np.int32).reshape(-1, 2)
+        track_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum((counts - num_properties) // 2, out=track_offsets[1:])
+        return Point3DArrays(
+            ids=properties[:, 0].astype(np.int64),
+            xyz=properties[:, 1:4].copy(),
+            rgb=properties[:, 4:7].astype(np.uint8),
+            errors=properties[:, 7].copy(),
+            track_offsets=track_offsets,
+            image_ids=tracks[:, 0],
+            point2D_idxs=tracks[:, 1],
+        )
+
+    with open(path, "r") as fid:
+        if chunk_size is None:
+            yield parse_chunk(fid.readlines())
+            return
+        while True:
+            lines = list(itertools.islice(fid, chunk_size))
+            if len(lines) == 0:
+                return
+            point3D_arrays = parse_chunk(lines)
+            if len(point3D_arrays.ids) > 0:
+                yield point3D_arrays
+
+
+def read_points3D_text_arrays(path):
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadPoints3DText(const std::string& path)
         void Reconstruction::WritePoints3DText(const std::string& path)
     """
-    if len(points3D) == 0:
+    return next(iter_points3D_text_chunks(path, None))
+
+
+def iter_points3D_text(path, chunk_size=None):
+    """Iterate over the points of a points3D.txt file in bounded memory.
+    :param chunk_size: If None, yield Point3D tuples one by one. Otherwise,
+        yield Point3DArrays chunks of up to chunk_size points.
+    """
+    chunks = iter_points3D_text_chunks(path, chunk_size or POINTS3D_CHUNK_SIZE)
+    return iter_chunks_or_records(chunks, chunk_size, arrays_to_points3D)
+
+
+def format_points3D_text(point3D_arrays, start, end):
+    """Format the points in the rows [start, end) as lines of points3D.txt."""
+    offsets = point3D_arrays.track_offsets[start : end + 1]
+    xyz = point3D_arrays.xyz[start:end]
+    rgb = point3D_arrays.rgb[start:end]
+    header_tokens = format_columns(
+        point3D_arrays.ids[start:end],
+        *xyz.T,
+        *rgb.T,
+        point3D_arrays.errors[start:end],
+    )
+    track_tokens = format_columns(
+        point3D_arrays.image_ids[offsets[0] : offsets[-1]],
+        point3D_arrays.point2D_idxs[offsets[0] : offsets[-1]],
+    )
+    return format_text_lines(
+        interleave_tokens(header_tokens, track_tokens, offsets - offsets[0]),
+        header_tokens.shape[1] + 2 * np.diff(offsets),
+    )
+
+
+def write_points3D_text_stream(
+    chunks, num_points, num_track_elements, path, atomic=False
+):
+    """Write a points3D.txt file from Point3DArrays chunks in bounded memory.
+    :param chunks: Iterable of Point3DArrays.
+    :param num_points: Total number of points in all chunks.
+    :param num_track_elements: Total track length of all points.
+    """
+    if num_points == 0:
         mean_track_length = 0
     else:
-        mean_track_length = sum(
-            (len(pt.image_ids) for _, pt in points3D.items())
-        ) / len(points3D)
+        mean_track_length = num_track_elements / num_points
     HEADER = (
         "# 3D point list with one line of data per point:\n"
         + "#   POINT3D_ID, X, Y, Z, R, G, B, ERROR, TRACK[] as (IMAGE_ID, POINT2D_IDX)\n"
         + "# Number of points: {}, mean track length: {}\n".format(
-            len(points3D), mean_track_length
+            num_points, mean_track_length
         )
     )
 
-    with open(path, "w") as fid:
+    with open_output_file(path, "w", atomic) as fid:
         fid.write(HEADER)
-        for _, pt in points3D.items():
-            point_header = [pt.id, *pt.xyz, *pt.rgb, pt.error]
-            fid.write(" ".join(map(str, point_header)) + " ")
-            track_strings = []
-            for image_id, point2D in zip(pt.image_ids, pt.point2D_idxs):
-                track_strings.append(" ".join(map(str, [image_id, point2D])))
-            fid.write(" ".join(track_strings) + "\n")
+        for point3D_arrays in chunks:
+            # Format large chunks in parts to bound the size of the strings.
+            num_chunk_points = len(point3D_arrays.ids)
+            for start in range(0, num_chunk_points, POINTS3D_CHUNK_SIZE):
+                end = min(start + POINTS3D_CHUNK_SIZE, num_chunk_points)
+                fid.write(format_points3D_text(point3D_arrays, start, end))
 
 
-def write_points3D_binary(points3D, path_to_model_file):
+def write_points3D_text_arrays(point3D_arrays, path, atomic=False):
     """
     see: src/colmap/scene/reconstruction.cc
-        void Reconstruction::ReadPoints3DBinary(const std::string& path)
-        void Reconstruction::WritePoints3DBinary(const std::string& path)
+        void Reconstruction::ReadPoints3DText(const std::string& path)
+        void Reconstruction::WritePoints3DText(const std::string& path)
+    """
+    write_points3D_text_stream(
+        [point3D_arrays],
+        len(point3D_arrays.ids),
+        len(point3D_arrays.image_ids),
+        path,
+        atomic,
+    )
+
+
+def select_points3D(point3D_arrays, mask):
+    """Select a subset of points with their tracks by a boolean mask."""
+    track_lengths = np.diff(point3D_arrays.track_offsets)
+    track_offsets = np.zeros(np.count_nonzero(mask) + 1, dtype=np.int64)
+    np.cumsum(track_lengths[mask], out=track_offsets[1:])
+    track_mask = np.repeat(mask, track_lengths)
+    return Point3DArrays(
+        ids=point3D_arrays.ids[mask],
+        xyz=point3D_arrays.xyz[mask],
+        rgb=point3D_arrays.rgb[mask],
+        errors=point3D_arrays.errors[mask],
+        track_offsets=track_offsets,
+        image_ids=point3D_arrays.image_ids[track_mask],
+        point2D_idxs=point3D_arrays.point2D_idxs[track_mask],
+    )
+
+
+def images_to_arrays(images):
+    """Convert a dict of Image tuples to columnar ImageArrays."""
+    images = list(images.values())
+    point2D_offsets = np.zeros(len(images) + 1, dtype=np.int64)
+    np.cumsum(
+        [len(image.point3D_ids) for image in images], out=point2D_offsets[1:]
+    )
+    return ImageArrays(
+        ids=np.array([image.id for image in images], dtype=np.int32),
+        poses=np.array(
+            [[*image.qvec, *image.tvec] for image in images], dtype=np.float64
+        ).reshape(-1, 7),
+        camera_ids=np.array(
+            [image.camera_id for image in images], dtype=np.int32
+        ),
+        names=[image.name for image in images],
+        point2D_offsets=point2D_offsets,
+        xys=np.concatenate(
+            [np.zeros((0, 2))]
+            + [np.reshape(image.xys, (-1, 2)) for image in images]
+        ),
+        point3D_ids=np.concatenate(
+            [np.zeros(0, dtype=np.int64)]
+            + [image.point3D_ids for image in images]
+        ).astype(np.int64),
+    )
+
+
+def arrays_to_images(image_arrays):
+    """Convert ImageArrays to a dict of Image tuples viewing into the arrays."""
+    return {
+        int(image_id): image_at_row(image_arrays, row)
+        for row, image_id in enumerate(image_arrays.ids)
+    }
+
+
+def image_at_row(image_arrays, row):
+    """Create the Image tuple of a row, viewing into the arrays."""
+    start, end = image_arrays.point2D_offsets[row : row + 2]
+    return Image(
+        id=int(image_arrays.ids[row]),
+        qvec=image_arrays.poses[row, :4],
+        tvec=image_arrays.poses[row, 4:],
+        camera_id=int(image_arrays.camera_ids[row]),
+        name=image_arrays.names[row],
+        xys=image_arrays.xys[start:end],
+        point3D_ids=image_arrays.point3D_ids[start:end],
+    )
+
+
+def points3D_to_arrays(points3D):
+    """Convert a dict of Point3D tuples to columnar Point3DArrays."""
+    points3D = list(points3D.values())
+    track_offsets = np.zeros(len(points3D) + 1, dtype=np.int64)
+    np.cumsum(
+        [len(point3D.image_ids) for point3D in points3D], out=track_offsets[1:]
+    )
+    return Point3DArrays(
+        ids=np.array([point3D.id for point3D in points3D], dtype=np.int64),
+        xyz=np.array(
+            [point3D.xyz for point3D in points3D], dtype=np.float64
+        ).reshape(-1, 3),
+        rgb=np.array(
+            [point3D.rgb for point3D in points3D], dtype=np.uint8
+        ).reshape(-1, 3),
+        errors=np.array(
+            [point3D.error for point3D in points3D], dtype=np.float64
+        ),
+        track_offsets=track_offsets,
+        image_ids=np.concatenate(
+            [np.zeros(0, dtype=np.int32)]
+            + [point3D.image_ids for point3D in points3D]
+        ).astype(np.int32),
+        point2D_idxs=np.concatenate(
+            [np.zeros(0, dtype=np.int32)]
+            + [point3D.point2D_idxs for point3D in points3D]
+        ).astype(np.int32),
+    )
+
+
+def arrays_to_points3D(point3D_arrays):
+    """Convert Point3DArrays to a dict of Point3D tuples viewing into the
+    arrays. The colors and tracks are converted to int64 as before, see
+    point3D_at_row."""
+    ids = point3D_arrays.ids.tolist()
+    offsets = point3D_arrays.track_offsets.tolist()
+    ranges = list(zip(offsets[:-1], offsets[1:]))
+    rgb = point3D_arrays.rgb.astype(np.int64)
+    all_image_ids = point3D_arrays.image_ids.astype(np.int64)
+    all_point2D_idxs = point3D_arrays.point2D_idxs.astype(np.int64)
+    image_ids = [all_image_ids[s:e] for s, e in ranges]
+    point2D_idxs = [all_point2D_idxs[s:e] for s, e in ranges]
+    return dict(
+        zip(
+            ids,
+            map(
+                Point3D._make,
+                zip(
+                    ids,
+                    point3D_arrays.xyz,
+                    rgb,
+                    point3D_arrays.errors,
+                    image_ids,
+                    point2D_idxs,
+                ),
+            ),
+        )
+    )
+
+
+def point3D_at_row(point3D_arrays, row):
+    """Create the Point3D tuple of a row, viewing into the arrays.
+
+    The uint8 colors and int32 tracks of the arrays are converted to int64,
+    the dtypes of the per-record readers, so that arithmetic on the tuples
+    cannot overflow.
+    """
+    start, end = point3D_arrays.track_offsets[row : row + 2]
+    return Point3D(
+        id=int(point3D_arrays.ids[row]),
+        xyz=point3D_arrays.xyz[row],
+        rgb=point3D_arrays.rgb[row].astype(np.int64),
+        error=point3D_arrays.errors[row],
+        image_ids=point3D_arrays.image_ids[start:end].astype(np.int64),
+        point2D_idxs=point3D_arrays.point2D_idxs[start:end].astype(np.int64),
+    )
+
+
+class RowIndex:
+    """O(1) mapping from (image or point) ids to rows of columnar arrays.
+
+    Uses a dense lookup table if the ids are reasonably compact, which is the
+    case for models written by COLMAP, and falls back to a dict otherwise.
+    """
+
+    def __init__(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        self._table = None
+        self._rows = None
+        if len(ids) == 0 or (
+            ids.min() >= 0 and ids.max() < 4 * len(ids) + 1024
+        ):
+            self._table = np.full(
+                ids.max() + 1 if len(ids) > 0 else 0, -1, dtype=np.int64
+            )
+            self._table[ids] = np.arange(len(ids))
+        else:
+            self._rows = dict(zip(ids.tolist(), range(len(ids))))
+
+    def __getitem__(self, id):
+        if self._table is None:
+            return self._rows[id]
+        if 0 <= id < len(self._table) and self._table[id] >= 0:
+            return int(self._table[id])
+        raise KeyError(id)
+
+    def __contains__(self, id):
+        try:
+            self[id]
+        except KeyError:
+            return False
+        return True
+
+    def rows(self, ids):
+        """Vectorized lookup returning -1 for unknown ids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self._table is None:
+            return np.array(
+                [self._rows.get(id, -1) for id in ids.tolist()], dtype=np.int64
+            ).reshape(ids.shape)
+        valid = (ids >= 0) & (ids < len(self._table))
+        rows = np.full(ids.shape, -1, dtype=np.int64)
+        rows[valid] = self._table[ids[valid]]
+        return rows
+
+
+class LazyMapping(collections.abc.Mapping):
+    """Read-only dict-like view that builds the tuple of an id on access."""
+
+    def __init__(self, arrays, index, at_row):
+        self._arrays = arrays
+        self._index = index
+        self._at_row = at_row
+
+    def __getitem__(self, id):
+        return self._at_row(self._arrays, self._index[id])
+
+    def __iter__(self):
+        return iter(self._arrays.ids.tolist())
+
+    def __len__(self):
+        return len(self._arrays.ids)
+
+
+class ReconstructionArrays:
+    """Columnar (struct-of-arrays) container of a reconstruction.
+
+    The images and 3D points are held in a few flat arrays (see ImageArrays
+    and Point3DArrays) instead of one tuple with small arrays per object,
+    which avoids most of the Python object overhead for large models. The
+    `images` and `points3D` attributes are lazy dict-like views that create
+    the Image and Point3D tuples on access, so that the container can be
+    used in place of the dicts returned by read_model.
+    """
+
+    def __init__(self, cameras, image_arrays, point3D_arrays):
+        self.cameras = cameras
+        self.image_arrays = image_arrays
+        self.point3D_arrays = point3D_arrays
+        self._image_index = None
+        self._point3D_index = None
+
+    @classmethod
+    def from_model(cls, cameras, images, points3D):
+        return cls(
+            cameras, images_to_arrays(images), points3D_to_arrays(points3D)
+        )
+
+    def to_model(self):
+        return (
+            self.cameras,
+            arrays_to_images(self.image_arrays),
+            arrays_to_points3D(self.point3D_arrays),
+        )
+
+    @property
+    def image_index(self):
+        if self._image_index is None:
+            self._image_index = RowIndex(self.image_arrays.ids)
+        return self._image_index
+
+    @property
+    def point3D_index(self):
+        if self._point3D_index is None:
+            self._point3D_index = RowIndex(self.point3D_arrays.ids)
+        return self._point3D_index
+
+    @property
+    def images(self):
+        return LazyMapping(self.image_arrays, self.image_index, image_at_row)
+
+    @property
+    def points3D(self):
+        return LazyMapping(
+            self.point3D_arrays, self.point3D_index, point3D_at_row
+        )
+
+    def image(self, image_id):
+        return image_at_row(self.image_arrays, self.image_index[image_id])
+
+    def point3D(self, point3D_id):
+        return point3D_at_row(
+            self.point3D_arrays, self.point3D_index[point3D_id]
+        )
+
+
+def record_index_path(path_to_model_file):
+    return path_to_model_file + ".idx"
+
+
+def write_record_index(path_to_model_file, file_stat, ids, record_offsets):
+    """Write the sorted record ids and byte offsets of a binary model file to
+    its index file, replacing any existing index atomically.
+    """
+    with open_output_file(
+        record_index_path(path_to_model_file), "wb", atomic=True
+    ) as fid:
+        fid.write(
+            RECORD_INDEX_HEADER_STRUCT.pack(
+                RECORD_INDEX_MAGIC,
+                file_stat.st_size,
+                file_stat.st_mtime_ns,
+                len(ids),
+            )
+        )
+        fid.write(np.ascontiguousarray(ids, dtype="<i8").tobytes())
+        fid.write(np.ascontiguousarray(record_offsets, dtype="<i8").tobytes())
+
+
+def read_record_index(path_to_model_file, file_stat):
+    """Read the index of a binary model file.
+    :return: Sorted record ids and their byte offsets, or None if the index
+        does not exist or is stale, i.e., it was built for a file with a
+        different size or modification time.
+    """
+    try:
+        data = read_file_buffer(
+            record_index_path(path_to_model_file), access="random"
+        )
+        (
+            magic,
+            size,
+            mtime_ns,
+            num_records,
+        ) = RECORD_INDEX_HEADER_STRUCT.unpack_from(data, 0)
+    except (OSError, struct.error):
+        return None
+    if (
+        magic != RECORD_INDEX_MAGIC
+        or size != file_stat.st_size
+        or mtime_ns != file_stat.st_mtime_ns
+        or len(data) != RECORD_INDEX_HEADER_STRUCT.size + 16 * num_records
+    ):
+        return None
+    ids = np.frombuffer(
+        data,
+        dtype="<i8",
+        count=num_records,
+        offset=RECORD_INDEX_HEADER_STRUCT.size,
+    )
+    record_offsets = np.frombuffer(
+        data,
+        dtype="<i8",
+        count=num_records,
+        offset=RECORD_INDEX_HEADER_STRUCT.size + 8 * num_records,
+    )
+    return ids, record_offsets
+
+
+def load_record_index(path_to_model_file, scan):
+    """Read the index of a binary model file or (re)build it if needed.
+
+    The index is cached next to the file, e.g., images.bin.idx, and it is
+    rebuilt whenever the size or modification time of the file changed.
+
+    :param scan: Function (data, offset, num_records) returning the record ids
+        and offsets, and the byte offset after the records.
+    :return: Sorted record ids and their byte offsets.
+    """
+    file_stat = os.stat(path_to_model_file)
+    index = read_record_index(path_to_model_file, file_stat)
+    if index is not None:
+        return index
+    data = read_file_buffer(path_to_model_file, access="sequential")
+    num_records = struct.unpack_from("<Q", data, 0)[0]
+    ids, record_offsets, _ = scan(data, 8, num_records)
+    order = np.argsort(ids, kind="stable")
+    ids, record_offsets = ids[order], record_offsets[order]
+    try:
+        write_record_index(path_to_model_file, file_stat, ids, record_offsets)
+    except OSError:
+        pass  # e.g., a read-only model folder, so just skip the caching
+    return ids, record_offsets
+
+
+def find_record_offset(path_to_model_file, record_id, scan):
+    ids, record_offsets = load_record_index(path_to_model_file, scan)
+    row = np.searchsorted(ids, record_id)
+    if row == len(ids) or ids[row] != record_id:
+        raise KeyError(record_id)
+    return int(record_offsets[row])
+
+
+def read_image(path_to_model_file, image_id):
+    """Read a single image of an images.bin file by seeking to its record.
+    :return: Image tuple.
+    :raises KeyError: If the image does not exist.
     """
-    with open(path_to_model_file, "wb") as fid:
-        write_next_bytes(fid, len(points3D), "Q")
-        for _, pt in points3D.items():
-            write_next_bytes(fid, pt.id, "Q")
-            write_next_bytes(fid, pt.xyz.tolist(), "ddd")
-            write_next_bytes(fid, pt.rgb.tolist(), "BBB")
-            write_next_bytes(fid, pt.error, "d")
-            track_length = pt.image_ids.shape[0]
-            write_next_bytes(fid, track_length, "Q")
-            for image_id, point2D_id in zip(pt.image_ids, pt.point2D_idxs):
-                write_next_bytes(fid, [image_id, point2D_id], "ii")
+    offset = find_record_offset(
+        path_to_model_file, image_id, scan_images_binary
+    )
+    data = read_file_buffer(path_to_model_file, access="random")
+    image_arrays, _ = decode_images_binary(data, offset, 1)
+    return image_at_row(image_arrays, 0)
+
+
+def read_point3D(path_to_model_file, point3D_id):
+    """Read a single point of a points3D.bin file by seeking to its record.
+    :return: Point3D tuple.
+    :raises KeyError: If the point does not exist.
+    """
+    offset = find_record_offset(
+        path_to_model_file, point3D_id, scan_points3D_binary_ids
+    )
+    data = read_file_buffer(path_to_model_file, access="random")
+    point3D_arrays = decode_points3D_binary(
+        data, np.array([offset], dtype=np.int64)
+    )
+    return point3D_at_row(point3D_arrays, 0)
 
 
 def detect_model_format(path, ext):
@@ -487,7 +1601,7 @@ def detect_model_format(path, ext):
     return False
 
 
-def read_model(path, ext=""):
+def find_model_format(path, ext=""):
     # try to detect the extension automatically
     if ext == "":
         if detect_model_format(path, ".bin"):
@@ -496,7 +1610,102 @@ def read_model(path, ext=""):
             ext = ".txt"
         else:
             print("Provide model format: '.bin' or '.txt'")
+    return ext
+
+
+def read_record_count_binary(path_to_model_file):
+    """Read the number of records from the header of a binary model file."""
+    with open(path_to_model_file, "rb") as fid:
+        return read_next_bytes(fid, 8, "Q")[0]
+
+
+def read_record_count_text(path, count_records):
+    """Read the number of records from the header comments of a text model
+    file, e.g., "# Number of images: 42, ...".
+    :param count_records: Function to count the records of the file if the
+        header has no count.
+    """
+    with open(path, "r") as fid:
+        for line in fid:
+            if not line.startswith("#"):
+                break
+            if line.startswith("# Number of "):
+                return int(line.split(":")[1].split(",")[0])
+    return count_records(path)
+
+
+def probe_model(path, ext=""):
+    """Probe a model folder without decoding any records.
+
+    This only reads the record counts in the headers of the files, so it is
+    cheap enough to compare many models, e.g., the sub-models of a mapper run.
+
+    :param ext: Model format or "" to detect it, preferring ".bin".
+    :return: ModelProbe or None if the folder contains no complete model.
+    """
+    for ext in [ext] if ext else [".bin", ".txt"]:
+        paths = [
+            os.path.join(path, name + ext)
+            for name in ["cameras", "images", "points3D"]
+        ]
+        try:
+            num_bytes = sum(os.path.getsize(p) for p in paths)
+        except OSError:
+            continue
+        if ext == ".bin":
+            counts = [read_record_count_binary(p) for p in paths]
+        else:
+            count_records = [
+                lambda p: len(read_cameras_text(p)),
+                lambda p: sum(
+                    len(chunk.ids)
+                    for chunk in iter_images_text(p, IMAGES_CHUNK_SIZE)
+                ),
+                lambda p: sum(
+                    len(chunk.ids)
+                    for chunk in iter_points3D_text(p, POINTS3D_CHUNK_SIZE)
+                ),
+            ]
+            counts = [
+                read_record_count_text(p, count)
+                for p, count in zip(paths, count_records)
+            ]
+        return ModelProbe(path, ext, *counts, num_bytes)
+    return None
+
+
+def find_largest_model(path):
+    """Find the sub-model folder with the most registered images, and then
+    the most points, e.g., among the folders 0, 1, ... written by the mapper.
+    :return: ModelProbe or None if no sub-folder contains a model.
+    """
+    probes = []
+    for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+        if entry.is_dir():
+            probe = probe_model(entry.path)
+            if probe is not None:
+                probes.append(probe)
+    return max(
+        probes,
+        key=lambda probe: (probe.num_images, probe.num_points3D),
+        default=None,
+    )
+
+
+def read_model(path, ext="", workers=1):
+    """
+    :param workers: If greater than one, read the files concurrently, see
+        read_model_arrays.
+    """
+    if workers > 1:
+        reconstruction = read_model_arrays(path, ext, workers=workers)
+        if reconstruction is None:
             return
+        return reconstruction.to_model()
+
+    ext = find_model_format(path, ext)
+    if ext == "":
+        return
 
     if ext == ".txt":
         cameras = read_cameras_text(os.path.join(path, "cameras" + ext))
@@ -509,18 +1718,213 @@ def read_model(path, ext=""):
     return cameras, images, points3D
 
 
-def write_model(cameras, images, points3D, path, ext=".bin"):
+def write_model(cameras, images, points3D, path, ext=".bin", atomic=False):
+    """
+    :param atomic: Whether to replace each file only once it is completely
+        written, see open_output_file.
+    """
     if ext == ".txt":
-        write_cameras_text(cameras, os.path.join(path, "cameras" + ext))
-        write_images_text(images, os.path.join(path, "images" + ext))
-        write_points3D_text(points3D, os.path.join(path, "points3D") + ext)
+        write_cameras_text(cameras, os.path.join(path, "cameras" + ext), atomic)
+        write_images_text(images, os.path.join(path, "images" + ext), atomic)
+        write_points3D_text(
+            points3D, os.path.join(path, "points3D") + ext, atomic
+        )
     else:
-        write_cameras_binary(cameras, os.path.join(path, "cameras" + ext))
-        write_images_binary(images, os.path.join(path, "images" + ext))
-        write_points3D_binary(points3D, os.path.join(path, "points3D") + ext)
+        write_cameras_binary(
+            cameras, os.path.join(path, "cameras" + ext), atomic
+        )
+        write_images_binary(images, os.path.join(path, "images" + ext), atomic)
+        write_points3D_binary(
+            points3D, os.path.join(path, "points3D") + ext, atomic
+        )
     return cameras, images, points3D
 
 
+def read_model_arrays(path, ext="", workers=1):
+    """Read a model directly into a columnar ReconstructionArrays.
+    :param workers: If greater than one, read the three files concurrently in
+        threads, which mainly helps to overlap the I/O on slow storage.
+    """
+    ext = find_model_format(path, ext)
+    if ext == "":
+        return
+
+    cameras_path = os.path.join(path, "cameras" + ext)
+    images_path = os.path.join(path, "images" + ext)
+    points3D_path = os.path.join(path, "points3D") + ext
+    if ext == ".txt":
+        read_cameras = read_cameras_text
+        read_image_arrays = read_images_text_arrays
+        read_point3D_arrays = read_points3D_text_arrays
+    else:
+        read_cameras = read_cameras_binary
+        read_image_arrays = read_images_binary_arrays
+        read_point3D_arrays = read_points3D_binary_arrays
+
+    if workers <= 1:
+        return ReconstructionArrays(
+            read_cameras(cameras_path),
+            read_image_arrays(images_path),
+            read_point3D_arrays(points3D_path),
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(min(workers, 3)) as executor:
+        futures = [
+            executor.submit(read_cameras, cameras_path),
+            executor.submit(read_image_arrays, images_path),
+            executor.submit(read_point3D_arrays, points3D_path),
+        ]
+        return ReconstructionArrays(*(future.result() for future in futures))
+
+
+def write_model_arrays(reconstruction, path, ext=".bin", atomic=False):
+    """Write a columnar ReconstructionArrays without creating any tuples."""
+    if ext == ".txt":
+        write_cameras_text(
+            reconstruction.cameras, os.path.join(path, "cameras" + ext), atomic
+        )
+        write_images_text_arrays(
+            reconstruction.image_arrays,
+            os.path.join(path, "images" + ext),
+            atomic,
+        )
+        write_points3D_text_arrays(
+            reconstruction.point3D_arrays,
+            os.path.join(path, "points3D") + ext,
+            atomic,
+        )
+    else:
+        write_cameras_binary(
+            reconstruction.cameras, os.path.join(path, "cameras" + ext), atomic
+        )
+        write_images_binary_arrays(
+            reconstruction.image_arrays,
+            os.path.join(path, "images" + ext),
+            atomic,
+        )
+        write_points3D_binary_arrays(
+            reconstruction.point3D_arrays,
+            os.path.join(path, "points3D") + ext,
+            atomic,
+        )
+    return reconstruction
+
+
+def filter_model(
+    input_path,
+    output_path,
+    input_ext="",
+    output_ext=".bin",
+    min_track_length=0,
+    max_error=float("inf"),
+):
+    """Stream-copy a model while dropping 3D points by track length or error.
+
+    Only one chunk of images or points is held in memory at a time, plus one
+    byte per 3D point id to remember the kept points. The 2D points of dropped
+    3D points are kept as observations without an associated 3D point.
+
+    :return: Number of written cameras, images, and 3D points.
+    """
+    input_ext = find_model_format(input_path, input_ext)
+    if input_ext == "":
+        return
+
+    def input_file(name):
+        return os.path.join(input_path, name + input_ext)
+
+    def output_file(name):
+        return os.path.join(output_path, name + output_ext)
+
+    if input_ext == ".txt":
+        cameras = read_cameras_text(input_file("cameras"))
+        iter_images, iter_points3D = iter_images_text, iter_points3D_text
+    else:
+        cameras = read_cameras_binary(input_file("cameras"))
+        iter_images, iter_points3D = iter_images_binary, iter_points3D_binary
+
+    def iter_kept_points3D():
+        for point3D_arrays in iter_points3D(
+            input_file("points3D"), chunk_size=POINTS3D_CHUNK_SIZE
+        ):
+            track_lengths = np.diff(point3D_arrays.track_offsets)
+            yield select_points3D(
+                point3D_arrays,
+                (track_lengths >= min_track_length)
+                & (point3D_arrays.errors <= max_error),
+            )
+
+    # First pass over the points to find the kept points, which are needed to
+    # update the images, and the counts for the headers of the output.
+    is_kept = np.zeros(0, dtype=bool)
+    num_points3D = 0
+    num_track_elements = 0
+    for point3D_arrays in iter_kept_points3D():
+        if len(point3D_arrays.ids) > 0:
+            max_point3D_id = point3D_arrays.ids.max()
+            if max_point3D_id >= len(is_kept):
+                is_kept = np.concatenate(
+                    [
+                        is_kept,
+                        np.zeros(
+                            max(max_point3D_id + 1, 2 * len(is_kept))
+                            - len(is_kept),
+                            dtype=bool,
+                        ),
+                    ]
+                )
+            is_kept[point3D_arrays.ids] = True
+        num_points3D += len(point3D_arrays.ids)
+        num_track_elements += len(point3D_arrays.image_ids)
+
+    def iter_updated_images():
+        for image_arrays in iter_images(
+            input_file("images"), chunk_size=IMAGES_CHUNK_SIZE
+        ):
+            point3D_ids = image_arrays.point3D_ids
+            has_point3D = (point3D_ids >= 0) & (point3D_ids < len(is_kept))
+            has_point3D[has_point3D] = is_kept[point3D_ids[has_point3D]]
+            yield image_arrays._replace(
+                point3D_ids=np.where(has_point3D, point3D_ids, -1)
+            )
+
+    if input_ext == ".bin" and output_ext == ".bin":
+        with open(input_file("images"), "rb") as fid:
+            num_images = read_next_bytes(fid, 8, "Q")[0]
+    else:
+        num_images = 0
+        num_observations = 0
+        for image_arrays in iter_images(
+            input_file("images"), chunk_size=IMAGES_CHUNK_SIZE
+        ):
+            num_images += len(image_arrays.ids)
+            num_observations += len(image_arrays.point3D_ids)
+
+    if output_ext == ".txt":
+        write_cameras_text(cameras, output_file("cameras"))
+        write_images_text_stream(
+            iter_updated_images(),
+            num_images,
+            num_observations,
+            output_file("images"),
+        )
+        write_points3D_text_stream(
+            iter_kept_points3D(),
+            num_points3D,
+            num_track_elements,
+            output_file("points3D"),
+        )
+    else:
+        write_cameras_binary(cameras, output_file("cameras"))
+        write_images_binary_stream(
+            iter_updated_images(), num_images, output_file("images")
+        )
+        write_points3D_binary_stream(
+            iter_kept_points3D(), num_points3D, output_file("points3D")
+        )
+    return len(cameras), num_images, num_points3D
+
+
 def qvec2rotmat(qvec):
     return np.array(
         [
@@ -563,6 +1967,97 @@ def rotmat2qvec(R):
     return qvec
 
 
+def qvecs2rotmats(qvecs):
+    """Convert quaternions to rotation matrices like qvec2rotmat.
+    :param qvecs: Array of shape (N, 4) with QW, QX, QY, QZ per row.
+    :return: Array of shape (N, 3, 3).
+    """
+    qvecs = np.asarray(qvecs, dtype=np.float64).reshape(-1, 4)
+    w, x, y, z = qvecs.T
+    R = np.empty((len(qvecs), 3, 3))
+    R[:, 0, 0] = 1 - 2 * y ** 2 - 2 * z ** 2
+    R[:, 0, 1] = 2 * x * y - 2 * w * z
+    R[:, 0, 2] = 2 * z * x + 2 * w * y
+    R[:, 1, 0] = 2 * x * y + 2 * w * z
+    R[:, 1, 1] = 1 - 2 * x ** 2 - 2 * z ** 2
+    R[:, 1, 2] = 2 * y * z - 2 * w * x
+    R[:, 2, 0] = 2 * z * x - 2 * w * y
+    R[:, 2, 1] = 2 * y * z + 2 * w * x
+    R[:, 2, 2] = 1 - 2 * x ** 2 - 2 * y ** 2
+    return R
+
+
+def rotmats2qvecs(Rs):
+    """Convert rotation matrices to quaternions like rotmat2qvec.
+    :param Rs: Array of shape (N, 3, 3).
+    :return: Array of shape (N, 4) with QW, QX, QY, QZ per row and QW >= 0.
+    """
+    Rs = np.asarray(Rs, dtype=np.float64).reshape(-1, 3, 3)
+    Rxx, Ryx, Rzx = Rs[:, 0, 0], Rs[:, 0, 1], Rs[:, 0, 2]
+    Rxy, Ryy, Rzy = Rs[:, 1, 0], Rs[:, 1, 1], Rs[:, 1, 2]
+    Rxz, Ryz, Rzz = Rs[:, 2, 0], Rs[:, 2, 1], Rs[:, 2, 2]
+    K = np.zeros((len(Rs), 4, 4))
+    K[:, 0, 0] = Rxx - Ryy - Rzz
+    K[:, 1, 0] = Ryx + Rxy
+    K[:, 1, 1] = Ryy - Rxx - Rzz
+    K[:, 2, 0] = Rzx + Rxz
+    K[:, 2, 1] = Rzy + Ryz
+    K[:, 2, 2] = Rzz - Rxx - Ryy
+    K[:, 3, 0] = Ryz - Rzy
+    K[:, 3, 1] = Rzx - Rxz
+    K[:, 3, 2] = Rxy - Ryx
+    K[:, 3, 3] = Rxx + Ryy + Rzz
+    K /= 3.0
+    eigvals, eigvecs = np.linalg.eigh(K)
+    qvecs = eigvecs[np.arange(len(Rs)), :, np.argmax(eigvals, axis=1)]
+    qvecs = qvecs[:, [3, 0, 1, 2]]
+    qvecs[qvecs[:, 0] < 0] *= -1
+    return qvecs
+
+
+def invert_poses(qvecs, tvecs):
+    """Invert rigid transformations, e.g., from camera-from-world to
+    world-from-camera poses.
+    :param qvecs: Array of shape (N, 4) with the rotations as quaternions.
+    :param tvecs: Array of shape (N, 3) with the translations.
+    :return: Quaternions and translations of the inverse transformations.
+    """
+    qvecs = np.asarray(qvecs, dtype=np.float64).reshape(-1, 4)
+    inv_qvecs = qvecs * np.array([1.0, -1.0, -1.0, -1.0])
+    inv_tvecs = -(qvecs2rotmats(inv_qvecs) @ np.reshape(tvecs, (-1, 3, 1)))[
+        :, :, 0
+    ]
+    return inv_qvecs, inv_tvecs
+
+
+def camera_centers(qvecs, tvecs):
+    """Compute the projection centers of cameras from their camera-from-world
+    poses, i.e., -R^T * t for each camera.
+    :return: Array of shape (N, 3).
+    """
+    return invert_poses(qvecs, tvecs)[1]
+
+
+def world_from_camera_poses(images):
+    """Get the world-from-camera poses of all images in one call.
+    :param images: Dict of Image tuples, e.g., as returned by read_model, or
+        ImageArrays.
+    :return: Image ids, rotation matrices of shape (N, 3, 3), and translations
+        of shape (N, 3), which are the camera centers.
+    """
+    if isinstance(images, ImageArrays):
+        ids = images.ids
+        qvecs = images.poses[:, :4]
+        tvecs = images.poses[:, 4:]
+    else:
+        ids = np.array([image.id for image in images.values()], dtype=np.int32)
+        qvecs = np.array([image.qvec for image in images.values()])
+        tvecs = np.array([image.tvec for image in images.values()])
+    R = qvecs2rotmats(qvecs).transpose(0, 2, 1)
+    t = -(R @ np.reshape(tvecs, (-1, 3, 1)))[:, :, 0]
+    return ids, R, t
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Read and write COLMAP binary and text models"
@@ -581,24 +2076,53 @@ def main():
         help="output model format",
         default=".txt",
     )
-    args = parser.parse_args()
-
-    cameras, images, points3D = read_model(
-        path=args.input_model, ext=args.input_format
+    parser.add_argument(
+        "--min_track_length",
+        type=int,
+        default=0,
+        help="drop 3D points with a shorter track when writing the output",
+    )
+    parser.add_argument(
+        "--max_error",
+        type=float,
+        default=float("inf"),
+        help="drop 3D points with a larger error when writing the output",
     )
+    parser.add_argument(
+        "--find_largest_model",
+        help="print the sub-folder of this folder with the largest model",
+    )
+    args = parser.parse_args()
 
-    print("num_cameras:", len(cameras))
-    print("num_images:", len(images))
-    print("num_points3D:", len(points3D))
+    if args.find_largest_model is not None:
+        probe = find_largest_model(args.find_largest_model)
+        if probe is not None:
+            print(probe.path)
+        return
 
-    if args.output_model is not None:
-        write_model(
-            cameras,
-            images,
-            points3D,
-            path=args.output_model,
-            ext=args.output_format,
+    if args.output_model is None:
+        cameras, images, points3D = read_model(
+            path=args.input_model, ext=args.input_format
+        )
+        num_cameras, num_images, num_points3D = (
+            len(cameras),
+            len(images),
+            len(points3D),
         )
+    else:
+        # Stream the model to the output in bounded memory.
+        num_cameras, num_images, num_points3D = filter_model(
+            args.input_model,
+            args.output_model,
+            input_ext=args.input_format,
+            output_ext=args.output_format,
+            min_track_length=args.min_track_length,
+            max_error=args.max_error,
+        )
+
+    print("num_cameras:", num_cameras)
+    print("num_images:", num_images)
+    print("num_points3D:", num_points3D)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,489 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import sqlite3
+import numpy as np
+from tempfile import mkdtemp
+
+from database import (
+    COLMAPDatabase,
+    image_ids_to_pair_id,
+    image_ids_to_pair_ids,
+    invert_two_view_geometry,
+    iter_pair_rows,
+    pair_id_to_image_ids,
+    pair_ids_to_image_ids,
+)
+from extract_database_subset import (
+    extract_database_subset,
+    parse_image_id_ranges,
+)
+from merge_databases import merge_databases
+
+
+def synthetic_features(num_images=10, num_keypoints=100, seed=0):
+    rng = np.random.default_rng(seed)
+    keypoints = {
+        image_id: rng.random((num_keypoints, 6), dtype=np.float32)
+        for image_id in range(1, num_images + 1)
+    }
+    descriptors = {
+        image_id: rng.integers(256, size=(num_keypoints, 128), dtype=np.uint8)
+        for image_id in range(1, num_images + 1)
+    }
+    matches = [
+        (
+            image_id1,
+            image_id2,
+            rng.integers(num_keypoints, size=(num_keypoints // 2, 2)),
+        )
+        for image_id1 in range(1, num_images + 1)
+        for image_id2 in range(image_id1 + 1, num_images + 1)
+    ]
+    return keypoints, descriptors, matches
+
+
+def create_database(path, num_images=10):
+    db = COLMAPDatabase.connect(path)
+    db.create_tables()
+    camera_id = db.add_camera(1, 640, 480, [500, 500, 320, 240])
+    for image_id in range(1, num_images + 1):
+        db.add_image("image{}.jpg".format(image_id), camera_id, image_id)
+    db.commit()
+    return db
+
+
+def table_rows(db, table):
+    return db.execute("SELECT * FROM {} ORDER BY 1".format(table)).fetchall()
+
+
+def test_add_many():
+    keypoints, descriptors, matches = synthetic_features()
+    tmpdir = mkdtemp()
+    db = create_database(os.path.join(tmpdir, "database.db"))
+    for image_id in keypoints:
+        db.add_keypoints(image_id, keypoints[image_id])
+        db.add_descriptors(image_id, descriptors[image_id])
+    for image_id1, image_id2, pair_matches in matches:
+        db.add_matches(image_id2, image_id1, pair_matches)
+        db.add_two_view_geometry(image_id1, image_id2, pair_matches)
+    db.commit()
+
+    db_many = create_database(os.path.join(tmpdir, "database_many.db"))
+    assert db_many.add_keypoints_many(keypoints.items()) == len(keypoints)
+    assert db_many.add_descriptors_many(descriptors.items()) == len(keypoints)
+    assert db_many.add_matches_many(
+        (image_id2, image_id1, pair_matches)
+        for image_id1, image_id2, pair_matches in matches
+    ) == len(matches)
+    assert db_many.add_two_view_geometries_many(matches) == len(matches)
+    for table in ["keypoints", "descriptors", "matches", "two_view_geometries"]:
+        assert table_rows(db, table) == table_rows(db_many, table)
+    assert db_many.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    db.close()
+    db_many.close()
+
+
+def test_add_many_rollback():
+    keypoints, _, _ = synthetic_features()
+    db = create_database(os.path.join(mkdtemp(), "database.db"))
+    db.add_keypoints(5, keypoints[5])
+    try:
+        db.add_keypoints_many(keypoints.items())
+        assert False
+    except sqlite3.IntegrityError:
+        pass
+    # The previously added row was committed before the bulk transaction.
+    assert [row[0] for row in table_rows(db, "keypoints")] == [5]
+    db.close()
+
+
+def test_read_features():
+    keypoints, descriptors, matches = synthetic_features()
+    db = create_database(os.path.join(mkdtemp(), "database.db"))
+    db.add_keypoints_many(keypoints.items())
+    db.add_descriptors_many(descriptors.items())
+    db.add_matches_many(matches)
+    rng = np.random.default_rng(0)
+    geometries = {}
+    for image_id1, image_id2, pair_matches in matches:
+        F, E, H = rng.random((3, 3, 3))
+        qvec = rng.random(4)
+        qvec /= np.linalg.norm(qvec)
+        tvec = rng.random(3)
+        geometries[(image_id1, image_id2)] = (F, E, H, qvec, tvec)
+        db.add_two_view_geometry(
+            image_id1, image_id2, pair_matches, F, E, H, qvec, tvec, config=3
+        )
+    db.commit()
+
+    for image_id in keypoints:
+        assert np.array_equal(db.read_keypoints(image_id), keypoints[image_id])
+        assert np.array_equal(
+            db.read_descriptors(image_id), descriptors[image_id]
+        )
+    read_keypoints = db.read_keypoints(1)
+    assert read_keypoints.dtype == np.float32
+    assert not read_keypoints.flags.writeable
+    for image_id1, image_id2, pair_matches in matches:
+        assert np.array_equal(
+            db.read_matches(image_id1, image_id2), pair_matches
+        )
+        assert np.array_equal(
+            db.read_matches(image_id2, image_id1), pair_matches[:, ::-1]
+        )
+        geometry = db.read_two_view_geometry(image_id1, image_id2)
+        assert geometry.config == 3
+        assert np.array_equal(geometry.matches, pair_matches)
+        for value, expected in zip(
+            geometry[2:], geometries[(image_id1, image_id2)]
+        ):
+            assert np.array_equal(value, expected)
+        inverse = db.read_two_view_geometry(image_id2, image_id1)
+        assert np.array_equal(inverse.matches, pair_matches[:, ::-1])
+        assert np.array_equal(inverse.F, geometry.F.T)
+        assert np.allclose(inverse.H @ geometry.H, np.eye(3))
+        # Inverting twice restores the original relative pose.
+        restored = invert_two_view_geometry(inverse)
+        assert np.allclose(restored.qvec, geometry.qvec)
+        assert np.allclose(restored.tvec, geometry.tvec)
+    try:
+        db.read_keypoints(len(keypoints) + 1)
+        assert False
+    except KeyError:
+        pass
+
+    for fetch_size in [1, 3, 1000]:
+        read_keypoints = dict(db.iter_keypoints(fetch_size))
+        assert read_keypoints.keys() == keypoints.keys()
+        for image_id in keypoints:
+            assert np.array_equal(read_keypoints[image_id], keypoints[image_id])
+        read_descriptors = dict(db.iter_descriptors(fetch_size))
+        assert read_descriptors.keys() == descriptors.keys()
+        read_matches = list(db.iter_matches(fetch_size))
+        read_geometries = list(db.iter_two_view_geometries(fetch_size))
+        assert len(read_matches) == len(read_geometries) == len(matches)
+        for (image_id1, image_id2, pair_matches), geometry in zip(
+            read_matches, read_geometries
+        ):
+            assert type(image_id1) is int and type(image_id2) is int
+            assert geometry[:2] == (image_id1, image_id2)
+            assert np.array_equal(pair_matches, geometry[2].matches)
+            assert np.array_equal(
+                geometry[2].F, geometries[(image_id1, image_id2)][0]
+            )
+    db.close()
+
+
+def test_pair_ids():
+    rng = np.random.default_rng(0)
+    image_ids1 = rng.integers(2 ** 31 - 1, size=1000)
+    image_ids2 = rng.integers(2 ** 31 - 1, size=1000)
+    pair_ids = image_ids_to_pair_ids(image_ids1, image_ids2)
+    assert pair_ids.dtype == np.int64
+    assert np.array_equal(
+        pair_ids, image_ids_to_pair_ids(image_ids2, image_ids1)
+    )
+    decoded_ids1, decoded_ids2 = pair_ids_to_image_ids(pair_ids)
+    assert np.array_equal(decoded_ids1, np.minimum(image_ids1, image_ids2))
+    assert np.array_equal(decoded_ids2, np.maximum(image_ids1, image_ids2))
+    for image_id1, image_id2, pair_id in zip(
+        image_ids1.tolist(), image_ids2.tolist(), pair_ids.tolist()
+    ):
+        assert image_ids_to_pair_id(image_id1, image_id2) == pair_id
+        decoded_id1, decoded_id2 = pair_id_to_image_ids(pair_id)
+        assert type(decoded_id1) is int
+        assert (decoded_id1, decoded_id2) == (
+            min(image_id1, image_id2),
+            max(image_id1, image_id2),
+        )
+
+    _, _, matches = synthetic_features()
+    db = create_database(os.path.join(mkdtemp(), "database.db"))
+    db.add_matches_many(matches)
+    for fetch_size in [1, 7, 1000]:
+        cursor = db.execute(
+            "SELECT pair_id, rows FROM matches ORDER BY pair_id"
+        )
+        assert list(iter_pair_rows(cursor, fetch_size)) == [
+            (image_id1, image_id2, len(pair_matches))
+            for image_id1, image_id2, pair_matches in matches
+        ]
+    db.close()
+
+
+def test_optimize_and_stats():
+    keypoints, descriptors, matches = synthetic_features()
+    db = create_database(os.path.join(mkdtemp(), "database.db"))
+    db.add_keypoints_many(keypoints.items())
+    db.add_descriptors_many(descriptors.items())
+    db.add_two_view_geometries_many(matches)
+    db.optimize(vacuum=True, page_size=8192)
+
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.execute("PRAGMA page_size").fetchone()[0] == 8192
+    query_plan = db.execute(
+        "EXPLAIN QUERY PLAN "
+        "SELECT pair_id FROM two_view_geometries WHERE rows>=?",
+        (15,),
+    ).fetchall()
+    assert "index_two_view_geometries_rows" in query_plan[0][-1]
+
+    stats = db.stats()
+    assert stats.page_size == 8192
+    assert stats.tables["keypoints"].num_rows == len(keypoints)
+    assert stats.tables["keypoints"].blob_bytes == sum(
+        array.nbytes for array in keypoints.values()
+    )
+    assert stats.tables["descriptors"].num_bytes >= sum(
+        array.nbytes for array in descriptors.values()
+    )
+    assert stats.tables["two_view_geometries"].num_rows == len(matches)
+    assert stats.tables["cameras"].blob_bytes == 4 * 8
+    assert "index_matches_rows" in stats.indexes
+    db.close()
+
+
+def test_merge_databases():
+    keypoints, descriptors, matches = synthetic_features(num_images=6)
+    tmpdir = mkdtemp()
+    database_paths = []
+    # Three shards with image names 1-4, 3-6 and 5-6, where 3-6 uses a
+    # second camera and its image ids start at 11.
+    for shard, (image_ids, id_offset) in enumerate(
+        [([1, 2, 3, 4], 0), ([3, 4, 5, 6], 10), ([5, 6], 0)]
+    ):
+        database_path = os.path.join(tmpdir, "shard{}.db".format(shard))
+        db = COLMAPDatabase.connect(database_path)
+        db.create_tables()
+        db.add_camera(1, 640, 480, [500, 500, 320, 240])
+        camera_id = db.add_camera(1, 800, 600, [600, 600, 400, 300 + shard])
+        for image_id in image_ids:
+            db.add_image(
+                "image{}.jpg".format(image_id), camera_id, image_id + id_offset
+            )
+            db.add_pose_prior(image_id + id_offset, [image_id, 0, 0])
+            db.add_keypoints(image_id + id_offset, keypoints[image_id])
+            db.add_descriptors(image_id + id_offset, descriptors[image_id])
+        for image_id1, image_id2, pair_matches in matches:
+            if image_id1 in image_ids and image_id2 in image_ids:
+                db.add_matches(
+                    image_id1 + id_offset, image_id2 + id_offset, pair_matches
+                )
+                db.add_two_view_geometry(
+                    image_id1 + id_offset, image_id2 + id_offset, pair_matches
+                )
+        db.commit()
+        db.close()
+        database_paths.append(database_path)
+
+    output_path = os.path.join(tmpdir, "merged.db")
+    assert merge_databases(database_paths, output_path) == (6, 4)
+
+    db = COLMAPDatabase.connect(output_path)
+    image_ids = dict(
+        (name, (image_id, camera_id))
+        for image_id, name, camera_id in db.execute("SELECT * FROM images")
+    )
+    assert sorted(image_ids) == ["image{}.jpg".format(i) for i in range(1, 7)]
+    assert sorted(image_id for image_id, _ in image_ids.values()) == list(
+        range(1, 7)
+    )
+    assert db.execute("SELECT COUNT(*) FROM cameras").fetchone()[0] == 2
+    for image_id in range(1, 7):
+        merged_id, camera_id = image_ids["image{}.jpg".format(image_id)]
+        assert np.array_equal(db.read_keypoints(merged_id), keypoints[image_id])
+        assert np.array_equal(
+            db.read_descriptors(merged_id), descriptors[image_id]
+        )
+        params = db.execute(
+            "SELECT params FROM cameras WHERE camera_id=?", (camera_id,)
+        ).fetchone()[0]
+        # Images 1-4 come from the first shard and 5-6 from the second.
+        shard = 0 if image_id <= 4 else 1
+        assert np.array_equal(
+            np.frombuffer(params, np.float64), [600, 600, 400, 300 + shard]
+        )
+    # The pairs within a shard are merged, the pairs (5, 6) and those across
+    # shards only exist in one shard, and the pairs involving skipped images
+    # of the second shard are dropped.
+    merged_pairs = sorted(
+        (image_id1, image_id2) for image_id1, image_id2, _ in db.iter_matches()
+    )
+    assert merged_pairs == [
+        (1, 2),
+        (1, 3),
+        (1, 4),
+        (2, 3),
+        (2, 4),
+        (3, 4),
+        (5, 6),
+    ]
+    for image_id1, image_id2, pair_matches in matches:
+        if (image_id1, image_id2) in merged_pairs:
+            assert np.array_equal(
+                db.read_matches(image_id1, image_id2), pair_matches
+            )
+            assert np.array_equal(
+                db.read_two_view_geometry(image_id1, image_id2).matches,
+                pair_matches,
+            )
+    db.close()
+
+
+def test_extract_database_subset():
+    keypoints, descriptors, matches = synthetic_features()
+    tmpdir = mkdtemp()
+    database_path = os.path.join(tmpdir, "database.db")
+    db = create_database(database_path)
+    camera_id = db.add_camera(1, 800, 600, [600, 600, 400, 300])
+    db.execute("UPDATE images SET camera_id=? WHERE image_id > 5", (camera_id,))
+    for image_id in keypoints:
+        db.add_pose_prior(image_id, [image_id, -image_id, 0])
+    db.add_keypoints_many(keypoints.items())
+    db.add_descriptors_many(descriptors.items())
+    db.add_matches_many(matches)
+    db.add_two_view_geometries_many(matches)
+    db.close()
+
+    for kwargs, expected_image_ids in [
+        (
+            {"image_names": ["image2.jpg", "image7.jpg", "image9.jpg"]},
+            [2, 7, 9],
+        ),
+        ({"bounding_box": [2.5, -8.5, -1, 8, 0, 1]}, [3, 4, 5, 6, 7, 8]),
+        ({"image_id_ranges": parse_image_id_ranges(["2-3", "8"])}, [2, 3, 8]),
+        (
+            {
+                "bounding_box": [2.5, -8.5, -1, 8, 0, 1],
+                "image_id_ranges": [(1, 4)],
+            },
+            [3, 4],
+        ),
+    ]:
+        output_path = os.path.join(mkdtemp(), "subset.db")
+        assert extract_database_subset(
+            database_path, output_path, **kwargs
+        ) == len(expected_image_ids)
+
+        db = COLMAPDatabase.connect(output_path)
+        assert [
+            row[0] for row in table_rows(db, "images")
+        ] == expected_image_ids
+        assert [row[0] for row in table_rows(db, "cameras")] == sorted(
+            set(
+                1 if image_id <= 5 else camera_id
+                for image_id in expected_image_ids
+            )
+        )
+        assert [
+            row[0] for row in table_rows(db, "pose_priors")
+        ] == expected_image_ids
+        for image_id in expected_image_ids:
+            assert np.array_equal(
+                db.read_keypoints(image_id), keypoints[image_id]
+            )
+            assert np.array_equal(
+                db.read_descriptors(image_id), descriptors[image_id]
+            )
+        expected_pairs = [
+            (image_id1, image_id2)
+            for image_id1, image_id2, _ in matches
+            if image_id1 in expected_image_ids
+            and image_id2 in expected_image_ids
+        ]
+        for image_id1, image_id2, pair_matches in matches:
+            if (image_id1, image_id2) in expected_pairs:
+                assert np.array_equal(
+                    db.read_matches(image_id1, image_id2), pair_matches
+                )
+        assert [
+            (image_id1, image_id2)
+            for image_id1, image_id2, _ in db.iter_matches()
+        ] == expected_pairs
+        assert [
+            row[:2] for row in db.iter_two_view_geometries()
+        ] == expected_pairs
+        db.close()
+
+
+def test_descriptor_compression():
+    keypoints, descriptors, _ = synthetic_features()
+    # Make half of the descriptors compressible like SIFT descriptors, while
+    # the others remain incompressible random bytes.
+    rng = np.random.default_rng(0)
+    compressible_image_ids = [1, 2, 3, 4, 8]
+    for image_id in compressible_image_ids:
+        descriptors[image_id] = np.minimum(
+            rng.exponential(20, size=descriptors[image_id].shape), 255
+        ).astype(np.uint8)
+    descriptors[10] = descriptors[10][:0]
+    database_path = os.path.join(mkdtemp(), "database.db")
+    db = create_database(database_path)
+    assert db.get_descriptor_codec() is None
+    db.set_descriptor_codec("zlib")
+    db.add_descriptors_many((i, descriptors[i]) for i in range(1, 8))
+    db.set_descriptor_codec("lzma")
+    assert db.get_descriptor_codec() == "lzma"
+    # The codec is cached, so adding descriptors does not query the metadata.
+    statements = []
+    db.set_trace_callback(statements.append)
+    for image_id in range(8, 10):
+        db.add_descriptors(image_id, descriptors[image_id])
+    db.set_trace_callback(None)
+    assert not any("database_metadata" in s for s in statements)
+    db.set_descriptor_codec(None)
+    db.add_descriptors(10, descriptors[10])
+    db.commit()
+
+    for image_id, rows, cols, data in table_rows(db, "descriptors"):
+        assert (rows, cols) == descriptors[image_id].shape
+        if image_id in compressible_image_ids:
+            assert len(data) < rows * cols
+        else:
+            assert len(data) == rows * cols
+    for image_id, read_descriptors in db.iter_descriptors():
+        assert np.array_equal(read_descriptors, descriptors[image_id])
+        assert np.array_equal(
+            db.read_descriptors(image_id), descriptors[image_id]
+        )
+    try:
+        db.set_descriptor_codec("zip")
+        assert False
+    except ValueError:
+        pass
+    db.set_descriptor_codec("zlib")
+    db.close()
+
+    # New connections read the codec from the metadata.
+    db = COLMAPDatabase.connect(database_path)
+    assert db.get_descriptor_codec() == "zlib"
+    db.close()
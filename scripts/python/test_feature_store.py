@@ -0,0 +1,92 @@
+# Copyright (c) 2023, ETH Zurich and UNC Chapel Hill.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#     * Neither the name of ETH Zurich and UNC Chapel Hill nor the names of
+#       its contributors may be used to endorse or promote products derived
+#       from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import numpy as np
+from tempfile import mkdtemp
+
+from database import COLMAPDatabase
+from feature_store import (
+    FeatureStore,
+    KEYPOINTS_FILE_NAME,
+    export_feature_store,
+)
+from test_database import create_database, synthetic_features
+
+
+def check_feature_store(store, keypoints, descriptors):
+    assert len(store) == len(keypoints)
+    assert sorted(store.image_ids.tolist()) == sorted(keypoints)
+    for image_id in keypoints:
+        assert np.array_equal(
+            store.read_keypoints(image_id), keypoints[image_id]
+        )
+        assert np.array_equal(
+            store.read_descriptors(image_id), descriptors[image_id]
+        )
+        assert not store.read_keypoints(image_id).flags.writeable
+
+
+def test_export_feature_store():
+    keypoints, descriptors, _ = synthetic_features(num_images=10)
+    # Images with varying and zero numbers of features.
+    keypoints[3] = keypoints[3][:17]
+    descriptors[3] = descriptors[3][:17]
+    keypoints[4] = keypoints[4][:0]
+    descriptors[4] = descriptors[4][:0]
+    tmpdir = mkdtemp()
+    database_path = os.path.join(tmpdir, "database.db")
+    store_path = os.path.join(tmpdir, "features")
+    db = create_database(database_path, num_images=10)
+    db.add_keypoints_many((i, keypoints[i]) for i in range(1, 6))
+    db.add_descriptors_many((i, descriptors[i]) for i in range(1, 6))
+    db.close()
+
+    assert export_feature_store(database_path, store_path) == 5
+    check_feature_store(
+        FeatureStore(store_path),
+        dict((i, keypoints[i]) for i in range(1, 6)),
+        dict((i, descriptors[i]) for i in range(1, 6)),
+    )
+
+    # Simulate an interrupted export, which left trailing rows behind.
+    with open(os.path.join(store_path, KEYPOINTS_FILE_NAME), "ab") as fid:
+        fid.write(np.ones((3, 6), dtype=np.float32).tobytes())
+
+    db = COLMAPDatabase.connect(database_path)
+    db.add_keypoints_many((i, keypoints[i]) for i in range(6, 11))
+    db.add_descriptors_many((i, descriptors[i]) for i in range(6, 11))
+    db.close()
+    assert export_feature_store(database_path, store_path, True) == 5
+    check_feature_store(FeatureStore(store_path), keypoints, descriptors)
+    assert export_feature_store(database_path, store_path, True) == 0
+
+    assert export_feature_store(database_path, store_path) == 10
+    check_feature_store(FeatureStore(store_path), keypoints, descriptors)
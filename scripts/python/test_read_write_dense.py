@@ -28,8 +28,299 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 
+import os
+import sys
+import shutil
+import struct
+import subprocess
 import numpy as np
-from read_write_dense import read_array, write_array
+from tempfile import mkdtemp
+
+import read_write_dense
+from dense_map_archive import DenseArchive, pack_dense_workspace
+from read_write_dense import (
+    DenseWorkspace,
+    read_array,
+    read_array_header,
+    write_array,
+)
+
+
+def write_array_file(path, array):
+    # Reference layout of src/mvs/mat.h: the header followed by the values in
+    # column-major order of shape (width, height, channels).
+    height, width = array.shape[:2]
+    channels = array.shape[2] if array.ndim == 3 else 1
+    with open(path, "wb") as fid:
+        fid.write("{}&{}&{}&".format(width, height, channels).encode())
+        data = array.reshape(height, width, channels).transpose(1, 0, 2)
+        fid.write(data.astype("<f4").tobytes(order="F"))
+
+
+def write_array_struct(array, path):
+    # Previous implementation of write_array, which packs every value.
+    if len(array.shape) == 2:
+        height, width = array.shape
+        channels = 1
+    else:
+        height, width, channels = array.shape
+    with open(path, "w") as fid:
+        fid.write(str(width) + "&" + str(height) + "&" + str(channels) + "&")
+    with open(path, "ab") as fid:
+        if len(array.shape) == 2:
+            array_trans = np.transpose(array, (1, 0))
+        else:
+            array_trans = np.transpose(array, (1, 0, 2))
+        data_list = array_trans.reshape(-1, order="F").tolist()
+        fid.write(struct.pack("<" + "f" * len(data_list), *data_list))
+
+
+def read_file_bytes(path):
+    with open(path, "rb") as fid:
+        return fid.read()
+
+
+def test_write_array_matches_struct():
+    rng = np.random.default_rng(0)
+    tmpdir = mkdtemp()
+    path_struct = os.path.join(tmpdir, "struct.bin")
+    path = os.path.join(tmpdir, "array.bin")
+    for array in [
+        rng.random((37, 53), dtype=np.float32),
+        rng.random((37, 53, 3), dtype=np.float32),
+        # Non-contiguous views.
+        rng.random((37, 53, 4), dtype=np.float32)[::2, 1:, :3],
+        rng.random((53, 37), dtype=np.float32).T,
+        np.zeros((0, 0), dtype=np.float32),
+    ]:
+        write_array_struct(array, path_struct)
+        for atomic in [False, True]:
+            write_array(array, path, atomic=atomic)
+            assert read_file_bytes(path) == read_file_bytes(path_struct)
+    assert sorted(os.listdir(tmpdir)) == ["array.bin", "struct.bin"]
+
+
+def test_standalone():
+    # The script can be copied and used on its own.
+    tmpdir = mkdtemp()
+    shutil.copy(read_write_dense.__file__, tmpdir)
+    subprocess.check_call(
+        [sys.executable, "-c", "import read_write_dense"], cwd=tmpdir
+    )
+
+
+def test_read_array():
+    rng = np.random.default_rng(0)
+    tmpdir = mkdtemp()
+    for shape in [(37, 53), (37, 53, 3), (1, 1), (0, 0)]:
+        array = rng.random(shape, dtype=np.float32)
+        path = os.path.join(tmpdir, "array.bin")
+        write_array_file(path, array)
+
+        header = read_array_header(path)
+        assert (header.height, header.width) == shape[:2]
+        assert header.channels == (shape[2] if len(shape) == 3 else 1)
+        assert os.path.getsize(path) == header.offset + 4 * array.size
+
+        for mmap_mode in [None, "r", "c"]:
+            read = read_array(path, mmap_mode)
+            assert read.dtype == np.float32
+            np.testing.assert_array_equal(read, array.squeeze())
+        if array.size > 1:
+            assert isinstance(read_array(path, "r").base, np.memmap)
+            # Copy-on-write views can be modified without changing the file.
+            read = read_array(path, "c")
+            read[0, 0] = -1
+            np.testing.assert_array_equal(read_array(path), array.squeeze())
+
+        write_array(array, path)
+        np.testing.assert_array_equal(read_array(path, "r"), array.squeeze())
+
+
+def block_average_reference(array, block_size):
+    height = array.shape[0] // block_size
+    width = array.shape[1] // block_size
+    averages = np.zeros((height, width) + array.shape[2:], dtype=np.float32)
+    for y in range(height):
+        for x in range(width):
+            block = array[
+                y * block_size : (y + 1) * block_size,
+                x * block_size : (x + 1) * block_size,
+            ].reshape((block_size * block_size,) + array.shape[2:])
+            if array.ndim == 3:
+                block = block[np.any(block != 0, axis=1)]
+            else:
+                block = block[block != 0]
+            if len(block) > 0:
+                averages[y, x] = block.mean(axis=0)
+    return averages
+
+
+def test_dense_workspace():
+    rng = np.random.default_rng(0)
+    tmpdir = mkdtemp()
+    depth_maps = {}
+    normal_maps = {}
+    for image_name in ["a.jpg", "b.jpg", "sub/c.jpg"]:
+        depth_map = rng.random((43, 61), dtype=np.float32) * 10
+        # Invalid pixels.
+        depth_map[rng.random(depth_map.shape) < 0.3] = 0
+        normal_map = rng.random((43, 61, 3), dtype=np.float32)
+        normal_map[depth_map == 0] = 0
+        depth_maps[image_name] = depth_map
+        normal_maps[image_name] = normal_map
+        for map_type, array in [("depth", depth_map), ("normal", normal_map)]:
+            path = DenseWorkspace(tmpdir).map_path(image_name, map_type)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            write_array(array, path)
+    # Maps of another type are ignored.
+    write_array(
+        depth_map,
+        DenseWorkspace(tmpdir, "photometric").map_path("d.jpg", "depth"),
+    )
+
+    workspace = DenseWorkspace(tmpdir, num_threads=2)
+    assert workspace.image_names() == sorted(depth_maps)
+    assert workspace.image_names("normal") == sorted(depth_maps)
+
+    read_depth_maps = workspace.read_maps()
+    read_normal_maps = workspace.read_maps(map_type="normal")
+    for image_name in depth_maps:
+        depth_map = depth_maps[image_name]
+        normal_map = normal_maps[image_name]
+        np.testing.assert_array_equal(read_depth_maps[image_name], depth_map)
+        np.testing.assert_array_equal(read_normal_maps[image_name], normal_map)
+        np.testing.assert_array_equal(
+            workspace.read_map(image_name, step=4), depth_map[::4, ::4]
+        )
+        for block_size in [2, 5]:
+            np.testing.assert_allclose(
+                workspace.read_map(image_name, block_size=block_size),
+                block_average_reference(depth_map, block_size),
+                rtol=1e-6,
+            )
+            np.testing.assert_allclose(
+                workspace.read_map(image_name, "normal", block_size=block_size),
+                block_average_reference(normal_map, block_size),
+                rtol=1e-6,
+            )
+
+    stats = workspace.stats(percentiles=[0, 5, 50, 95, 100])
+    for image_name, depth_map in depth_maps.items():
+        valid_depths = depth_map[depth_map != 0]
+        assert stats[image_name].valid_ratio == valid_depths.size / 43 / 61
+        assert stats[image_name].min == valid_depths.min()
+        assert stats[image_name].max == valid_depths.max()
+        bin_width = (valid_depths.max() - valid_depths.min()) / 4096
+        # The percentiles are within a bin of the values around their rank.
+        percentiles = stats[image_name].percentiles
+        assert np.all(
+            percentiles
+            >= np.percentile(valid_depths, [0, 5, 50, 95, 100], method="lower")
+            - bin_width
+        )
+        assert np.all(
+            percentiles
+            <= np.percentile(valid_depths, [0, 5, 50, 95, 100], method="higher")
+            + bin_width
+        )
+
+    # Normal maps have three channels.
+    try:
+        workspace.stats(map_type="normal")
+        assert False
+    except ValueError:
+        pass
+
+
+def test_dense_map_archive():
+    rng = np.random.default_rng(0)
+    tmpdir = mkdtemp()
+    workspace = DenseWorkspace(tmpdir)
+    depth_maps = {}
+    normal_maps = {}
+    for image_name in ["a.jpg", "sub/b.jpg"]:
+        depth_map = rng.random((45, 70), dtype=np.float32) * 10 + 1
+        depth_map[rng.random(depth_map.shape) < 0.3] = 0
+        normal_map = rng.random((45, 70, 3), dtype=np.float32) * 2 - 1
+        normal_map[depth_map == 0] = 0
+        depth_maps[image_name] = depth_map
+        normal_maps[image_name] = normal_map
+        for map_type, array in [("depth", depth_map), ("normal", normal_map)]:
+            path = workspace.map_path(image_name, map_type)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            write_array(array, path)
+
+    archive_path = os.path.join(tmpdir, "maps.bin")
+    for codec in ["none", "zlib", "lzma"]:
+        assert (
+            pack_dense_workspace(
+                tmpdir, archive_path, tile_size=32, codec=codec
+            )
+            == 4
+        )
+        archive = DenseArchive(archive_path)
+        for image_name, depth_map in depth_maps.items():
+            depth_path = workspace.map_path(image_name, "depth")
+            name = os.path.relpath(depth_path, os.path.join(tmpdir, "stereo"))
+            np.testing.assert_array_equal(
+                archive.read_array(name), read_array(depth_path)
+            )
+            normal_name = name.replace("depth_maps", "normal_maps")
+            np.testing.assert_array_equal(
+                archive.read_array(normal_name), normal_maps[image_name]
+            )
+            # The original paths of the maps map to their names.
+            assert depth_path in archive
+            np.testing.assert_array_equal(
+                archive.read_array(depth_path), depth_map
+            )
+            np.testing.assert_array_equal(
+                archive.read_array(workspace.map_path(image_name, "normal")),
+                normal_maps[image_name],
+            )
+    missing_path = workspace.map_path("missing.jpg", "depth")
+    assert missing_path not in archive
+    try:
+        archive.read_array(missing_path)
+        assert False
+    except KeyError:
+        pass
+    assert archive.names() == [
+        "depth_maps/a.jpg.geometric.bin",
+        "depth_maps/sub/b.jpg.geometric.bin",
+        "normal_maps/a.jpg.geometric.bin",
+        "normal_maps/sub/b.jpg.geometric.bin",
+    ]
+
+    # Random access to tiles, including the partial tiles at the border.
+    name = "normal_maps/a.jpg.geometric.bin"
+    assert archive.num_tiles(name) == 6
+    for tile_index in range(6):
+        tile, slices = archive.read_tile(name, tile_index)
+        np.testing.assert_array_equal(tile, normal_maps["a.jpg"][slices])
+
+    max_error = 0.005
+    pack_dense_workspace(
+        tmpdir,
+        archive_path,
+        depth_encoding="quantized",
+        normal_encoding="float16",
+        max_depth_error=max_error,
+    )
+    archive = DenseArchive(archive_path)
+    for image_name, depth_map in depth_maps.items():
+        name = "depth_maps/{}.geometric.bin".format(image_name)
+        quantized_depth_map = archive.read_array(name)
+        assert quantized_depth_map.dtype == np.float32
+        assert np.all((quantized_depth_map == 0) == (depth_map == 0))
+        assert np.abs(quantized_depth_map - depth_map).max() <= max_error
+        name = "normal_maps/{}.geometric.bin".format(image_name)
+        np.testing.assert_allclose(
+            archive.read_array(name), normal_maps[image_name], atol=1e-3
+        )
 
 
 def main():
@@ -28,8 +28,107 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 
+import os
+import struct
 import filecmp
-from read_write_fused_vis import read_fused, write_fused
+import numpy as np
+from tempfile import mkdtemp
+
+from read_write_fused_vis import (
+    MeshPoint,
+    arrays_to_mesh_points,
+    mesh_points_to_arrays,
+    read_fused,
+    read_fused_ply_vis_arrays,
+    write_fused,
+    write_fused_ply_vis,
+)
+
+
+def write_fused_ply_vis_struct(mesh_points, path):
+    # Previous implementation of write_fused_ply_vis, which packs every list.
+    with open(path, "wb") as fid:
+        fid.write(struct.pack("<Q", len(mesh_points)))
+        for point in mesh_points:
+            fid.write(struct.pack("<I", point.num_visible_images))
+            fid.write(
+                struct.pack(
+                    "<" + "I" * point.num_visible_images,
+                    *point.visible_image_idxs
+                )
+            )
+
+
+def synthetic_mesh_points(num_points, rng):
+    mesh_points = []
+    for _ in range(num_points):
+        num_visible_images = int(rng.integers(0, 6))
+        mesh_points.append(
+            MeshPoint(
+                position=rng.random(3, dtype=np.float32),
+                color=rng.integers(0, 256, 3).astype(np.uint8),
+                normal=rng.random(3, dtype=np.float32),
+                num_visible_images=num_visible_images,
+                visible_image_idxs=rng.integers(0, 100, num_visible_images),
+            )
+        )
+    return mesh_points
+
+
+def test_read_write_fused_vis():
+    rng = np.random.default_rng(0)
+    tmpdir = mkdtemp()
+    vis_path = os.path.join(tmpdir, "fused.ply.vis")
+    ref_vis_path = os.path.join(tmpdir, "ref.ply.vis")
+    for num_points in [0, 1, 100]:
+        mesh_points = synthetic_mesh_points(num_points, rng)
+        write_fused_ply_vis_struct(mesh_points, ref_vis_path)
+        write_fused_ply_vis(mesh_points, vis_path)
+        assert filecmp.cmp(ref_vis_path, vis_path, shallow=False)
+
+        offsets, image_idxs = read_fused_ply_vis_arrays(vis_path)
+        assert (
+            offsets.tolist()
+            == [0]
+            + np.cumsum(
+                [point.num_visible_images for point in mesh_points]
+            ).tolist()
+        )
+        for i, point in enumerate(mesh_points):
+            np.testing.assert_array_equal(
+                image_idxs[offsets[i] : offsets[i + 1]],
+                point.visible_image_idxs,
+            )
+
+    fused_point_arrays = mesh_points_to_arrays(mesh_points)
+    assert fused_point_arrays.positions.shape == (num_points, 3)
+    np.testing.assert_array_equal(
+        fused_point_arrays.visible_image_offsets, offsets
+    )
+    np.testing.assert_array_equal(
+        fused_point_arrays.visible_image_idxs, image_idxs
+    )
+    converted_mesh_points = arrays_to_mesh_points(fused_point_arrays)
+    assert len(converted_mesh_points) == len(mesh_points)
+    for point, converted_point in zip(mesh_points, converted_mesh_points):
+        np.testing.assert_array_equal(converted_point.position, point.position)
+        np.testing.assert_array_equal(converted_point.color, point.color)
+        np.testing.assert_array_equal(converted_point.normal, point.normal)
+        assert converted_point.num_visible_images == point.num_visible_images
+        np.testing.assert_array_equal(
+            converted_point.visible_image_idxs, point.visible_image_idxs
+        )
+
+    # Truncated files are detected by the scan.
+    with open(vis_path, "rb") as fid:
+        data = fid.read()
+    with open(vis_path, "wb") as fid:
+        fid.write(data[:-4])
+    try:
+        read_fused_ply_vis_arrays(vis_path)
+        assert False
+    except ValueError:
+        pass
 
 
 def main():
@@ -28,11 +28,136 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 
+import os
 import numpy as np
-from read_write_model import read_model, write_model
+from read_write_model import (
+    Camera,
+    Image,
+    Point3D,
+    read_model,
+    write_model,
+    read_images_binary,
+    write_images_binary,
+    read_points3D_binary,
+    write_points3D_binary,
+    read_model_arrays,
+    write_model_arrays,
+    ReconstructionArrays,
+    CAMERA_MODEL_NAMES,
+    write_next_bytes,
+    write_cameras_binary,
+    iter_images_binary,
+    iter_images_text,
+    iter_points3D_binary,
+    iter_points3D_text,
+    filter_model,
+    read_image,
+    read_point3D,
+    read_images_text,
+    read_points3D_text,
+    qvec2rotmat,
+    rotmat2qvec,
+    qvecs2rotmats,
+    rotmats2qvecs,
+    invert_poses,
+    camera_centers,
+    world_from_camera_poses,
+    images_to_arrays,
+    probe_model,
+    find_largest_model,
+)
 from tempfile import mkdtemp
 
 
+def synthetic_model(
+    num_cameras=2, num_images=10, num_points2D=50, num_points3D=100, seed=0
+):
+    """Generate a random model with mutually consistent tracks."""
+    rng = np.random.default_rng(seed)
+    cameras = {}
+    for camera_id in range(1, num_cameras + 1):
+        cameras[camera_id] = Camera(
+            id=camera_id,
+            model="OPENCV",
+            width=1024,
+            height=768,
+            params=rng.random(8),
+        )
+    point3D_ids = rng.integers(1, num_points3D + 1, (num_images, num_points2D))
+    point3D_ids[rng.random((num_images, num_points2D)) < 0.3] = -1
+    images = {}
+    for image_id in range(1, num_images + 1):
+        qvec = rng.normal(size=4)
+        images[image_id] = Image(
+            id=image_id,
+            qvec=qvec / np.linalg.norm(qvec),
+            tvec=rng.normal(size=3),
+            camera_id=int(rng.integers(1, num_cameras + 1)),
+            name="image_{}.jpg".format(image_id),
+            xys=rng.random((num_points2D, 2)) * 1000,
+            point3D_ids=point3D_ids[image_id - 1],
+        )
+    image_idxs, point2D_idxs = np.nonzero(point3D_ids >= 0)
+    track_point3D_ids = point3D_ids[image_idxs, point2D_idxs]
+    order = np.argsort(track_point3D_ids, kind="stable")
+    track_starts = np.searchsorted(
+        track_point3D_ids[order], np.arange(1, num_points3D + 2)
+    )
+    points3D = {}
+    for point3D_id in range(1, num_points3D + 1):
+        track = order[track_starts[point3D_id - 1] : track_starts[point3D_id]]
+        points3D[point3D_id] = Point3D(
+            id=point3D_id,
+            xyz=rng.normal(size=3),
+            rgb=rng.integers(0, 256, 3),
+            error=rng.random(),
+            image_ids=image_idxs[track] + 1,
+            point2D_idxs=point2D_idxs[track],
+        )
+    return cameras, images, points3D
+
+
+def write_cameras_binary_per_record(cameras, path_to_model_file):
+    with open(path_to_model_file, "wb") as fid:
+        write_next_bytes(fid, len(cameras), "Q")
+        for _, cam in cameras.items():
+            model_id = CAMERA_MODEL_NAMES[cam.model].model_id
+            camera_properties = [cam.id, model_id, cam.width, cam.height]
+            write_next_bytes(fid, camera_properties, "iiQQ")
+            for p in cam.params:
+                write_next_bytes(fid, float(p), "d")
+
+
+def write_images_binary_per_record(images, path_to_model_file):
+    with open(path_to_model_file, "wb") as fid:
+        write_next_bytes(fid, len(images), "Q")
+        for _, img in images.items():
+            write_next_bytes(fid, img.id, "i")
+            write_next_bytes(fid, img.qvec.tolist(), "dddd")
+            write_next_bytes(fid, img.tvec.tolist(), "ddd")
+            write_next_bytes(fid, img.camera_id, "i")
+            for char in img.name:
+                write_next_bytes(fid, char.encode("utf-8"), "c")
+            write_next_bytes(fid, b"\x00", "c")
+            write_next_bytes(fid, len(img.point3D_ids), "Q")
+            for xy, p3d_id in zip(img.xys, img.point3D_ids):
+                write_next_bytes(fid, [*xy, p3d_id], "ddq")
+
+
+def write_points3D_binary_per_record(points3D, path_to_model_file):
+    with open(path_to_model_file, "wb") as fid:
+        write_next_bytes(fid, len(points3D), "Q")
+        for _, pt in points3D.items():
+            write_next_bytes(fid, pt.id, "Q")
+            write_next_bytes(fid, pt.xyz.tolist(), "ddd")
+            write_next_bytes(fid, pt.rgb.tolist(), "BBB")
+            write_next_bytes(fid, pt.error, "d")
+            track_length = pt.image_ids.shape[0]
+            write_next_bytes(fid, track_length, "Q")
+            for image_id, point2D_id in zip(pt.image_ids, pt.point2D_idxs):
+                write_next_bytes(fid, [image_id, point2D_id], "ii")
+
+
 def compare_cameras(cameras1, cameras2):
     assert len(cameras1) == len(cameras2)
     for camera_id1 in cameras1:
@@ -70,6 +195,289 @@ def compare_points(points3D1, points3D2):
         assert np.array_equal(point3D1.point2D_idxs, point3D2.point2D_idxs)
 
 
+def test_read_write_images_binary():
+    _, images, _ = synthetic_model()
+    images[1] = images[1]._replace(
+        xys=np.zeros((0, 2)), point3D_ids=np.zeros(0, dtype=np.int64)
+    )
+    path = os.path.join(mkdtemp(), "images.bin")
+    write_images_binary(images, path)
+    compare_images(images, read_images_binary(path))
+
+
+def test_read_write_points3D_binary():
+    _, _, points3D = synthetic_model()
+    points3D[1] = points3D[1]._replace(
+        image_ids=np.zeros(0, dtype=np.int64),
+        point2D_idxs=np.zeros(0, dtype=np.int64),
+    )
+    tmpdir = mkdtemp()
+    write_points3D_binary(points3D, os.path.join(tmpdir, "points3D.bin"))
+    points3D_read = read_points3D_binary(os.path.join(tmpdir, "points3D.bin"))
+    assert list(points3D) == list(points3D_read)
+    compare_points(points3D, points3D_read)
+    # The tuples keep the int64 colors and tracks of the per-record reader.
+    for point3D in list(points3D_read.values()) + [
+        read_point3D(os.path.join(tmpdir, "points3D.bin"), 2)
+    ]:
+        assert point3D.rgb.dtype == np.int64
+        assert point3D.image_ids.dtype == np.int64
+        assert point3D.point2D_idxs.dtype == np.int64
+    write_points3D_binary(points3D_read, os.path.join(tmpdir, "copy.bin"))
+    with open(os.path.join(tmpdir, "points3D.bin"), "rb") as fid1, open(
+        os.path.join(tmpdir, "copy.bin"), "rb"
+    ) as fid2:
+        assert fid1.read() == fid2.read()
+
+
+def read_file_bytes(path):
+    with open(path, "rb") as fid:
+        return fid.read()
+
+
+def test_write_binary_matches_per_record():
+    cameras, images, points3D = synthetic_model()
+    images[2] = images[2]._replace(
+        xys=np.zeros((0, 2)), point3D_ids=np.zeros(0, dtype=np.int64)
+    )
+    tmpdir = mkdtemp()
+    for write, write_per_record, model in [
+        (write_cameras_binary, write_cameras_binary_per_record, cameras),
+        (write_images_binary, write_images_binary_per_record, images),
+        (write_points3D_binary, write_points3D_binary_per_record, points3D),
+    ]:
+        path = os.path.join(tmpdir, "model.bin")
+        write_per_record(model, path)
+        expected = read_file_bytes(path)
+        os.remove(path)
+        write(model, path)
+        assert read_file_bytes(path) == expected
+        write(model, path, atomic=True)
+        assert read_file_bytes(path) == expected
+        assert os.listdir(tmpdir) == ["model.bin"]
+        os.remove(path)
+        write({}, path)
+        write_per_record({}, path + ".ref")
+        assert read_file_bytes(path) == read_file_bytes(path + ".ref")
+        os.remove(path)
+        os.remove(path + ".ref")
+
+
+def test_reconstruction_arrays():
+    cameras, images, points3D = synthetic_model()
+    reconstruction = ReconstructionArrays.from_model(cameras, images, points3D)
+    compare_images(images, reconstruction.images)
+    compare_points(points3D, reconstruction.points3D)
+    assert reconstruction.image(3).name == images[3].name
+    assert 5 in reconstruction.points3D
+    assert 0 not in reconstruction.points3D
+    for ext in [".bin", ".txt"]:
+        tmpdir = mkdtemp()
+        write_model_arrays(reconstruction, tmpdir, ext=ext)
+        cameras_read, images_read, points3D_read = read_model(tmpdir, ext=ext)
+        compare_cameras(cameras, cameras_read)
+        compare_images(images, images_read)
+        compare_points(points3D, points3D_read)
+        reconstruction_read = read_model_arrays(tmpdir, ext=ext)
+        compare_images(images, reconstruction_read.images)
+        compare_points(points3D, reconstruction_read.points3D)
+
+
+def test_read_model_workers():
+    cameras, images, points3D = synthetic_model()
+    for ext in [".bin", ".txt"]:
+        tmpdir = mkdtemp()
+        write_model(cameras, images, points3D, tmpdir, ext=ext)
+        cameras_read, images_read, points3D_read = read_model(
+            tmpdir, ext=ext, workers=3
+        )
+        compare_cameras(cameras, cameras_read)
+        compare_images(images, images_read)
+        compare_points(points3D, points3D_read)
+        # Reading has no side effects on the model folder.
+        assert sorted(os.listdir(tmpdir)) == [
+            "cameras" + ext,
+            "images" + ext,
+            "points3D" + ext,
+        ]
+
+
+def test_iter_model():
+    cameras, images, points3D = synthetic_model()
+    for ext, iter_images, iter_points3D in [
+        (".bin", iter_images_binary, iter_points3D_binary),
+        (".txt", iter_images_text, iter_points3D_text),
+    ]:
+        tmpdir = mkdtemp()
+        write_model(cameras, images, points3D, tmpdir, ext=ext)
+        images_path = os.path.join(tmpdir, "images" + ext)
+        points3D_path = os.path.join(tmpdir, "points3D" + ext)
+        compare_images(images, {i.id: i for i in iter_images(images_path)})
+        compare_points(
+            points3D, {p.id: p for p in iter_points3D(points3D_path)}
+        )
+        chunks = list(iter_points3D(points3D_path, chunk_size=7))
+        assert len(chunks) == (len(points3D) + 6) // 7
+        assert sum(len(chunk.ids) for chunk in chunks) == len(points3D)
+        chunks = list(iter_images(images_path, chunk_size=3))
+        assert sum(len(chunk.ids) for chunk in chunks) == len(images)
+
+
+def test_filter_model():
+    cameras, images, points3D = synthetic_model()
+    input_path = mkdtemp()
+    write_model(cameras, images, points3D, input_path, ext=".bin")
+    kept_points3D = {
+        point3D_id: point3D
+        for point3D_id, point3D in points3D.items()
+        if len(point3D.image_ids) >= 3 and point3D.error <= 0.5
+    }
+    assert 0 < len(kept_points3D) < len(points3D)
+    for output_ext in [".bin", ".txt"]:
+        output_path = mkdtemp()
+        counts = filter_model(
+            input_path,
+            output_path,
+            output_ext=output_ext,
+            min_track_length=3,
+            max_error=0.5,
+        )
+        assert counts == (len(cameras), len(images), len(kept_points3D))
+        cameras_read, images_read, points3D_read = read_model(
+            output_path, ext=output_ext
+        )
+        compare_cameras(cameras, cameras_read)
+        compare_points(kept_points3D, points3D_read)
+        for image_id, image in images.items():
+            point3D_ids = np.where(
+                np.isin(image.point3D_ids, list(kept_points3D)),
+                image.point3D_ids,
+                -1,
+            )
+            assert np.array_equal(
+                images_read[image_id].point3D_ids, point3D_ids
+            )
+            assert np.allclose(images_read[image_id].xys, image.xys)
+
+
+def test_read_text_irregular_whitespace():
+    tmpdir = mkdtemp()
+    path = os.path.join(tmpdir, "points3D.txt")
+    with open(path, "w") as fid:
+        fid.write("# comment\n\n")
+        fid.write("1 0.5 1.5 2.5 10 20 30 0.25 \n")
+        fid.write("  2\t1 2 3 40 50 60 1e-3  7 0 8 1\r\n")
+        fid.write("3 1 2 3 1 2 3 0.5 1 2")
+    points3D = read_points3D_text(path)
+    assert list(points3D) == [1, 2, 3]
+    assert len(points3D[1].image_ids) == 0
+    assert np.allclose(points3D[2].xyz, [1, 2, 3])
+    assert points3D[2].error == 1e-3
+    assert np.array_equal(points3D[2].image_ids, [7, 8])
+    assert np.array_equal(points3D[2].point2D_idxs, [0, 1])
+    assert np.array_equal(points3D[3].image_ids, [1])
+
+    path = os.path.join(tmpdir, "images.txt")
+    with open(path, "w") as fid:
+        fid.write("# comment\n")
+        fid.write("1 1 0 0 0 1 2 3 1 a.jpg\n\n")
+        fid.write("2 1 0 0 0 1 2 3 1 b.jpg\n 1.5  2.5 -1\t3 4 7 \n")
+    images = read_images_text(path)
+    assert len(images[1].point3D_ids) == 0
+    assert np.allclose(images[2].xys, [[1.5, 2.5], [3, 4]])
+    assert np.array_equal(images[2].point3D_ids, [-1, 7])
+
+
+def test_read_record():
+    cameras, images, points3D = synthetic_model()
+    tmpdir = mkdtemp()
+    write_model(cameras, images, points3D, tmpdir, ext=".bin")
+    images_path = os.path.join(tmpdir, "images.bin")
+    points3D_path = os.path.join(tmpdir, "points3D.bin")
+    for image_id in [7, 1, 10]:
+        compare_images(
+            {image_id: images[image_id]},
+            {image_id: read_image(images_path, image_id)},
+        )
+    for point3D_id in [1, 50, 100]:
+        compare_points(
+            {point3D_id: points3D[point3D_id]},
+            {point3D_id: read_point3D(points3D_path, point3D_id)},
+        )
+    assert os.path.exists(images_path + ".idx")
+    assert os.path.exists(points3D_path + ".idx")
+    for missing_id in [0, 1000]:
+        try:
+            read_point3D(points3D_path, missing_id)
+            assert False
+        except KeyError:
+            pass
+
+    # Rewriting the model must invalidate the cached index.
+    del points3D[1]
+    write_points3D_binary(points3D, points3D_path)
+    compare_points({50: points3D[50]}, {50: read_point3D(points3D_path, 50)})
+    try:
+        read_point3D(points3D_path, 1)
+        assert False
+    except KeyError:
+        pass
+
+
+def test_probe_model():
+    sparse_path = mkdtemp()
+    for i, num_images in enumerate([5, 20, 10]):
+        cameras, images, points3D = synthetic_model(num_images=num_images)
+        model_path = os.path.join(sparse_path, str(i))
+        os.makedirs(model_path)
+        write_model(cameras, images, points3D, model_path, ext=".bin")
+        if i == 2:
+            write_model(cameras, images, points3D, model_path, ext=".txt")
+    os.makedirs(os.path.join(sparse_path, "empty"))
+    assert probe_model(os.path.join(sparse_path, "empty")) is None
+
+    probe = probe_model(os.path.join(sparse_path, "1"))
+    assert probe.format == ".bin"
+    assert probe.num_cameras == 2
+    assert probe.num_images == 20
+    assert probe.num_points3D == 100
+    probe_txt = probe_model(os.path.join(sparse_path, "2"), ext=".txt")
+    assert probe_txt.format == ".txt"
+    assert probe_txt[2:5] == (2, 10, 100)
+    assert find_largest_model(sparse_path).path == os.path.join(
+        sparse_path, "1"
+    )
+
+
+def test_pose_conversions():
+    cameras, images, points3D = synthetic_model()
+    qvecs = np.array([image.qvec for image in images.values()])
+    tvecs = np.array([image.tvec for image in images.values()])
+    rotmats = qvecs2rotmats(qvecs)
+    assert rotmats.shape == (len(images), 3, 3)
+    for qvec, rotmat in zip(qvecs, rotmats):
+        assert np.allclose(rotmat, qvec2rotmat(qvec))
+    assert np.allclose(
+        rotmats2qvecs(rotmats), [rotmat2qvec(rotmat) for rotmat in rotmats]
+    )
+
+    inv_qvecs, inv_tvecs = invert_poses(qvecs, tvecs)
+    centers = camera_centers(qvecs, tvecs)
+    assert np.allclose(inv_tvecs, centers)
+    ids, R, t = world_from_camera_poses(images)
+    assert np.array_equal(ids, list(images))
+    assert np.allclose(R, qvecs2rotmats(inv_qvecs))
+    assert np.allclose(t, centers)
+    for image, center in zip(images.values(), centers):
+        assert np.allclose(center, -qvec2rotmat(image.qvec).T @ image.tvec)
+    _, R_arrays, t_arrays = world_from_camera_poses(images_to_arrays(images))
+    assert np.allclose(R_arrays, R)
+    assert np.allclose(t_arrays, t)
+    qvecs_again, tvecs_again = invert_poses(inv_qvecs, inv_tvecs)
+    assert np.allclose(qvecs_again, qvecs)
+    assert np.allclose(tvecs_again, tvecs)
+
+
 def main():
     import sys
 
@@ -31,7 +31,12 @@ import argparse
 import numpy as np
 import open3d
 
-from read_write_model import read_model, write_model, qvec2rotmat, rotmat2qvec
+from read_write_model import (
+    read_model,
+    write_model,
+    rotmat2qvec,
+    world_from_camera_poses,
+)
 
 
 class Model:
@@ -72,17 +77,9 @@ class Model:
 
     def add_cameras(self, scale=1):
         frames = []
-        for img in self.images.values():
-            # rotation
-            R = qvec2rotmat(img.qvec)
-
-            # translation
-            t = img.tvec
-
-            # invert
-            t = -R.T @ t
-            R = R.T
-
+        # world-from-camera rotations and translations of all images
+        _, Rs, ts = world_from_camera_poses(self.images)
+        for img, R, t in zip(self.images.values(), Rs, ts):
             # intrinsics
             cam = self.cameras[img.camera_id]
 
@@ -12,15 +12,21 @@ def pose_from_colmap(input_file_path, output_file_path):
         lines = input.readlines()
 
     lines = lines[4::2]
-    for i, line in enumerate(lines):
-        data_list = line.strip().split()
-        qw, qx, qy, qz, tx, ty, tz = map(float, data_list[1:8])
-        R_cw = R.from_quat([qx, qy, qz, qw]).as_matrix()
-        t_cw = np.array([tx, ty, tz])
-        R_wc = R_cw.T
-        t_wc = -R_wc @ t_cw
-        qx_new, qy_new, qz_new, qw_new = R.from_matrix(R_wc).as_quat()
-        tx_new, ty_new, tz_new = t_wc
+    data_lists = [line.strip().split() for line in lines]
+    if len(data_lists) > 0:
+        # 一次性转换所有位姿
+        poses = np.array(
+            [data_list[1:8] for data_list in data_lists], dtype=float
+        )
+        qw, qx, qy, qz = poses[:, 0:4].T
+        R_cw = R.from_quat(np.column_stack([qx, qy, qz, qw])).as_matrix()
+        t_cw = poses[:, 4:7]
+        R_wc = R_cw.transpose(0, 2, 1)
+        t_wc = -(R_wc @ t_cw[:, :, None])[:, :, 0]
+        q_wc = R.from_matrix(R_wc).as_quat()
+    for i, data_list in enumerate(data_lists):
+        qx_new, qy_new, qz_new, qw_new = q_wc[i]
+        tx_new, ty_new, tz_new = t_wc[i]
         data_list[1:8] = [qw_new, qx_new, qy_new, qz_new, tx_new, ty_new, tz_new]
         lines[i] = ' '.join(map(str, data_list)) + '\n'
     
@@ -5,7 +5,11 @@ import os
 import mapper_pb2
 
 import sys
+import glob
 import sqlite3
+import argparse
+import collections
+import concurrent.futures
 import numpy as np
 
 
@@ -76,6 +80,34 @@ CREATE_NAME_INDEX = (
     "CREATE UNIQUE INDEX IF NOT EXISTS index_name ON images(name)"
 )
 
+# FeatureMsg 中 keypoints 字段的编号, 见 work/proto/mapper.proto
+KEYPOINTS_FIELD_NUMBER = 3
+
+KEYPOINT_FIELDS = ["x", "y", "a11", "a12", "a21", "a22"]
+
+# 六个字段均非零时, 每个 FeatureKeypointMsg 序列化为定长的32字节:
+# 字段tag + 长度 + 6 x (字段tag + float32)
+KEYPOINT_WIRE_DTYPE = np.dtype(
+    [("key", "u1"), ("length", "u1")]
+    + [
+        item
+        for name in KEYPOINT_FIELDS
+        for item in [("tag_" + name, "u1"), (name, "<f4")]
+    ]
+)
+
+FeatureData = collections.namedtuple(
+    "FeatureData",
+    [
+        "name",
+        "width",
+        "height",
+        "has_prior_focal_length",
+        "keypoints",
+        "descriptors",
+    ],
+)
+
 CREATE_ALL = "; ".join(
     [
         CREATE_CAMERAS_TABLE,
@@ -104,16 +136,208 @@ def pair_id_to_image_ids(pair_id):
 
 def array_to_blob(array):
     if IS_PYTHON3:
-        return array.tostring()
+        return array.tobytes()
     else:
         return np.getbuffer(array)
 
 
 def blob_to_array(blob, dtype, shape=(-1,)):
-    if IS_PYTHON3:
-        return np.fromstring(blob, dtype=dtype).reshape(*shape)
-    else:
-        return np.frombuffer(blob, dtype=dtype).reshape(*shape)
+    return np.frombuffer(blob, dtype=dtype).reshape(*shape)
+
+
+def read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def find_field_offset(data, field_number):
+    """在序列化的 protobuf 消息中查找某个字段第一次出现的位置, 找不到返回 None"""
+    offset = 0
+    try:
+        while offset < len(data):
+            key, value_offset = read_varint(data, offset)
+            if key >> 3 == field_number:
+                return offset
+            wire_type = key & 0x7
+            if wire_type == 0:
+                _, offset = read_varint(data, value_offset)
+            elif wire_type == 1:
+                offset = value_offset + 8
+            elif wire_type == 2:
+                length, value_offset = read_varint(data, value_offset)
+                offset = value_offset + length
+            elif wire_type == 5:
+                offset = value_offset + 4
+            else:
+                return None
+    except IndexError:
+        return None
+    return None
+
+
+def decode_fixed_size_keypoints(serialized_data, num_keypoints):
+    """从序列化的 FeatureMsg 中向量化解码 (N, 6) float32 关键点数组
+
+    仅当所有关键点都是定长编码且连续存储时可用, 否则 (如有值为0的字段被省略)
+    返回 None.
+    """
+    offset = find_field_offset(serialized_data, KEYPOINTS_FIELD_NUMBER)
+    if (
+        offset is None
+        or offset + num_keypoints * KEYPOINT_WIRE_DTYPE.itemsize
+        > len(serialized_data)
+    ):
+        return None
+    records = np.frombuffer(
+        serialized_data, KEYPOINT_WIRE_DTYPE, num_keypoints, offset
+    )
+    is_fixed_size = np.all(
+        records["key"] == (KEYPOINTS_FIELD_NUMBER << 3 | 2)
+    ) and np.all(records["length"] == KEYPOINT_WIRE_DTYPE.itemsize - 2)
+    for field_number, name in enumerate(KEYPOINT_FIELDS, start=1):
+        is_fixed_size = is_fixed_size and np.all(
+            records["tag_" + name] == (field_number << 3 | 5)
+        )
+    if not is_fixed_size:
+        return None
+    return np.column_stack([records[name] for name in KEYPOINT_FIELDS]).astype(
+        np.float32
+    )
+
+
+def keypoints_from_feature_msg(feature_msg, serialized_data=None):
+    """将 FeatureMsg 的关键点转为 (N, 6) float32 数组
+
+    给定序列化数据时先尝试 decode_fixed_size_keypoints, 失败时逐个关键点读取.
+    """
+    num_keypoints = len(feature_msg.keypoints)
+    if serialized_data is not None and num_keypoints > 0:
+        keypoints = decode_fixed_size_keypoints(serialized_data, num_keypoints)
+        if keypoints is not None:
+            return keypoints
+
+    return np.array(
+        [
+            [kp.x, kp.y, kp.a11, kp.a12, kp.a21, kp.a22]
+            for kp in feature_msg.keypoints
+        ],
+        dtype=np.float32,
+    ).reshape(-1, 6)
+
+
+def parse_feature_file(file_path):
+    """读取并解析一个 .bin 文件, 在进程池中执行"""
+    with open(file_path, "rb") as f:
+        serialized_data = f.read()
+
+    feature_msg = mapper_pb2.FeatureMsg()
+    feature_msg.ParseFromString(serialized_data)
+
+    return FeatureData(
+        name=feature_msg.image.name,
+        width=feature_msg.camera.width,
+        height=feature_msg.camera.height,
+        has_prior_focal_length=feature_msg.camera.has_prior_focal_length,
+        keypoints=keypoints_from_feature_msg(feature_msg, serialized_data),
+        descriptors=blob_to_array(
+            feature_msg.descriptors.data,
+            np.uint8,
+            (feature_msg.descriptors.rows, feature_msg.descriptors.cols),
+        ),
+    )
+
+
+def iter_feature_files(file_paths, workers=None, max_pending=256):
+    """按文件顺序返回解析结果, 最多同时有 max_pending 个文件在解析中"""
+    if workers == 1:
+        for file_path in file_paths:
+            yield parse_feature_file(file_path)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for file_path in file_paths:
+            pending.append(executor.submit(parse_feature_file, file_path))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class CameraRegistry:
+    """内存中的相机表, 用于批量写入时查找或添加相机
+
+    以 (model, width, height, 量化后的参数) 为键, 参数之差不超过 tolerance 的
+    相机视为同一相机, 避免浮点抖动产生重复相机.
+    """
+
+    def __init__(self, db, tolerance=1e-6):
+        self.db = db
+        self.tolerance = tolerance
+        self.load()
+
+    def load(self):
+        """从 cameras 表重新加载所有相机"""
+        self.camera_ids = {}
+        self.cameras = collections.defaultdict(list)
+        for camera_id, model, width, height, params in self.db.execute(
+            "SELECT camera_id, model, width, height, params FROM cameras"
+        ):
+            self.register(
+                camera_id,
+                model,
+                width,
+                height,
+                blob_to_array(params, np.float64),
+            )
+
+    def quantize(self, params):
+        if self.tolerance > 0:
+            quantized = np.round(params / self.tolerance).astype(np.int64)
+            return tuple(quantized.tolist())
+        return tuple(params.tolist())
+
+    def register(self, camera_id, model, width, height, params):
+        self.camera_ids.setdefault(
+            (model, width, height, self.quantize(params)), camera_id
+        )
+        self.cameras[(model, width, height)].append((camera_id, params))
+
+    def find(self, model, width, height, params):
+        """返回匹配的相机ID, 不存在时返回 None"""
+        params = np.asarray(params, np.float64)
+        camera_id = self.camera_ids.get(
+            (model, width, height, self.quantize(params))
+        )
+        if camera_id is not None:
+            return camera_id
+
+        # 量化边界两侧的参数落在不同的格子中, 逐个比较同尺寸的相机
+        for camera_id, camera_params in self.cameras[(model, width, height)]:
+            if camera_params.shape == params.shape and np.all(
+                np.abs(camera_params - params) <= self.tolerance
+            ):
+                return camera_id
+        return None
+
+    def get_or_add(
+        self, model, width, height, params, prior_focal_length=False
+    ):
+        camera_id = self.find(model, width, height, params)
+        if camera_id is None:
+            params = np.asarray(params, np.float64)
+            camera_id = self.db.add_camera(
+                model, width, height, params, prior_focal_length
+            )
+            self.register(camera_id, model, width, height, params)
+        return camera_id
 
 
 class COLMAPDatabase(sqlite3.Connection):
@@ -275,25 +499,41 @@ class COLMAPDatabase(sqlite3.Connection):
         result = cursor.fetchone()
         return result[0] if result else None
 
-    def add_feature_message(self, feature_msg, cam_param):
-        # 1. 添加相机信息，如果已存在则获取现有相机ID
-        existing_camera_id = self.camera_exists(
-            model=4,
-            width=feature_msg.camera.width,
-            height=feature_msg.camera.height,
-            params=cam_param
-        )
+    def get_or_add_camera(
+        self,
+        width,
+        height,
+        cam_param,
+        prior_focal_length=False,
+        camera_registry=None,
+    ):
+        """返回相机ID, 不存在时添加相机; 给定 CameraRegistry 时不查询数据库"""
+        if camera_registry is not None:
+            return camera_registry.get_or_add(
+                4, width, height, cam_param, prior_focal_length
+            )
 
-        if existing_camera_id:
-            camera_id = existing_camera_id
-        else:
+        camera_id = self.camera_exists(
+            model=4, width=width, height=height, params=cam_param
+        )
+        if not camera_id:
             camera_id = self.add_camera(
                 model=4,
-                width=feature_msg.camera.width,
-                height=feature_msg.camera.height,
+                width=width,
+                height=height,
                 params=cam_param,
-                prior_focal_length=feature_msg.camera.has_prior_focal_length
+                prior_focal_length=prior_focal_length,
             )
+        return camera_id
+
+    def add_feature_message(self, feature_msg, cam_param):
+        # 1. 添加相机信息，如果已存在则获取现有相机ID
+        camera_id = self.get_or_add_camera(
+            width=feature_msg.camera.width,
+            height=feature_msg.camera.height,
+            cam_param=cam_param,
+            prior_focal_length=feature_msg.camera.has_prior_focal_length,
+        )
 
         # 2. 添加图像信息
         image_id = self.add_image(
@@ -302,11 +542,7 @@ class COLMAPDatabase(sqlite3.Connection):
         )
 
         # 3. 添加关键点
-        keypoints = np.array(
-            [[kp.x, kp.y, kp.a11, kp.a12, kp.a21, kp.a22]
-                for kp in feature_msg.keypoints],
-            dtype=np.float32
-        )
+        keypoints = keypoints_from_feature_msg(feature_msg)
         self.add_keypoints(image_id, keypoints)
 
         # 4. 添加描述符
@@ -314,6 +550,56 @@ class COLMAPDatabase(sqlite3.Connection):
             feature_msg.descriptors.rows, feature_msg.descriptors.cols)
         self.add_descriptors(image_id, descriptors)
 
+    def add_feature_data_many(self, features, cam_param, camera_registry=None):
+        """在一个事务中添加多张图像的特征, 出错时整批回滚
+
+        :param features: FeatureData 列表
+        :param camera_registry: 可选的 CameraRegistry, 见 get_or_add_camera
+        """
+        keypoint_rows = []
+        descriptor_rows = []
+        try:
+            with self:
+                for feature_data in features:
+                    camera_id = self.get_or_add_camera(
+                        feature_data.width,
+                        feature_data.height,
+                        cam_param,
+                        feature_data.has_prior_focal_length,
+                        camera_registry,
+                    )
+                    image_id = self.add_image(feature_data.name, camera_id)
+
+                    keypoints = np.ascontiguousarray(
+                        feature_data.keypoints, np.float32
+                    )
+                    keypoint_rows.append(
+                        (image_id,)
+                        + keypoints.shape
+                        + (array_to_blob(keypoints),)
+                    )
+                    descriptors = np.ascontiguousarray(
+                        feature_data.descriptors, np.uint8
+                    )
+                    descriptor_rows.append(
+                        (image_id,)
+                        + descriptors.shape
+                        + (array_to_blob(descriptors),)
+                    )
+
+                self.executemany(
+                    "INSERT INTO keypoints VALUES (?, ?, ?, ?)", keypoint_rows
+                )
+                self.executemany(
+                    "INSERT INTO descriptors VALUES (?, ?, ?, ?)",
+                    descriptor_rows,
+                )
+        except BaseException:
+            # 回滚后注册表中可能有未写入数据库的相机
+            if camera_registry is not None:
+                camera_registry.load()
+            raise
+
 
 def insert_feature_msg_to_db(database_path, serialized_data, cam_param):
     # 连接数据库
@@ -334,19 +620,54 @@ def insert_feature_msg_to_db(database_path, serialized_data, cam_param):
     db.close()
 
 
-def process_all_bin_files(protobuf_dir, cam_param, database_path):
-    # 遍历指定目录下的所有 .bin 文件
-    for file_name in os.listdir(protobuf_dir):
-        if file_name.endswith(".bin"):
-            file_path = os.path.join(protobuf_dir, file_name)
-            print(f"Processing file: {file_path}")
+def process_all_bin_files(
+    protobuf_dir,
+    cam_param,
+    database_path,
+    workers=None,
+    batch_size=256,
+    camera_tolerance=1e-6,
+):
+    """将目录下所有 .bin 文件的特征写入数据库
 
-            # 从文件中读取序列化的数据
-            with open(file_path, "rb") as f:
-                serialized_data = f.read()
+    在进程池中解析文件, 由单个数据库连接按批写入, 每批一个事务. 中断后重新
+    运行时会跳过数据库中已有的图像 (按名称). 参数之差不超过 camera_tolerance
+    的相机视为同一相机.
+    """
+    file_paths = sorted(glob.glob(os.path.join(protobuf_dir, "*.bin")))
 
-            # 将数据插入到数据库中
-            insert_feature_msg_to_db(database_path, serialized_data, cam_param)
+    db = COLMAPDatabase.connect(database_path)
+    db.create_tables()
+
+    existing_names = set(
+        row[0] for row in db.execute("SELECT name FROM images")
+    )
+    camera_registry = CameraRegistry(db, camera_tolerance)
+    num_added = 0
+    num_skipped = 0
+    batch = []
+    for feature_data in iter_feature_files(file_paths, workers, 2 * batch_size):
+        if feature_data.name in existing_names:
+            num_skipped += 1
+            continue
+        existing_names.add(feature_data.name)
+
+        batch.append(feature_data)
+        if len(batch) >= batch_size:
+            db.add_feature_data_many(batch, cam_param, camera_registry)
+            num_added += len(batch)
+            batch = []
+            print(f"Added {num_added} images, skipped {num_skipped} images")
+
+    if batch:
+        db.add_feature_data_many(batch, cam_param, camera_registry)
+        num_added += len(batch)
+
+    db.close()
+    print(
+        f"Added {num_added} images, skipped {num_skipped} images "
+        f"from {len(file_paths)} files"
+    )
 
 
 # Example Usage:
@@ -354,16 +675,35 @@ if __name__ == "__main__":
     # protobuf_dir = "./protobuf_0.1-1500"
     # database_path = "database.db"
 
-    protobuf_dir = sys.argv[1]
-    cam_param_str = sys.argv[2]
-    database_path = sys.argv[3]
-
-    numbers = [float(num) for num in cam_param_str.split(",")]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("protobuf_dir")
+    parser.add_argument("cam_param", help="逗号分隔的相机参数")
+    parser.add_argument("database_path")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="解析进程数, 默认为CPU核数"
+    )
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument(
+        "--camera_tolerance",
+        type=float,
+        default=1e-6,
+        help="相机参数之差不超过该值时视为同一相机",
+    )
+    args = parser.parse_args()
+
+    numbers = [float(num) for num in args.cam_param.split(",")]
     cam_param = np.array(numbers)
     # 检查目录是否存在
-    if not os.path.exists(protobuf_dir):
-        print(f"Error: Directory {protobuf_dir} does not exist.")
+    if not os.path.exists(args.protobuf_dir):
+        print(f"Error: Directory {args.protobuf_dir} does not exist.")
         exit(1)
 
     # 处理目录下所有 .bin 文件并插入数据库
-    process_all_bin_files(protobuf_dir, cam_param, database_path)
+    process_all_bin_files(
+        args.protobuf_dir,
+        cam_param,
+        args.database_path,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        camera_tolerance=args.camera_tolerance,
+    )
@@ -0,0 +1,182 @@
+"""
+    database.py 测试, 需要由 work/proto/mapper.proto 生成的 mapper_pb2
+"""
+import os
+import numpy as np
+import pytest
+from tempfile import mkdtemp
+
+mapper_pb2 = pytest.importorskip("mapper_pb2")
+
+from database import (
+    KEYPOINTS_FIELD_NUMBER,
+    COLMAPDatabase,
+    CameraRegistry,
+    process_all_bin_files,
+    decode_fixed_size_keypoints,
+    keypoints_from_feature_msg,
+)
+
+
+def make_feature_msg(keypoints, name="image.jpg", num_descriptors=None):
+    feature_msg = mapper_pb2.FeatureMsg()
+    feature_msg.camera.width = 640
+    feature_msg.camera.height = 480
+    feature_msg.image.name = name
+    for x, y, a11, a12, a21, a22 in keypoints:
+        keypoint_msg = feature_msg.keypoints.add()
+        keypoint_msg.x = x
+        keypoint_msg.y = y
+        keypoint_msg.a11 = a11
+        keypoint_msg.a12 = a12
+        keypoint_msg.a21 = a21
+        keypoint_msg.a22 = a22
+    if num_descriptors is None:
+        num_descriptors = len(keypoints)
+    feature_msg.descriptors.rows = num_descriptors
+    feature_msg.descriptors.cols = 128
+    feature_msg.descriptors.data = bytes(128 * num_descriptors)
+    return feature_msg
+
+
+def serialize_and_parse(feature_msg):
+    serialized_data = feature_msg.SerializeToString()
+    parsed_msg = mapper_pb2.FeatureMsg()
+    parsed_msg.ParseFromString(serialized_data)
+    return parsed_msg, serialized_data
+
+
+def test_decode_fixed_size_keypoints():
+    rng = np.random.default_rng(0)
+    keypoints = (rng.random((100, 6)) + 0.5).astype(np.float32)
+    keypoints[::2] *= -1
+
+    # 名称中包含与 keypoints 字段 tag 相同的字节, 查找字段时应跳过.
+    tag = chr(KEYPOINTS_FIELD_NUMBER << 3 | 2)
+    for name in ["image.jpg", tag * 5]:
+        parsed_msg, serialized_data = serialize_and_parse(
+            make_feature_msg(keypoints, name)
+        )
+        fast_keypoints = decode_fixed_size_keypoints(serialized_data, 100)
+        assert fast_keypoints is not None
+        assert fast_keypoints.dtype == np.float32
+        np.testing.assert_array_equal(fast_keypoints, keypoints)
+        np.testing.assert_array_equal(
+            fast_keypoints, keypoints_from_feature_msg(parsed_msg)
+        )
+        np.testing.assert_array_equal(
+            keypoints_from_feature_msg(parsed_msg, serialized_data), keypoints
+        )
+
+
+def test_decode_variable_size_keypoints():
+    rng = np.random.default_rng(0)
+    keypoints = (rng.random((100, 6)) + 0.5).astype(np.float32)
+    # 值为0的字段不会被序列化, 对应的关键点不再是定长的; 分别测试第一个,
+    # 中间和最后一个关键点变短的情况.
+    for row, col in [(0, 0), (50, 3), (99, 5), (99, 0)]:
+        variable_keypoints = keypoints.copy()
+        variable_keypoints[row, col] = 0
+        for num_descriptors in [0, 100]:
+            parsed_msg, serialized_data = serialize_and_parse(
+                make_feature_msg(
+                    variable_keypoints, num_descriptors=num_descriptors
+                )
+            )
+            assert decode_fixed_size_keypoints(serialized_data, 100) is None
+            np.testing.assert_array_equal(
+                keypoints_from_feature_msg(parsed_msg, serialized_data),
+                keypoints_from_feature_msg(parsed_msg),
+            )
+            np.testing.assert_array_equal(
+                keypoints_from_feature_msg(parsed_msg, serialized_data),
+                variable_keypoints,
+            )
+
+    # 所有字段都为0的关键点被序列化为空消息.
+    parsed_msg, serialized_data = serialize_and_parse(
+        make_feature_msg(np.zeros((3, 6), dtype=np.float32))
+    )
+    assert decode_fixed_size_keypoints(serialized_data, 3) is None
+    np.testing.assert_array_equal(
+        keypoints_from_feature_msg(parsed_msg, serialized_data),
+        np.zeros((3, 6), dtype=np.float32),
+    )
+
+    # 没有关键点.
+    parsed_msg, serialized_data = serialize_and_parse(
+        make_feature_msg(np.zeros((0, 6), dtype=np.float32))
+    )
+    keypoints = keypoints_from_feature_msg(parsed_msg, serialized_data)
+    assert keypoints.shape == (0, 6)
+    assert keypoints.dtype == np.float32
+
+
+def test_camera_registry():
+    db = COLMAPDatabase.connect(os.path.join(mkdtemp(), "database.db"))
+    db.create_tables()
+    params = np.array([500.0, 500.0, 320.0, 240.0, 0.1, 0.01, 0.0, 0.0])
+    camera_registry = CameraRegistry(db, tolerance=1e-6)
+    camera_id = camera_registry.get_or_add(4, 640, 480, params)
+    # 参数之差不超过 tolerance 时, 无论是否跨过量化边界都是同一相机.
+    for delta in [1e-7, 5e-7, 9e-7, -9e-7]:
+        assert camera_registry.get_or_add(4, 640, 480, params + delta) == (
+            camera_id
+        )
+    assert camera_registry.get_or_add(4, 640, 480, params + 1e-3) != camera_id
+    assert camera_registry.get_or_add(4, 800, 600, params) != camera_id
+    assert db.execute("SELECT COUNT(*) FROM cameras").fetchone()[0] == 3
+
+    # 从数据库重新加载
+    assert CameraRegistry(db).find(4, 640, 480, params + 5e-7) == camera_id
+    db.close()
+
+
+def test_process_all_bin_files():
+    rng = np.random.default_rng(0)
+    tmpdir = mkdtemp()
+    protobuf_dir = os.path.join(tmpdir, "protobuf")
+    os.makedirs(protobuf_dir)
+    database_path = os.path.join(tmpdir, "database.db")
+    cam_param = np.array([500.0, 500.0, 320.0, 240.0, 0.1, 0.01, 0.0, 0.0])
+
+    keypoints = {}
+
+    def write_feature_file(name, width, height):
+        keypoints[name] = (rng.random((10, 6)) + 0.5).astype(np.float32)
+        feature_msg = make_feature_msg(keypoints[name], name)
+        feature_msg.camera.width = width
+        feature_msg.camera.height = height
+        with open(os.path.join(protobuf_dir, name + ".bin"), "wb") as fid:
+            fid.write(feature_msg.SerializeToString())
+
+    for name in ["a.jpg", "b.jpg", "c.jpg"]:
+        write_feature_file(name, 640, 480)
+    write_feature_file("d.jpg", 800, 600)
+    process_all_bin_files(protobuf_dir, cam_param, database_path, batch_size=2)
+
+    # 中断后重新运行: 跳过已有图像, 参数抖动的同尺寸图像复用已有相机.
+    write_feature_file("e.jpg", 640, 480)
+    process_all_bin_files(
+        protobuf_dir, cam_param + 1e-8, database_path, workers=1
+    )
+
+    db = COLMAPDatabase.connect(database_path)
+    camera_ids = dict(db.execute("SELECT name, camera_id FROM images"))
+    assert sorted(camera_ids) == ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"]
+    assert db.execute("SELECT COUNT(*) FROM cameras").fetchone()[0] == 2
+    for name in ["b.jpg", "c.jpg", "e.jpg"]:
+        assert camera_ids[name] == camera_ids["a.jpg"]
+    assert camera_ids["d.jpg"] != camera_ids["a.jpg"]
+    for name, image_keypoints in keypoints.items():
+        rows, cols, data = db.execute(
+            "SELECT rows, cols, keypoints.data FROM keypoints "
+            "JOIN images USING (image_id) WHERE name = ?",
+            (name,),
+        ).fetchone()
+        np.testing.assert_array_equal(
+            np.frombuffer(data, np.float32).reshape(rows, cols),
+            image_keypoints,
+        )
+    assert db.execute("SELECT COUNT(*) FROM descriptors").fetchone()[0] == 5
+    db.close()
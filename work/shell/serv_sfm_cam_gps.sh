@@ -47,7 +47,7 @@ echo "$(log_time) colmap mapper ..."
 echo "$(log_time) colmap mapper done."
 
 echo "$(log_time) processing sparse folder..."
-LARGEST_FOLDER=$(find ${PROJECT}/sparse/* -maxdepth 0 -type d -print0 | xargs -0 du -sb | sort -n -r | head -n 1 | awk '{print $2}')
+LARGEST_FOLDER=$(python3 /root/colmap_detailed/scripts/python/read_write_model.py --find_largest_model ${PROJECT}/sparse)
 if [ -z ${LARGEST_FOLDER} ]; then
     echo "$(log_time) no valid sparse folder found!"
     exit 1